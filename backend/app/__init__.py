@@ -37,6 +37,7 @@ def create_app(config_name: str = 'default') -> Flask:
     from app.routes.ai_assistant import ai_assistant_bp
     from app.routes.review import review_bp
     from app.routes.data_factory import data_factory_bp
+    from app.routes.jobs import jobs_bp
     
     app.register_blueprint(auth_bp, url_prefix='/api/auth')
     app.register_blueprint(requirement_bp, url_prefix='/api/requirements')
@@ -52,6 +53,23 @@ def create_app(config_name: str = 'default') -> Flask:
     app.register_blueprint(ai_assistant_bp, url_prefix='/api/ai-assistant')
     app.register_blueprint(review_bp, url_prefix='/api/reviews')
     app.register_blueprint(data_factory_bp, url_prefix='/api/data-factory')
+    app.register_blueprint(jobs_bp, url_prefix='/api/jobs')
+    
+    # 后台任务（需在蓝图注册之后，确保任务处理函数已注册）
+    from app.services.job_service import job_manager
+    job_manager.init_app(app)
+    
+    # LLM 调用流水后台批量写入
+    from app.services.llm_ledger import call_ledger
+    call_ledger.init_app(app)
+    
+    # 操作日志后台批量写入
+    from app.services.operation_log_writer import operation_log_writer
+    operation_log_writer.init_app(app)
+    
+    # 统计计数器定期对账
+    from app.services.stat_counters import counter_reconciler
+    counter_reconciler.init_app(app)
     
     # 健康检查路由
     @app.route('/api/health')
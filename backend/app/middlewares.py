@@ -5,10 +5,9 @@ import time
 import json
 import re
 from functools import wraps
-from flask import request, g
+from flask import request, g, current_app
 from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request
-from app import db
-from app.models import OperationLog, User
+from app.services.operation_log_writer import operation_log_writer
 
 
 def parse_user_agent(user_agent_string):
@@ -217,15 +216,12 @@ def log_operation(f):
         ua_info = parse_user_agent(log_data['user_agent'])
         log_data.update(ua_info)
         
-        # 尝试获取用户信息
+        # 尝试获取用户信息（用户名由后台写入时按批查询）
         try:
             verify_jwt_in_request(optional=True)
             user_id = get_jwt_identity()
             if user_id:
-                user = User.query.get(user_id)
-                if user:
-                    log_data['user_id'] = user.id
-                    log_data['username'] = user.username
+                log_data['user_id'] = int(user_id)
         except:
             pass
         
@@ -245,9 +241,9 @@ def log_operation(f):
         except:
             log_data['params'] = None
         
-        # 执行原函数
+        # 执行原函数（兼容 async 视图）
         try:
-            response = f(*args, **kwargs)
+            response = current_app.ensure_sync(f)(*args, **kwargs)
             
             # 记录响应信息
             if hasattr(response, 'status_code'):
@@ -275,14 +271,11 @@ def log_operation(f):
             end_time = time.time()
             log_data['response_time'] = round((end_time - start_time) * 1000, 2)  # 转换为毫秒
             
-            # 保存日志到数据库（异步或后台任务更佳）
+            # 放入日志写入队列，由后台线程批量写入数据库
             try:
-                operation_log = OperationLog(**log_data)
-                db.session.add(operation_log)
-                db.session.commit()
+                operation_log_writer.write(log_data)
             except Exception as e:
                 # 日志保存失败不应影响主流程
                 print(f"保存操作日志失败: {e}")
-                db.session.rollback()
     
     return decorated_function
@@ -0,0 +1,110 @@
+"""
+数据库版本化迁移
+
+db.create_all 只会创建缺失的表，不会给已有表补索引或字段，已有数据库的结构变更放在这里：
+- 每个迁移是本包下的 vNNNN_<说明>.py 模块，定义 VERSION、NAME 和 upgrade(ops)
+- 已执行的版本记录在 schema_migrations 表，按版本号顺序执行未执行的迁移
+- 迁移需可重复执行（对象已存在时跳过），新库由 create_all 建好后同样会登记版本
+
+用法:
+    flask --app run:app migrate-db             # 执行未执行的迁移
+    flask --app run:app migrate-db --status    # 查看迁移状态
+    flask --app run:app migrate-db --dry-run   # 只打印将执行的 DDL
+"""
+import time
+import pkgutil
+import importlib
+from datetime import datetime
+from typing import Callable, List
+
+from flask import current_app
+
+from app import db
+from app.models import SchemaMigration
+from app.migrations.operations import MigrationOps
+
+# 多个实例同时执行迁移时，只允许一个执行（MySQL 命名锁）
+MIGRATION_LOCK_NAME = 'ai_test_schema_migrations'
+
+
+def discover_migrations() -> List[object]:
+    """按版本号顺序列出本包下的迁移模块"""
+    migrations = []
+    for module_info in pkgutil.iter_modules(__path__):
+        if module_info.name.startswith('v') and module_info.name[1:5].isdigit():
+            migrations.append(importlib.import_module(f'{__name__}.{module_info.name}'))
+    migrations.sort(key=lambda module: module.VERSION)
+    
+    versions = [module.VERSION for module in migrations]
+    if len(versions) != len(set(versions)):
+        raise RuntimeError(f'迁移版本号重复: {versions}')
+    return migrations
+
+
+def applied_migrations(conn) -> dict:
+    """已执行的迁移 {版本号: 执行记录行}"""
+    table = SchemaMigration.__table__
+    table.create(bind=conn, checkfirst=True)
+    rows = conn.execute(table.select()).all()
+    conn.commit()
+    return {row.version: row for row in rows}
+
+
+def migration_status() -> List[dict]:
+    with db.engine.connect() as conn:
+        applied = applied_migrations(conn)
+    return [{
+        'version': module.VERSION,
+        'name': module.NAME,
+        'applied_at': applied[module.VERSION].applied_at.isoformat() if module.VERSION in applied else None
+    } for module in discover_migrations()]
+
+
+def run_migrations(dry_run: bool = False, echo: Callable[[str], None] = print) -> List[str]:
+    """
+    按顺序执行未执行的迁移
+    
+    Args:
+        dry_run: 只打印 DDL，不执行也不登记
+        echo: 输出执行的 DDL 和进度
+    
+    Returns:
+        本次执行的迁移版本号
+    """
+    lock_wait_timeout = current_app.config.get('MIGRATION_LOCK_WAIT_TIMEOUT', 10)
+    executed = []
+    
+    with db.engine.connect() as conn:
+        is_mysql = conn.dialect.name == 'mysql'
+        if is_mysql and not dry_run:
+            if not conn.exec_driver_sql(f"SELECT GET_LOCK('{MIGRATION_LOCK_NAME}', 60)").scalar():
+                raise RuntimeError('其他实例正在执行数据库迁移')
+        
+        try:
+            applied = applied_migrations(conn)
+            for module in discover_migrations():
+                if module.VERSION in applied:
+                    continue
+                
+                echo(f'[{module.VERSION}] {module.NAME}')
+                started = time.perf_counter()
+                ops = MigrationOps(conn, dry_run=dry_run, echo=echo, lock_wait_timeout=lock_wait_timeout)
+                module.upgrade(ops)
+                if dry_run:
+                    continue
+                
+                duration_ms = (time.perf_counter() - started) * 1000
+                conn.execute(SchemaMigration.__table__.insert().values(
+                    version=module.VERSION,
+                    name=module.NAME,
+                    duration_ms=round(duration_ms, 1),
+                    applied_at=datetime.utcnow()
+                ))
+                conn.commit()
+                executed.append(module.VERSION)
+                echo(f'[{module.VERSION}] 完成，耗时 {duration_ms:.0f}ms')
+        finally:
+            if is_mysql and not dry_run:
+                conn.exec_driver_sql(f"SELECT RELEASE_LOCK('{MIGRATION_LOCK_NAME}')")
+    
+    return executed
@@ -0,0 +1,95 @@
+"""
+迁移中使用的 DDL 操作
+
+MySQL 上的索引变更使用在线 DDL（ALGORITHM=INPLACE, LOCK=NONE），建索引期间表仍可读写；
+不支持在线执行时直接报错，而不是退化为锁表。
+执行前设置 lock_wait_timeout，拿不到元数据锁时尽快失败，避免排在长事务后面阻塞线上查询。
+"""
+from typing import Callable, List
+
+from sqlalchemy import inspect
+
+
+class MigrationOps:
+    """传给迁移 upgrade(ops) 的操作集合，所有操作都可重复执行"""
+    
+    def __init__(self, conn, dry_run: bool = False, echo: Callable[[str], None] = print, lock_wait_timeout: int = 10):
+        self.conn = conn
+        self.dry_run = dry_run
+        self.echo = echo
+        self.dialect = conn.dialect.name
+        self._quote = conn.dialect.identifier_preparer.quote
+        if self.dialect == 'mysql' and not dry_run:
+            conn.exec_driver_sql(f'SET SESSION lock_wait_timeout = {int(lock_wait_timeout)}')
+    
+    def has_table(self, table: str) -> bool:
+        return inspect(self.conn).has_table(table)
+    
+    def has_index(self, table: str, name: str) -> bool:
+        return any(index['name'] == name for index in inspect(self.conn).get_indexes(table))
+    
+    def execute(self, sql: str):
+        self.echo(f'  {sql}')
+        if not self.dry_run:
+            self.conn.exec_driver_sql(sql)
+            self.conn.commit()
+    
+    def create_table(self, table) -> bool:
+        """
+        按模型的 Table 定义建表（含索引）；表已存在时跳过
+        
+        Returns:
+            是否执行了建表
+        """
+        if self.has_table(table.name):
+            self.echo(f'  跳过 {table.name}：已存在')
+            return False
+        
+        self.echo(f'  CREATE TABLE {table.name}')
+        if not self.dry_run:
+            table.create(bind=self.conn)
+            self.conn.commit()
+        return True
+    
+    def run(self, description: str, fn: Callable[[object], None]):
+        """执行数据迁移函数 fn(conn)，随后提交"""
+        self.echo(f'  {description}')
+        if not self.dry_run:
+            fn(self.conn)
+            self.conn.commit()
+    
+    def create_index(self, table: str, name: str, columns: List[str], unique: bool = False) -> bool:
+        """
+        创建索引；表不存在（由 create_all 创建时会带上索引）或索引已存在时跳过
+        
+        Returns:
+            是否执行了建索引
+        """
+        if not self.has_table(table):
+            self.echo(f'  跳过 {name}：表 {table} 不存在')
+            return False
+        if self.has_index(table, name):
+            self.echo(f'  跳过 {name}：已存在')
+            return False
+        
+        column_list = ', '.join(self._quote(column) for column in columns)
+        kind = 'UNIQUE INDEX' if unique else 'INDEX'
+        if self.dialect == 'mysql':
+            self.execute(
+                f'ALTER TABLE {self._quote(table)} ADD {kind} {self._quote(name)} ({column_list}), '
+                f'ALGORITHM=INPLACE, LOCK=NONE'
+            )
+        else:
+            self.execute(f'CREATE {kind} {self._quote(name)} ON {self._quote(table)} ({column_list})')
+        return True
+    
+    def drop_index(self, table: str, name: str) -> bool:
+        """删除索引；索引不存在时跳过"""
+        if not self.has_table(table) or not self.has_index(table, name):
+            return False
+        
+        if self.dialect == 'mysql':
+            self.execute(f'ALTER TABLE {self._quote(table)} DROP INDEX {self._quote(name)}, ALGORITHM=INPLACE, LOCK=NONE')
+        else:
+            self.execute(f'DROP INDEX {self._quote(name)}')
+        return True
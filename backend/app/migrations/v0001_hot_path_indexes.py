@@ -0,0 +1,39 @@
+"""
+热点查询的复合索引
+
+列表接口按筛选条件 + created_at 倒序分页，统计按需求分组；
+只有 created_at 或外键单列索引时需要回表过滤并额外排序（filesort），数据量大时随页数线性变慢。
+索引与 app/models.py 中的 __table_args__ 保持一致。
+"""
+VERSION = '0001'
+NAME = '热点查询复合索引'
+
+# (表, 索引名, 列)
+INDEXES = [
+    # 用例列表：按需求/状态/类型筛选后按创建时间倒序；需求用例统计按 (需求, 状态, 类型) 分组
+    ('testcases', 'ix_testcases_requirement_created_at', ['requirement_id', 'created_at']),
+    ('testcases', 'ix_testcases_requirement_status_type', ['requirement_id', 'status', 'case_type']),
+    ('testcases', 'ix_testcases_status_created_at', ['status', 'created_at']),
+    ('testcases', 'ix_testcases_case_type_created_at', ['case_type', 'created_at']),
+    ('testcases', 'ix_testcases_created_at', ['created_at']),
+    # 评审列表：按用例/评审人/状态筛选后按创建时间倒序
+    ('testcase_reviews', 'ix_testcase_reviews_testcase_created_at', ['testcase_id', 'created_at']),
+    ('testcase_reviews', 'ix_testcase_reviews_reviewer_status_created_at', ['reviewer_id', 'status', 'created_at']),
+    ('testcase_reviews', 'ix_testcase_reviews_status_created_at', ['status', 'created_at']),
+    ('testcase_reviews', 'ix_testcase_reviews_created_at', ['created_at']),
+    ('review_comments', 'ix_review_comments_review_created_at', ['review_id', 'created_at']),
+    # AI助手：会话列表按用户筛选、置顶和更新时间排序；消息按会话读取最近消息
+    ('chat_sessions', 'ix_chat_sessions_user_pinned_updated_at', ['user_id', 'is_pinned', 'updated_at']),
+    ('chat_messages', 'ix_chat_messages_session_created_at', ['session_id', 'created_at']),
+    # 操作日志：按操作类型/模块/状态筛选后按时间倒序
+    ('operation_logs', 'ix_operation_logs_action_created_at', ['action', 'created_at']),
+    ('operation_logs', 'ix_operation_logs_module_created_at', ['module', 'created_at']),
+    ('operation_logs', 'ix_operation_logs_status_created_at', ['status', 'created_at']),
+    # 数据工厂统计：按分类和场景分组
+    ('data_factory_history', 'ix_data_factory_history_category_scenario', ['tool_category', 'tool_scenario']),
+]
+
+
+def upgrade(ops):
+    for table, name, columns in INDEXES:
+        ops.create_index(table, name, columns)
@@ -0,0 +1,14 @@
+"""
+统计计数器表
+
+仪表盘统计改为读取 stat_counters（见 app/services/stat_counters.py），
+本迁移只建表，计数由 0004 迁移按实际数据生成，之后由定期对账校正。
+"""
+from app.models import StatCounter
+
+VERSION = '0002'
+NAME = '统计计数器表'
+
+
+def upgrade(ops):
+    ops.create_table(StatCounter.__table__)
@@ -0,0 +1,18 @@
+"""
+时间序列汇总表
+
+仪表盘图表改为读取 stat_rollup_hourly / stat_rollup_daily（见 app/services/timeseries.py），
+建表后按操作日志和测试用例明细回填历史汇总。
+"""
+from app.models import StatRollupHourly, StatRollupDaily
+from app.services.timeseries import ROLLUP_MODELS, rebuild_rollups
+
+VERSION = '0003'
+NAME = '时间序列汇总表'
+
+
+def upgrade(ops):
+    ops.create_table(StatRollupHourly.__table__)
+    ops.create_table(StatRollupDaily.__table__)
+    for model in ROLLUP_MODELS:
+        ops.run(f'回填 {model.__tablename__} 汇总', lambda conn, model=model: rebuild_rollups(conn, model))
@@ -0,0 +1,15 @@
+"""
+统计计数初始值
+
+按实际数据为每个统计对象生成计数（与 reconcile-stats 相同），
+仪表盘读取计数时不再需要在请求中补做首次对账。
+"""
+from app.services.stat_counters import COUNTED_MODELS, reconcile_scope
+
+VERSION = '0004'
+NAME = '统计计数初始值'
+
+
+def upgrade(ops):
+    for model in COUNTED_MODELS:
+        ops.run(f'生成 {model.__tablename__} 统计计数', lambda conn, model=model: reconcile_scope(conn, model))
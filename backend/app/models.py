@@ -1,6 +1,7 @@
 """
 数据库模型
 """
+import json
 from datetime import datetime
 from werkzeug.security import generate_password_hash, check_password_hash
 from app import db
@@ -250,7 +251,38 @@ class Requirement(db.Model):
     # 关联测试用例
     testcases = db.relationship('TestCase', backref='requirement', lazy='dynamic', cascade='all, delete-orphan')
     
-    def to_dict(self):
+    @staticmethod
+    def testcase_stats(requirement_ids):
+        """
+        一次分组查询统计多个需求的测试用例数，并按状态、用例类型细分
+        
+        Returns:
+            {需求ID: {'total': 总数, 'by_status': {状态: 数量}, 'by_case_type': {类型: 数量}}}
+        """
+        stats = {rid: {'total': 0, 'by_status': {}, 'by_case_type': {}} for rid in requirement_ids}
+        if not stats:
+            return stats
+        rows = db.session.query(
+            TestCase.requirement_id, TestCase.status, TestCase.case_type, db.func.count(TestCase.id)
+        ).filter(
+            TestCase.requirement_id.in_(stats.keys())
+        ).group_by(
+            TestCase.requirement_id, TestCase.status, TestCase.case_type
+        ).all()
+        for requirement_id, status, case_type, count in rows:
+            item = stats[requirement_id]
+            item['total'] += count
+            item['by_status'][status] = item['by_status'].get(status, 0) + count
+            item['by_case_type'][case_type] = item['by_case_type'].get(case_type, 0) + count
+        return stats
+    
+    def to_dict(self, testcase_stats=None):
+        """
+        Args:
+            testcase_stats: 预先批量查询的用例统计（见 testcase_stats），列表序列化时传入以免逐行统计
+        """
+        if testcase_stats is None:
+            testcase_stats = Requirement.testcase_stats([self.id])[self.id]
         return {
             'id': self.id,
             'title': self.title,
@@ -260,13 +292,24 @@ class Requirement(db.Model):
             'status': self.status,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None,
-            'testcase_count': self.testcases.count()
+            'testcase_count': testcase_stats['total'],
+            'testcase_stats': {
+                'by_status': testcase_stats['by_status'],
+                'by_case_type': testcase_stats['by_case_type']
+            }
         }
 
 
 class TestCase(db.Model):
     """测试用例模型"""
     __tablename__ = 'testcases'
+    __table_args__ = (
+        db.Index('ix_testcases_requirement_created_at', 'requirement_id', 'created_at'),
+        db.Index('ix_testcases_requirement_status_type', 'requirement_id', 'status', 'case_type'),
+        db.Index('ix_testcases_status_created_at', 'status', 'created_at'),
+        db.Index('ix_testcases_case_type_created_at', 'case_type', 'created_at'),
+        db.Index('ix_testcases_created_at', 'created_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     requirement_id = db.Column(db.Integer, db.ForeignKey('requirements.id'), nullable=True, comment='关联需求ID，可为空')
@@ -281,6 +324,9 @@ class TestCase(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow, comment='创建时间')
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, comment='更新时间')
     
+    # 近似重复检测用的 MinHash 签名
+    signature = db.relationship('TestCaseSignature', backref='testcase', uselist=False, cascade='all, delete-orphan')
+    
     def to_dict(self):
         return {
             'id': self.id,
@@ -299,6 +345,15 @@ class TestCase(db.Model):
         }
 
 
+class TestCaseSignature(db.Model):
+    """测试用例 MinHash 签名（标题 + 步骤 + 预期结果）"""
+    __tablename__ = 'testcase_signatures'
+    
+    testcase_id = db.Column(db.Integer, db.ForeignKey('testcases.id', ondelete='CASCADE'), primary_key=True, comment='测试用例ID')
+    signature = db.Column(db.JSON, nullable=False, comment='MinHash 签名（整数列表）')
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, comment='创建时间')
+
+
 class Prompt(db.Model):
     """提示词模型"""
     __tablename__ = 'prompts'
@@ -341,6 +396,9 @@ class Knowledge(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow, comment='创建时间')
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, comment='更新时间')
     
+    # 检索用的内容分块，保存内容时重建
+    chunks = db.relationship('KnowledgeChunk', backref='knowledge', lazy='dynamic', cascade='all, delete-orphan')
+    
     def to_dict(self):
         return {
             'id': self.id,
@@ -355,6 +413,31 @@ class Knowledge(db.Model):
         }
 
 
+class KnowledgeChunk(db.Model):
+    """知识库内容分块（BM25 检索单元）"""
+    __tablename__ = 'knowledge_chunks'
+    __table_args__ = (
+        db.Index('ix_knowledge_chunks_knowledge_chunk_index', 'knowledge_id', 'chunk_index'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    knowledge_id = db.Column(db.Integer, db.ForeignKey('knowledges.id'), nullable=False, comment='所属知识库ID')
+    chunk_index = db.Column(db.Integer, nullable=False, comment='分块序号')
+    content = db.Column(db.Text, nullable=False, comment='分块内容')
+    term_count = db.Column(db.Integer, default=0, comment='分词后的词项数（BM25 文档长度）')
+    terms = db.Column(db.JSON, comment='词项频次 {词项: 次数}')
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, comment='创建时间')
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'knowledge_id': self.knowledge_id,
+            'chunk_index': self.chunk_index,
+            'content': self.content,
+            'term_count': self.term_count
+        }
+
+
 class LLMConfig(db.Model):
     """大模型配置模型"""
     __tablename__ = 'llm_configs'
@@ -433,6 +516,9 @@ class MCPConfig(db.Model):
 class ChatSession(db.Model):
     """AI助手会话模型"""
     __tablename__ = 'chat_sessions'
+    __table_args__ = (
+        db.Index('ix_chat_sessions_user_pinned_updated_at', 'user_id', 'is_pinned', 'updated_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, comment='所属用户ID')
@@ -450,6 +536,8 @@ class ChatSession(db.Model):
     
     # 关联消息
     messages = db.relationship('ChatMessage', backref='session', lazy='dynamic', cascade='all, delete-orphan')
+    # 早期对话的滚动摘要
+    summary = db.relationship('ChatSessionSummary', backref='session', uselist=False, cascade='all, delete-orphan')
     
     def to_dict(self):
         return {
@@ -469,6 +557,9 @@ class ChatSession(db.Model):
 class ChatMessage(db.Model):
     """AI助手消息模型"""
     __tablename__ = 'chat_messages'
+    __table_args__ = (
+        db.Index('ix_chat_messages_session_created_at', 'session_id', 'created_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     session_id = db.Column(db.Integer, db.ForeignKey('chat_sessions.id'), nullable=False, comment='所属会话ID')
@@ -490,9 +581,40 @@ class ChatMessage(db.Model):
         }
 
 
+class ChatSessionSummary(db.Model):
+    """
+    AI助手会话的滚动摘要
+    
+    较早的消息压缩为摘要代替原文发送给模型，last_message_id 及之前的消息已包含在摘要中
+    """
+    __tablename__ = 'chat_session_summaries'
+    
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    session_id = db.Column(db.Integer, db.ForeignKey('chat_sessions.id'), nullable=False, unique=True, comment='所属会话ID')
+    content = db.Column(db.Text, nullable=False, comment='摘要内容')
+    last_message_id = db.Column(db.Integer, nullable=False, default=0, comment='摘要覆盖到的最后一条消息ID')
+    message_count = db.Column(db.Integer, default=0, comment='摘要覆盖的消息数')
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, comment='更新时间')
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'session_id': self.session_id,
+            'content': self.content,
+            'last_message_id': self.last_message_id,
+            'message_count': self.message_count,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+
+
 class OperationLog(db.Model):
     """操作日志模型"""
     __tablename__ = 'operation_logs'
+    __table_args__ = (
+        db.Index('ix_operation_logs_action_created_at', 'action', 'created_at'),
+        db.Index('ix_operation_logs_module_created_at', 'module', 'created_at'),
+        db.Index('ix_operation_logs_status_created_at', 'status', 'created_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), comment='用户ID')
@@ -558,6 +680,12 @@ class OperationLog(db.Model):
 class TestcaseReview(db.Model):
     """测试用例评审模型"""
     __tablename__ = 'testcase_reviews'
+    __table_args__ = (
+        db.Index('ix_testcase_reviews_testcase_created_at', 'testcase_id', 'created_at'),
+        db.Index('ix_testcase_reviews_reviewer_status_created_at', 'reviewer_id', 'status', 'created_at'),
+        db.Index('ix_testcase_reviews_status_created_at', 'status', 'created_at'),
+        db.Index('ix_testcase_reviews_created_at', 'created_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True, autoincrement=True, comment='评审ID')
     testcase_id = db.Column(db.Integer, db.ForeignKey('testcases.id'), nullable=False, comment='测试用例ID')
@@ -608,6 +736,9 @@ class TestcaseReview(db.Model):
 class ReviewComment(db.Model):
     """评审评论模型（用于多轮评审讨论）"""
     __tablename__ = 'review_comments'
+    __table_args__ = (
+        db.Index('ix_review_comments_review_created_at', 'review_id', 'created_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True, autoincrement=True, comment='评论ID')
     review_id = db.Column(db.Integer, db.ForeignKey('testcase_reviews.id'), nullable=False, comment='评审ID')
@@ -675,6 +806,9 @@ class ReviewTemplate(db.Model):
 class DataFactoryHistory(db.Model):
     """数据工厂历史记录模型"""
     __tablename__ = 'data_factory_history'
+    __table_args__ = (
+        db.Index('ix_data_factory_history_category_scenario', 'tool_category', 'tool_scenario'),
+    )
     
     id = db.Column(db.Integer, primary_key=True, autoincrement=True, comment='历史记录ID')
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True, comment='用户ID')
@@ -721,3 +855,148 @@ class DataFactoryHistory(db.Model):
             'is_saved': self.is_saved,
             'created_at': self.created_at.isoformat() if self.created_at else None
         }
+
+
+class AIPreview(db.Model):
+    """AI生成预览模型（预览结果暂存，确认后原样入库）"""
+    __tablename__ = 'ai_previews'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    token = db.Column(db.String(64), unique=True, nullable=False, index=True, comment='预览令牌')
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True, comment='用户ID')
+    requirement_id = db.Column(db.Integer, db.ForeignKey('requirements.id'), nullable=True, comment='关联需求ID')
+    payload = db.Column(db.Text, nullable=False, comment='预览测试用例JSON')
+    expires_at = db.Column(db.DateTime, nullable=False, index=True, comment='过期时间')
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    @property
+    def is_expired(self):
+        return self.expires_at <= datetime.utcnow()
+
+
+class Job(db.Model):
+    """后台任务模型（AI生成、AI评审、文档解析等耗时操作）"""
+    __tablename__ = 'jobs'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    job_type = db.Column(db.String(50), nullable=False, comment='任务类型，如 ai.generate_testcases')
+    status = db.Column(db.String(20), default='queued', nullable=False, comment='状态: queued/running/succeeded/failed')
+    progress = db.Column(db.Integer, default=0, comment='进度 0-100')
+    params = db.Column(db.Text, comment='任务参数JSON')
+    result = db.Column(db.Text(16777215), comment='任务结果JSON')
+    error = db.Column(db.Text, comment='错误信息')
+    attempts = db.Column(db.Integer, default=0, comment='执行次数')
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True, comment='提交用户ID')
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, comment='开始执行时间')
+    finished_at = db.Column(db.DateTime, comment='结束时间')
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('ix_jobs_status_created_at', 'status', 'created_at'),
+    )
+    
+    def to_dict(self, include_result=False):
+        data = {
+            'id': self.id,
+            'job_type': self.job_type,
+            'status': self.status,
+            'progress': self.progress,
+            'error': self.error,
+            'attempts': self.attempts,
+            'user_id': self.user_id,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+        if include_result:
+            data['result'] = json.loads(self.result) if self.result else None
+        return data
+
+
+class LLMCallLog(db.Model):
+    """LLM 调用流水（每次 chat / stream_chat 调用一行，由后台线程批量写入）"""
+    __tablename__ = 'llm_call_log'
+    
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    config_id = db.Column(db.Integer, nullable=True, comment='LLMConfig ID，环境变量配置为空')
+    provider = db.Column(db.String(50), comment='服务商')
+    model = db.Column(db.String(100), comment='模型名称')
+    feature = db.Column(db.String(30), comment='调用场景: generate/review/chat/other')
+    stream = db.Column(db.Boolean, default=False, comment='是否流式调用')
+    outcome = db.Column(db.String(20), nullable=False, comment='结果: success/cached/error/timeout/rate_limited/circuit_open/cancelled')
+    prompt_tokens = db.Column(db.Integer, default=0, comment='提示词 token 数')
+    completion_tokens = db.Column(db.Integer, default=0, comment='生成 token 数')
+    total_tokens = db.Column(db.Integer, default=0, comment='总 token 数')
+    usage_estimated = db.Column(db.Boolean, default=False, comment='token 数是否为估算值（上游未返回 usage）')
+    ttfb_ms = db.Column(db.Float, comment='首字节耗时(毫秒)，流式调用为首个增量文本耗时')
+    latency_ms = db.Column(db.Float, comment='总耗时(毫秒)，含排队与重试')
+    error = db.Column(db.String(500), comment='错误信息')
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, comment='调用开始时间')
+    
+    __table_args__ = (
+        db.Index('ix_llm_call_log_config_created_at', 'config_id', 'created_at'),
+        db.Index('ix_llm_call_log_created_at', 'created_at'),
+    )
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'config_id': self.config_id,
+            'provider': self.provider,
+            'model': self.model,
+            'feature': self.feature,
+            'stream': self.stream,
+            'outcome': self.outcome,
+            'prompt_tokens': self.prompt_tokens,
+            'completion_tokens': self.completion_tokens,
+            'total_tokens': self.total_tokens,
+            'usage_estimated': self.usage_estimated,
+            'ttfb_ms': self.ttfb_ms,
+            'latency_ms': self.latency_ms,
+            'error': self.error,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+
+
+class SchemaMigration(db.Model):
+    """已执行的数据库迁移（见 app/migrations）"""
+    __tablename__ = 'schema_migrations'
+    
+    version = db.Column(db.String(20), primary_key=True, comment='迁移版本号')
+    name = db.Column(db.String(200), nullable=False, comment='迁移说明')
+    duration_ms = db.Column(db.Float, comment='执行耗时(毫秒)')
+    applied_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, comment='执行时间')
+
+
+class StatCounter(db.Model):
+    """统计计数器（由 app/services/stat_counters.py 在写入数据的同一事务内增减）"""
+    __tablename__ = 'stat_counters'
+    
+    scope = db.Column(db.String(50), primary_key=True, comment='统计对象，即数据表名')
+    dimension = db.Column(db.String(50), primary_key=True, comment='统计维度，如 total/status/action')
+    value = db.Column(db.String(100), primary_key=True, default='', comment='维度取值，无取值时为空字符串')
+    count = db.Column(db.BigInteger, nullable=False, default=0, comment='计数（评分合计等维度为累加值）')
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, comment='更新时间')
+
+
+class StatRollupHourly(db.Model):
+    """按小时汇总的新增数量（见 app/services/timeseries.py）"""
+    __tablename__ = 'stat_rollup_hourly'
+    
+    scope = db.Column(db.String(50), primary_key=True, comment='统计对象，即数据表名')
+    bucket = db.Column(db.DateTime, primary_key=True, comment='小时起点（UTC）')
+    status = db.Column(db.String(50), primary_key=True, default='', comment='状态')
+    count = db.Column(db.BigInteger, nullable=False, default=0, comment='数量')
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, comment='更新时间')
+
+
+class StatRollupDaily(db.Model):
+    """按天汇总的新增数量（见 app/services/timeseries.py）"""
+    __tablename__ = 'stat_rollup_daily'
+    
+    scope = db.Column(db.String(50), primary_key=True, comment='统计对象，即数据表名')
+    bucket = db.Column(db.Date, primary_key=True, comment='日期（UTC）')
+    status = db.Column(db.String(50), primary_key=True, default='', comment='状态')
+    count = db.Column(db.BigInteger, nullable=False, default=0, comment='数量')
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, comment='更新时间')
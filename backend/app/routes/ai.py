@@ -2,20 +2,33 @@
 AI 相关路由
 """
 import os
+import json
 import uuid
+import secrets
 import tempfile
-from flask import Blueprint, request, jsonify, current_app
+from datetime import datetime, timedelta
+from flask import Blueprint, request, jsonify, current_app, Response, stream_with_context
+from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request
 from werkzeug.utils import secure_filename
 from app import db
-from app.models import Requirement, TestCase, Prompt, Knowledge, LLMConfig
+from sqlalchemy import insert
+from app.models import Requirement, TestCase, Prompt, LLMConfig, AIPreview
 from app.services.ai_service import AIService
+from app.services.knowledge_index import retrieve_knowledge
+from app.services.testcase_dedup import DuplicateFilter
+from app.services.stat_counters import apply_rows
+from app.services.job_service import job_manager
 from app.middlewares import log_operation
+from app.routes.jobs import wants_background, job_accepted, login_required_response
 
 ai_bp = Blueprint('ai', __name__)
 
 # 支持的文档格式
 ALLOWED_EXTENSIONS = {'txt', 'doc', 'docx', 'pdf'}
 
+# 批量生成时每次写入数据库的测试用例条数
+BATCH_INSERT_CHUNK_SIZE = 500
+
 
 def ensure_string(value, separator='\n'):
     """
@@ -36,10 +49,193 @@ def ensure_string(value, separator='\n'):
     return str(value)
 
 
-def get_prompt_and_knowledge(data):
-    """获取提示词和知识库内容"""
+def testcase_fields(tc_data, requirement_id):
+    """将 AI 生成的用例数据转换为 TestCase 字段字典"""
+    # 处理 steps 和 expected_result 字段 - 如果是列表则转换为字符串
+    return {
+        'requirement_id': requirement_id,
+        'title': tc_data['title'],
+        'precondition': tc_data.get('precondition', ''),
+        'steps': ensure_string(tc_data.get('steps', '')),
+        'expected_result': ensure_string(tc_data.get('expected_result', '')),
+        'case_type': tc_data.get('case_type', 'functional'),
+        'priority': tc_data.get('priority', 'medium'),
+        'status': 'pending',
+        'is_ai_generated': True
+    }
+
+
+def build_testcase(tc_data, requirement_id):
+    """根据 AI 生成的用例数据构建 TestCase 对象"""
+    return TestCase(**testcase_fields(tc_data, requirement_id))
+
+
+def get_current_user_id():
+    """获取当前登录用户ID，未登录时返回 None"""
+    try:
+        verify_jwt_in_request(optional=True)
+        identity = get_jwt_identity()
+        return int(identity) if identity else None
+    except Exception:
+        return None
+
+
+def save_preview(testcases, requirement_id):
+    """
+    暂存预览结果，返回预览记录
+    确认保存时通过 preview_token 原样入库，无需再次调用 LLM
+    """
+    now = datetime.utcnow()
+    # 顺带清理已过期的预览
+    AIPreview.query.filter(AIPreview.expires_at < now).delete(synchronize_session=False)
+    
+    preview = AIPreview(
+        token=secrets.token_urlsafe(32),
+        user_id=get_current_user_id(),
+        requirement_id=requirement_id,
+        payload=json.dumps(testcases, ensure_ascii=False),
+        expires_at=now + timedelta(seconds=current_app.config.get('AI_PREVIEW_TTL', 1800))
+    )
+    db.session.add(preview)
+    db.session.commit()
+    return preview
+
+
+class TempRequirement:
+    """临时需求对象（直接输入需求内容时使用，不保存到数据库）"""
+    
+    def __init__(self, title, content):
+        self.id = None
+        self.title = title
+        self.content = content
+        self.module = '临时需求'
+
+
+def resolve_requirement(data):
+    """
+    根据请求参数获取需求对象
+    支持两种方式：通过ID选择需求 或 直接传入需求内容
+    
+    Returns:
+        (需求对象, None) 或 (None, (错误码, 错误信息))
+    """
+    requirement_id = data.get('requirement_id')
+    requirement_content = data.get('requirement_content')
+    if requirement_id:
+        requirement = Requirement.query.get(requirement_id)
+        if not requirement:
+            return None, (404, '需求不存在')
+        return requirement, None
+    if requirement_content:
+        return TempRequirement(data.get('requirement_title', '手动输入需求'), requirement_content), None
+    return None, (400, '请选择需求或输入需求内容')
+
+
+def get_generate_options(data):
+    """获取生成选项"""
+    return {
+        'include_boundary': data.get('include_boundary', True),
+        'include_exception': data.get('include_exception', True),
+        'include_performance': data.get('include_performance', False),
+        'count': data.get('count', 5),
+        'use_cache': data.get('use_cache', True)
+    }
+
+
+def get_ai_service(data):
+    """获取AI服务实例"""
+    llm_config_id = data.get('llm_config_id')
+    if llm_config_id:
+        return AIService.from_config_id(llm_config_id)
+    return AIService.get_default_service()
+
+
+async def generate_and_save(data, requirement, ctx=None):
+    """
+    生成并保存测试用例
+    
+    Args:
+        data: 请求参数
+        requirement: 需求对象
+        ctx: 后台任务上下文，用于上报进度
+    
+    Returns:
+        (已保存的测试用例字典列表, 近似重复的用例列表)
+    """
+    # 获取提示词和知识库
+    prompt_content, knowledge_contents = get_prompt_and_knowledge(data, requirement_query(requirement))
+    ai_service = get_ai_service(data)
+    options = get_generate_options(data)
+    dedup = DuplicateFilter(data.get('dedup', 'skip'))
+    if ctx:
+        ctx.set_progress(10)
+        # 后台任务流式生成，每条用例闭合后立即入库并上报进度，中途失败也保留已生成的用例
+        saved_testcases = []
+        async for tc_data in ai_service.astream_testcases(requirement, options, prompt_content, knowledge_contents):
+            testcase = build_testcase(tc_data, requirement.id)
+            if not dedup.check(testcase):
+                continue
+            db.session.add(testcase)
+            db.session.commit()
+            saved_testcases.append(testcase)
+            ctx.set_progress(stream_progress(len(saved_testcases), options['count']))
+        return [tc.to_dict() for tc in saved_testcases], dedup.report()
+    
+    testcases = await ai_service.agenerate_testcases(requirement, options, prompt_content, knowledge_contents)
+    
+    # 保存生成的测试用例（如果是文本输入，requirement_id 为 None），跳过与已有用例近似重复的
+    saved_testcases = dedup.filter([build_testcase(tc_data, requirement.id) for tc_data in testcases])
+    db.session.add_all(saved_testcases)
+    db.session.commit()
+    return [tc.to_dict() for tc in saved_testcases], dedup.report()
+
+
+def stream_progress(generated, expected):
+    """流式生成的进度：按已生成条数估算，在 10~95 之间"""
+    try:
+        expected = max(int(expected), 1)
+    except (TypeError, ValueError):
+        expected = 5
+    return min(10 + generated * 85 // expected, 95)
+
+
+def sse_event(payload):
+    """格式化 Server-Sent Events 数据帧"""
+    return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+
+@job_manager.handler('ai.generate_testcases')
+async def generate_testcases_job(params, ctx):
+    """后台任务：生成并保存测试用例"""
+    requirement, error = resolve_requirement(params)
+    if error:
+        raise ValueError(error[1])
+    saved_testcases, _ = await generate_and_save(params, requirement, ctx)
+    return saved_testcases
+
+
+def requirement_query(requirement):
+    """知识库检索的查询文本：需求标题和内容"""
+    return f"{requirement.title or ''}\n{requirement.content or ''}"
+
+
+def get_prompt_and_knowledge(data, query=''):
+    """
+    获取提示词和知识库内容
+    
+    知识库只注入与 query（需求内容）最相关的分块，而不是全文
+    """
+    prompt_content = get_prompt_content(data)
+    
+    # 获取知识库内容
+    knowledge_contents = retrieve_knowledge(data.get('knowledge_ids', []), query)
+    
+    return prompt_content, knowledge_contents
+
+
+def get_prompt_content(data):
+    """获取指定的提示词内容，未指定时使用默认提示词"""
     prompt_content = None
-    knowledge_contents = None
     
     # 获取提示词内容
     prompt_id = data.get('prompt_id')
@@ -59,17 +255,7 @@ def get_prompt_and_knowledge(data):
         if default_prompt:
             prompt_content = default_prompt.content
     
-    # 获取知识库内容
-    knowledge_ids = data.get('knowledge_ids', [])
-    if knowledge_ids:
-        knowledges = Knowledge.query.filter(
-            Knowledge.id.in_(knowledge_ids),
-            Knowledge.is_active == True
-        ).all()
-        if knowledges:
-            knowledge_contents = [k.content for k in knowledges]
-    
-    return prompt_content, knowledge_contents
+    return prompt_content
 
 
 def allowed_file(filename):
@@ -114,78 +300,36 @@ def parse_document_content(file_path, filename):
 
 @ai_bp.route('/generate', methods=['POST'])
 @log_operation
-def generate_testcases():
-    """根据需求生成测试用例"""
+async def generate_testcases():
+    """
+    根据需求生成测试用例
+    传入 async=true 时以后台任务执行，返回 202 和任务信息
+    dedup: 与该需求已有用例近似重复时的处理方式，skip 跳过（默认）/ flag 保存并标记 / off 不检测
+    """
     data = request.get_json()
-    requirement_id = data.get('requirement_id')
-    requirement_content = data.get('requirement_content')
-    requirement_title = data.get('requirement_title', '手动输入需求')
+    requirement, error = resolve_requirement(data)
+    if error:
+        return jsonify({'code': error[0], 'message': error[1]}), error[0]
     
-    # 支持两种方式：通过ID选择需求 或 直接传入需求内容
-    requirement = None
-    if requirement_id:
-        requirement = Requirement.query.get(requirement_id)
-        if not requirement:
-            return jsonify({'code': 404, 'message': '需求不存在'}), 404
-    elif requirement_content:
-        # 创建临时需求对象（不保存到数据库）
-        class TempRequirement:
-            def __init__(self, title, content):
-                self.id = None
-                self.title = title
-                self.content = content
-                self.module = '临时需求'
-        requirement = TempRequirement(requirement_title, requirement_content)
-    else:
-        return jsonify({'code': 400, 'message': '请选择需求或输入需求内容'}), 400
-    
-    # 获取生成选项
-    options = {
-        'include_boundary': data.get('include_boundary', True),
-        'include_exception': data.get('include_exception', True),
-        'include_performance': data.get('include_performance', False),
-        'count': data.get('count', 5)
-    }
+    if wants_background(data):
+        user_id = get_current_user_id()
+        if not user_id:
+            return login_required_response()
+        job = job_manager.submit('ai.generate_testcases', data, user_id)
+        return job_accepted(job)
     
     try:
-        # 获取提示词和知识库
-        prompt_content, knowledge_contents = get_prompt_and_knowledge(data)
-        
-        # 获取AI服务实例
-        llm_config_id = data.get('llm_config_id')
-        if llm_config_id:
-            ai_service = AIService.from_config_id(llm_config_id)
-        else:
-            ai_service = AIService.get_default_service()
-        
-        testcases = ai_service.generate_testcases(requirement, options, prompt_content, knowledge_contents)
-        
-        # 保存生成的测试用例
-        saved_testcases = []
-        for tc_data in testcases:
-            # 处理 steps 和 expected_result 字段 - 如果是列表则转换为字符串
-            steps = ensure_string(tc_data.get('steps', ''))
-            expected_result = ensure_string(tc_data.get('expected_result', ''))
-            testcase = TestCase(
-                requirement_id=requirement_id,  # 如果是文本输入，则为 None
-                title=tc_data['title'],
-                precondition=tc_data.get('precondition', ''),
-                steps=steps,
-                expected_result=expected_result,
-                case_type=tc_data.get('case_type', 'functional'),
-                priority=tc_data.get('priority', 'medium'),
-                status='pending',
-                is_ai_generated=True
-            )
-            db.session.add(testcase)
-            saved_testcases.append(testcase)
-        
-        db.session.commit()
+        saved_testcases, duplicates = await generate_and_save(data, requirement)
         
+        message = f'成功生成 {len(saved_testcases)} 条测试用例'
+        skipped = sum(1 for d in duplicates if d['skipped'])
+        if skipped:
+            message += f'，跳过 {skipped} 条重复用例'
         return jsonify({
             'code': 0,
-            'message': f'成功生成 {len(saved_testcases)} 条测试用例',
-            'data': [tc.to_dict() for tc in saved_testcases]
+            'message': message,
+            'data': saved_testcases,
+            'duplicates': duplicates
         })
     except Exception as e:
         current_app.logger.error(f'AI生成测试用例失败: {str(e)}')
@@ -194,61 +338,261 @@ def generate_testcases():
 
 @ai_bp.route('/preview', methods=['POST'])
 @log_operation
-def preview_testcases():
+async def preview_testcases():
     """预览AI生成的测试用例（不保存）"""
     data = request.get_json()
-    requirement_id = data.get('requirement_id')
-    requirement_content = data.get('requirement_content')
-    requirement_title = data.get('requirement_title', '手动输入需求')
+    requirement, error = resolve_requirement(data)
+    if error:
+        return jsonify({'code': error[0], 'message': error[1]}), error[0]
     
-    # 支持两种方式：通过ID选择需求 或 直接传入需求内容
-    requirement = None
-    if requirement_id:
-        requirement = Requirement.query.get(requirement_id)
-        if not requirement:
-            return jsonify({'code': 404, 'message': '需求不存在'}), 404
-    elif requirement_content:
-        # 创建临时需求对象（不保存到数据库）
-        class TempRequirement:
-            def __init__(self, title, content):
-                self.id = None
-                self.title = title
-                self.content = content
-                self.module = '临时需求'
-        requirement = TempRequirement(requirement_title, requirement_content)
-    else:
-        return jsonify({'code': 400, 'message': '请选择需求或输入需求内容'}), 400
-    
-    options = {
-        'include_boundary': data.get('include_boundary', True),
-        'include_exception': data.get('include_exception', True),
-        'include_performance': data.get('include_performance', False),
-        'count': data.get('count', 5)
-    }
+    options = get_generate_options(data)
     
     try:
         # 获取提示词和知识库
-        prompt_content, knowledge_contents = get_prompt_and_knowledge(data)
+        prompt_content, knowledge_contents = get_prompt_and_knowledge(data, requirement_query(requirement))
+        ai_service = get_ai_service(data)
         
-        # 获取AI服务实例
-        llm_config_id = data.get('llm_config_id')
-        if llm_config_id:
-            ai_service = AIService.from_config_id(llm_config_id)
-        else:
-            ai_service = AIService.get_default_service()
-        
-        testcases = ai_service.generate_testcases(requirement, options, prompt_content, knowledge_contents)
+        testcases = await ai_service.agenerate_testcases(requirement, options, prompt_content, knowledge_contents)
+        preview = save_preview(testcases, requirement.id)
         
         return jsonify({
             'code': 0,
             'message': 'success',
-            'data': testcases
+            'data': testcases,
+            'preview_token': preview.token,
+            'expires_at': preview.expires_at.isoformat()
         })
     except Exception as e:
         current_app.logger.error(f'AI预览测试用例失败: {str(e)}')
         return jsonify({'code': 500, 'message': f'生成失败: {str(e)}'}), 500
 
 
+@ai_bp.route('/generate-stream', methods=['POST'])
+@log_operation
+def generate_testcases_stream():
+    """
+    流式生成测试用例（Server-Sent Events）
+    
+    每条用例在模型输出中闭合后立即推送，无需等待完整响应：
+        data: {"type": "testcase", "index": 0, "data": {...}, "progress": 27}
+        data: {"type": "duplicate", "data": {...}, "duplicate_of": {"id": 1, "title": "..."}, "similarity": 0.9}
+        data: {"type": "done", "count": 5, "data": [...]}
+        data: {"type": "error", "message": "..."}
+    
+    请求参数与 /generate 相同，另支持：
+        save: 是否边生成边保存，默认 true；为 false 时结束后暂存为预览并返回 preview_token
+        dedup: 保存时近似重复用例的处理方式，同 /generate；跳过的用例以 duplicate 事件推送
+    
+    模型输出中途中断或被截断时，已推送（已保存）的用例保留
+    """
+    data = request.get_json()
+    requirement, error = resolve_requirement(data)
+    if error:
+        return jsonify({'code': error[0], 'message': error[1]}), error[0]
+    
+    save = data.get('save', True)
+    dedup = DuplicateFilter(data.get('dedup', 'skip'))
+    options = get_generate_options(data)
+    prompt_content, knowledge_contents = get_prompt_and_knowledge(data, requirement_query(requirement))
+    ai_service = get_ai_service(data)
+    
+    @stream_with_context
+    def generate():
+        testcases = []
+        try:
+            for tc_data in ai_service.stream_testcases(requirement, options, prompt_content, knowledge_contents):
+                if save:
+                    testcase = build_testcase(tc_data, requirement.id)
+                    if not dedup.check(testcase):
+                        duplicate = dedup.report()[-1]
+                        yield sse_event({
+                            'type': 'duplicate',
+                            'data': tc_data,
+                            'duplicate_of': duplicate['duplicate_of'],
+                            'similarity': duplicate['similarity']
+                        })
+                        continue
+                    db.session.add(testcase)
+                    db.session.commit()
+                    tc_data = testcase.to_dict()
+                testcases.append(tc_data)
+                yield sse_event({
+                    'type': 'testcase',
+                    'index': len(testcases) - 1,
+                    'data': tc_data,
+                    'progress': stream_progress(len(testcases), options['count'])
+                })
+            
+            done = {'type': 'done', 'count': len(testcases), 'data': testcases, 'duplicates': dedup.report()}
+            if not save:
+                preview = save_preview(testcases, requirement.id)
+                done['preview_token'] = preview.token
+                done['expires_at'] = preview.expires_at.isoformat()
+            yield sse_event(done)
+        except Exception as e:
+            db.session.rollback()
+            current_app.logger.error(f'AI流式生成测试用例失败: {str(e)}')
+            yield sse_event({'type': 'error', 'message': f'生成失败: {str(e)}', 'count': len(testcases)})
+    
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'  # 禁用 nginx 缓冲，保证用例及时到达
+    })
+
+
+@ai_bp.route('/commit', methods=['POST'])
+@log_operation
+def commit_preview():
+    """
+    保存预览的测试用例
+    
+    请求参数:
+        preview_token: 预览接口返回的令牌
+        indices: 可选，要保存的用例下标列表，默认保存全部
+        dedup: 近似重复用例的处理方式，同 /generate
+    """
+    data = request.get_json() or {}
+    token = data.get('preview_token')
+    if not token:
+        return jsonify({'code': 400, 'message': '缺少 preview_token'}), 400
+    
+    preview = AIPreview.query.filter_by(token=token).first()
+    if not preview:
+        return jsonify({'code': 404, 'message': '预览不存在或已保存'}), 404
+    
+    user_id = get_current_user_id()
+    # 有归属用户的预览只能由该用户保存，未登录同样拒绝
+    if preview.user_id and preview.user_id != user_id:
+        return jsonify({'code': 403, 'message': '无权保存该预览'}), 403
+    
+    if preview.is_expired:
+        db.session.delete(preview)
+        db.session.commit()
+        return jsonify({'code': 410, 'message': '预览已过期，请重新生成'}), 410
+    
+    testcases = json.loads(preview.payload)
+    indices = data.get('indices')
+    if indices is not None:
+        if not isinstance(indices, list) or not all(isinstance(i, int) and 0 <= i < len(testcases) for i in indices):
+            return jsonify({'code': 400, 'message': 'indices 参数无效'}), 400
+        testcases = [testcases[i] for i in dict.fromkeys(indices)]
+    
+    if not testcases:
+        return jsonify({'code': 400, 'message': '测试用例列表不能为空'}), 400
+    
+    try:
+        dedup = DuplicateFilter(data.get('dedup', 'skip'))
+        saved_testcases = dedup.filter([build_testcase(tc_data, preview.requirement_id) for tc_data in testcases])
+        db.session.add_all(saved_testcases)
+        # 预览令牌只能使用一次
+        db.session.delete(preview)
+        db.session.commit()
+        
+        message = f'成功保存 {len(saved_testcases)} 条测试用例'
+        if dedup.skipped:
+            message += f'，跳过 {dedup.skipped} 条重复用例'
+        return jsonify({
+            'code': 0,
+            'message': message,
+            'data': [tc.to_dict() for tc in saved_testcases],
+            'duplicates': dedup.report()
+        })
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f'保存预览测试用例失败: {str(e)}')
+        return jsonify({'code': 500, 'message': f'保存失败: {str(e)}'}), 500
+
+
+@ai_bp.route('/generate-batch', methods=['POST'])
+@log_operation
+async def generate_testcases_batch():
+    """
+    为多个需求批量生成并保存测试用例
+    
+    请求参数:
+        requirement_ids: 需求ID列表
+        其余参数同 /generate（生成选项、prompt_id、knowledge_ids、llm_config_id）
+    
+    并发数由所选大模型配置的 extra_params.max_concurrency 控制，
+    每个需求单独返回成功或失败信息。
+    """
+    data = request.get_json() or {}
+    requirement_ids = data.get('requirement_ids') or []
+    if not isinstance(requirement_ids, list) or not requirement_ids:
+        return jsonify({'code': 400, 'message': '请选择需求'}), 400
+    # 统一转为整数后去重并保持顺序，与按 req.id 建立的映射一致
+    try:
+        requirement_ids = list(dict.fromkeys(int(requirement_id) for requirement_id in requirement_ids))
+    except (TypeError, ValueError):
+        return jsonify({'code': 400, 'message': '需求ID无效'}), 400
+    
+    options = get_generate_options(data)
+    
+    requirements = Requirement.query.filter(Requirement.id.in_(requirement_ids)).all()
+    requirement_map = {req.id: req for req in requirements}
+    
+    try:
+        # 获取提示词；知识库按每个需求分别检索最相关的分块
+        prompt_content = get_prompt_content(data)
+        knowledge_ids = data.get('knowledge_ids', [])
+        knowledge_map = {req.id: retrieve_knowledge(knowledge_ids, requirement_query(req)) for req in requirements}
+        ai_service = get_ai_service(data)
+        
+        generated = await ai_service.agenerate_batch(requirements, options, prompt_content, knowledge_map)
+        generated_map = {item['requirement'].id: item for item in generated}
+        
+        # 分批写入数据库，跳过与已有用例近似重复的（签名在下次检测时补算）
+        dedup = DuplicateFilter(data.get('dedup', 'skip'))
+        rows = []
+        for item in generated:
+            try:
+                item_rows = [testcase_fields(tc_data, item['requirement'].id) for tc_data in item['testcases']]
+            except (KeyError, TypeError, AttributeError):
+                item['testcases'], item['error'] = [], 'AI 返回的测试用例格式无效'
+                continue
+            item_rows = [fields for fields in item_rows if dedup.check(TestCase(**fields))]
+            item['duplicates'] = len(item['testcases']) - len(item_rows)
+            item['testcases'] = item_rows
+            rows.extend(item_rows)
+        for start in range(0, len(rows), BATCH_INSERT_CHUNK_SIZE):
+            db.session.execute(insert(TestCase), rows[start:start + BATCH_INSERT_CHUNK_SIZE])
+            apply_rows(TestCase, rows[start:start + BATCH_INSERT_CHUNK_SIZE])
+            db.session.commit()
+        
+        results = []
+        for requirement_id in requirement_ids:
+            item = generated_map.get(requirement_id)
+            if item is None:
+                results.append({'requirement_id': requirement_id, 'success': False, 'count': 0, 'error': '需求不存在'})
+                continue
+            results.append({
+                'requirement_id': requirement_id,
+                'title': requirement_map[requirement_id].title,
+                'success': item['error'] is None,
+                'count': len(item['testcases']),
+                'duplicates': item.get('duplicates', 0),
+                'error': item['error']
+            })
+        succeeded = sum(1 for r in results if r['success'])
+        
+        return jsonify({
+            'code': 0,
+            'message': f'成功为 {succeeded}/{len(results)} 个需求生成 {len(rows)} 条测试用例',
+            'data': {
+                'total': len(results),
+                'succeeded': succeeded,
+                'failed': len(results) - succeeded,
+                'testcase_count': len(rows),
+                'duplicate_count': dedup.skipped,
+                'results': results
+            }
+        })
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f'AI批量生成测试用例失败: {str(e)}')
+        return jsonify({'code': 500, 'message': f'批量生成失败: {str(e)}'}), 500
+
+
 @ai_bp.route('/parse-document', methods=['POST'])
 @log_operation
 def parse_document():
@@ -263,6 +607,11 @@ def parse_document():
     if not allowed_file(file.filename):
         return jsonify({'code': 400, 'message': '不支持的文件格式，请上传 .txt, .doc, .docx, .pdf 格式的文件'}), 400
     
+    background = wants_background(request.form)
+    user_id = get_current_user_id() if background else None
+    if background and not user_id:
+        return login_required_response()
+    
     try:
         # 保存到临时文件，使用原始文件名的扩展名
         original_filename = file.filename
@@ -273,13 +622,14 @@ def parse_document():
         temp_path = os.path.join(temp_dir, safe_filename)
         file.save(temp_path)
         
-        # 解析文档内容，使用原始文件名的扩展名
-        content = parse_document_content(temp_path, original_filename)
-        
-        # 删除临时文件
-        if os.path.exists(temp_path):
-            os.remove(temp_path)
+        if background:
+            job = job_manager.submit('ai.parse_document', {
+                'path': temp_path,
+                'filename': original_filename
+            }, user_id)
+            return job_accepted(job)
         
+        content = parse_uploaded_document(temp_path, original_filename)
         if not content:
             return jsonify({'code': 400, 'message': '文档内容为空或无法解析'}), 400
         
@@ -294,3 +644,25 @@ def parse_document():
     except Exception as e:
         current_app.logger.error(f'文档解析失败: {str(e)}')
         return jsonify({'code': 500, 'message': f'文档解析失败: {str(e)}'}), 500
+
+
+def parse_uploaded_document(temp_path, filename):
+    """解析上传后保存的临时文件，解析完成后删除临时文件"""
+    try:
+        # 解析文档内容，使用原始文件名的扩展名
+        return parse_document_content(temp_path, filename)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+@job_manager.handler('ai.parse_document')
+def parse_document_job(params, ctx):
+    """后台任务：解析上传的文档"""
+    content = parse_uploaded_document(params['path'], params['filename'])
+    if not content:
+        raise ValueError('文档内容为空或无法解析')
+    return {
+        'content': content,
+        'filename': params['filename']
+    }
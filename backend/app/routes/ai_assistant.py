@@ -1,13 +1,21 @@
 """
 AI助手路由
 """
-from flask import Blueprint, request, jsonify
+import json
+from flask import Blueprint, request, jsonify, Response, stream_with_context, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from datetime import datetime
+from sqlalchemy import or_, and_
 from app import db
-from app.models import User, Prompt, Knowledge, LLMConfig, MCPConfig, ChatSession, ChatMessage
+from app.models import User, Prompt, Knowledge, LLMConfig, MCPConfig, ChatSession, ChatMessage, Job
 from app.services.ai_service import AIService
+from app.services.chat_memory import build_history_messages, summarize_session
+from app.services.job_service import job_manager
+from app.services.knowledge_index import retrieve_knowledge
 from app.services.llm_clients import ChatMessage as LLMChatMessage
+from app.services.llm_governor import estimate_tokens
+from app.services.prompt_budget import count_tokens
+from app.services.llm_ledger import llm_feature
 from app.middlewares import log_operation
 
 ai_assistant_bp = Blueprint('ai_assistant', __name__)
@@ -130,21 +138,180 @@ def delete_session(session_id):
 @jwt_required()
 @log_operation
 def get_messages(session_id):
-    """获取会话的消息列表"""
+    """
+    获取会话的消息列表（游标分页，从最新消息向前翻页）
+    
+    查询参数:
+        limit: 每页条数，默认 50，最大 200
+        before: 游标，返回该消息之前的消息；不传时返回最新一页
+    
+    返回的 list 按时间正序排列，has_more 为 true 时以 next_cursor 作为 before 继续加载更早的消息
+    """
     current_user_id = get_jwt_identity()
     session = ChatSession.query.filter_by(id=session_id, user_id=current_user_id).first()
     
     if not session:
         return make_response(404, '会话不存在')
     
-    messages = ChatMessage.query.filter_by(session_id=session_id).order_by(ChatMessage.created_at.asc()).all()
-    return make_response(0, 'success', [m.to_dict() for m in messages])
+    limit = min(max(request.args.get('limit', 50, type=int), 1), 200)
+    before = request.args.get('before', type=int)
+    
+    query = ChatMessage.query.filter(ChatMessage.session_id == session_id)
+    if before:
+        cursor = ChatMessage.query.filter_by(id=before, session_id=session_id).first()
+        if not cursor:
+            return make_response(400, '无效的游标')
+        # 按 (created_at, id) 定位，走 (session_id, created_at) 索引
+        query = query.filter(or_(
+            ChatMessage.created_at < cursor.created_at,
+            and_(ChatMessage.created_at == cursor.created_at, ChatMessage.id < cursor.id)
+        ))
+    
+    messages = query.order_by(
+        ChatMessage.created_at.desc(),
+        ChatMessage.id.desc()
+    ).limit(limit + 1).all()
+    has_more = len(messages) > limit
+    messages = messages[:limit]
+    messages.reverse()
+    
+    return make_response(0, 'success', {
+        'list': [m.to_dict() for m in messages],
+        'has_more': has_more,
+        'next_cursor': messages[0].id if has_more else None
+    })
+
+
+def _save_user_message(session, user_content):
+    """保存用户消息并刷新会话时间，失败时返回错误信息"""
+    user_msg = ChatMessage(
+        session_id=session.id,
+        role='user',
+        content=user_content
+    )
+    db.session.add(user_msg)
+    
+    try:
+        session.updated_at = datetime.utcnow()
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return f'保存消息失败: {str(e)}'
+    return None
+
+
+def _build_llm_messages(session, options):
+    """
+    根据会话配置构建发送给大模型的消息列表（系统提示词 + 知识库 + 历史摘要 + 最近历史）
+    
+    Returns:
+        (消息列表, 是否需要压缩历史摘要)
+    """
+    prompt_id = options.get('prompt_id') or session.prompt_id
+    knowledge_ids = options.get('knowledge_ids') or session.knowledge_ids or []
+    
+    # 获取系统提示词
+    system_prompt = ""
+    if prompt_id:
+        prompt = Prompt.query.get(prompt_id)
+        if prompt:
+            system_prompt = prompt.content
+    
+    llm_messages = []
+    
+    if system_prompt:
+        # 提示词在会话内不变，标记为可缓存前缀
+        llm_messages.append(LLMChatMessage(role="system", content=system_prompt, cache=True))
+    
+    # 历史摘要 + 摘要之后的最近消息（含当前这条）
+    history, needs_summary = build_history_messages(session)
+    
+    # 知识库只注入与用户当前问题相关的分块，随问题变化，放在可缓存前缀之后
+    query = next((m.content for m in reversed(history) if m.role == 'user'), '')
+    knowledge_contents = retrieve_knowledge(knowledge_ids, query)
+    if knowledge_contents:
+        llm_messages.append(LLMChatMessage(
+            role="system",
+            content="参考知识库内容：\n" + "\n\n".join(knowledge_contents)
+        ))
+    
+    llm_messages.extend(history)
+    
+    return llm_messages, needs_summary
+
+
+def _get_ai_service(session, options):
+    """获取会话使用的AI服务实例"""
+    model_id = options.get('model_id') or session.model_id
+    
+    ai_service = None
+    if model_id:
+        config = LLMConfig.query.get(model_id)
+        if config:
+            ai_service = AIService(config)
+    
+    if not ai_service:
+        ai_service = AIService.get_default_service()
+    
+    return ai_service
+
+
+def _save_assistant_message(session, content, ai_service, tokens_used=0):
+    """保存AI回复并刷新会话时间"""
+    assistant_msg = ChatMessage(
+        session_id=session.id,
+        role='assistant',
+        content=content,
+        model=ai_service.model if ai_service else 'unknown',
+        tokens_used=tokens_used
+    )
+    db.session.add(assistant_msg)
+    
+    # 更新会话时间
+    session.updated_at = datetime.utcnow()
+    db.session.commit()
+    return assistant_msg
+
+
+def _schedule_summary(session, options, user_id):
+    """提交压缩历史摘要的后台任务，同一会话已有排队或执行中的任务时跳过"""
+    params = {'session_id': session.id, 'model_id': options.get('model_id') or session.model_id}
+    try:
+        exists = Job.query.filter(
+            Job.job_type == 'ai_assistant.summarize',
+            Job.status.in_(['queued', 'running']),
+            Job.params == json.dumps(params, ensure_ascii=False)
+        ).first()
+        if not exists:
+            job_manager.submit('ai_assistant.summarize', params, user_id)
+    except Exception as e:
+        # 摘要失败只影响后续对话的上下文长度，不影响本次回复
+        db.session.rollback()
+        current_app.logger.error(f'提交会话摘要任务失败 (session_id={session.id}): {str(e)}')
+
+
+@job_manager.handler('ai_assistant.summarize')
+def summarize_session_job(params, ctx):
+    """后台任务：把会话较早的消息压缩进滚动摘要"""
+    session = ChatSession.query.get(params['session_id'])
+    if not session:
+        raise ValueError('会话不存在')
+    ai_service = _get_ai_service(session, {'model_id': params.get('model_id')})
+    if not ai_service or not ai_service.client:
+        raise ValueError('未配置AI服务')
+    summary = summarize_session(session, ai_service)
+    return summary.to_dict() if summary else None
+
+
+def _sse_event(payload):
+    """格式化 Server-Sent Events 数据帧"""
+    return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
 
 
 @ai_assistant_bp.route('/sessions/<int:session_id>/messages', methods=['POST'])
 @jwt_required()
 @log_operation
-def send_message(session_id):
+async def send_message(session_id):
     """发送消息并获取AI回复"""
     current_user_id = get_jwt_identity()
     session = ChatSession.query.filter_by(id=session_id, user_id=current_user_id).first()
@@ -159,86 +326,36 @@ def send_message(session_id):
         return make_response(400, '消息内容不能为空')
     
     # 1. 保存用户消息
-    user_msg = ChatMessage(
-        session_id=session_id,
-        role='user',
-        content=user_content
-    )
-    db.session.add(user_msg)
-    
-    # 先提交一次，确保用户消息已保存
-    try:
-        session.updated_at = datetime.utcnow()
-        db.session.commit()
-    except Exception as e:
-        db.session.rollback()
-        return make_response(500, f'保存消息失败: {str(e)}')
+    error = _save_user_message(session, user_content)
+    if error:
+        return make_response(500, error)
     
     # 2. 调用AI服务
     try:
-        # 准备配置
         options = data.get('options', {})
-        model_id = options.get('model_id') or session.model_id
-        prompt_id = options.get('prompt_id') or session.prompt_id
-        knowledge_ids = options.get('knowledge_ids') or session.knowledge_ids or []
-        
-        # 获取系统提示词
-        system_prompt = ""
-        if prompt_id:
-            prompt = Prompt.query.get(prompt_id)
-            if prompt:
-                system_prompt = prompt.content
-        
-        # 获取知识库上下文
-        if knowledge_ids:
-            knowledges = Knowledge.query.filter(Knowledge.id.in_(knowledge_ids)).all()
-            if knowledges:
-                knowledge_context = "\n\n参考知识库内容：\n" + "\n\n".join([k.content for k in knowledges])
-                system_prompt += knowledge_context
-        
-        # 构建历史记录
-        history = ChatMessage.query.filter_by(session_id=session_id).order_by(ChatMessage.created_at.asc()).all()
-        llm_messages = []
-        
-        if system_prompt:
-            llm_messages.append(LLMChatMessage(role="system", content=system_prompt))
-            
-        for m in history[-11:]:  # 取最近10条+当前这条
-            llm_messages.append(LLMChatMessage(role=m.role, content=m.content))
-            
-        # 初始化AI服务
-        ai_service = None
-        if model_id:
-            config = LLMConfig.query.get(model_id)
-            if config:
-                ai_service = AIService(config)
-        
-        if not ai_service:
-            ai_service = AIService.get_default_service()
+        llm_messages, needs_summary = _build_llm_messages(session, options)
+        ai_service = _get_ai_service(session, options)
             
-        # 发送请求
+        # 发送请求（异步客户端，等待期间不阻塞事件循环）
         ai_response_content = ""
-        if ai_service:
-            try:
-                response = ai_service.client.chat(messages=llm_messages)
-                ai_response_content = response.content
-            except Exception as e:
-                ai_response_content = f"AI助手调用出错: {str(e)}"
+        tokens_used = 0
+        async_client = ai_service.create_async_client() if ai_service else None
+        if async_client:
+            async with async_client:
+                try:
+                    response = await ai_service.achat(async_client, llm_messages, feature='chat')
+                    ai_response_content = response.content
+                    if response.usage and not response.cached:
+                        tokens_used = response.usage.get('total_tokens') or 0
+                except Exception as e:
+                    ai_response_content = f"AI助手调用出错: {str(e)}"
         else:
             ai_response_content = "未配置AI服务，请在设置中选择模型。"
             
         # 3. 保存AI回复
-        assistant_msg = ChatMessage(
-            session_id=session_id,
-            role='assistant',
-            content=ai_response_content,
-            model=ai_service.model if ai_service else 'unknown'
-        )
-        db.session.add(assistant_msg)
-        
-        # 更新会话时间
-        session.updated_at = datetime.utcnow()
-        db.session.commit()
+        assistant_msg = _save_assistant_message(session, ai_response_content, ai_service, tokens_used)
+        if needs_summary:
+            _schedule_summary(session, options, current_user_id)
         
         return make_response(0, '发送成功', assistant_msg.to_dict())
         
@@ -248,6 +365,73 @@ def send_message(session_id):
         return make_response(500, f'处理AI回复失败: {str(e)}')
 
 
+@ai_assistant_bp.route('/sessions/<int:session_id>/messages/stream', methods=['POST'])
+@jwt_required()
+@log_operation
+def send_message_stream(session_id):
+    """
+    发送消息并以 Server-Sent Events 流式返回AI回复
+    
+    事件格式（data 为 JSON）：
+    - {"type": "delta", "content": "..."}: 增量文本
+    - {"type": "done", "data": {...}}: 完整的助手消息（已保存）
+    - {"type": "error", "message": "..."}: 调用出错
+    """
+    current_user_id = get_jwt_identity()
+    session = ChatSession.query.filter_by(id=session_id, user_id=current_user_id).first()
+    
+    if not session:
+        return make_response(404, '会话不存在')
+    
+    data = request.get_json()
+    user_content = data.get('content', '').strip()
+    
+    if not user_content:
+        return make_response(400, '消息内容不能为空')
+    
+    error = _save_user_message(session, user_content)
+    if error:
+        return make_response(500, error)
+    
+    options = data.get('options', {})
+    llm_messages, needs_summary = _build_llm_messages(session, options)
+    ai_service = _get_ai_service(session, options)
+    
+    @stream_with_context
+    def generate():
+        parts = []
+        tokens_used = 0
+        if ai_service and ai_service.client:
+            try:
+                with llm_feature('chat'):
+                    for delta in ai_service.client.stream_chat(messages=llm_messages):
+                        parts.append(delta)
+                        yield _sse_event({'type': 'delta', 'content': delta})
+                # 流式响应不返回 usage，按文本估算
+                tokens_used = estimate_tokens(llm_messages, 0) + count_tokens(''.join(parts))
+            except Exception as e:
+                parts.append(f"\n\nAI助手调用出错: {str(e)}")
+                yield _sse_event({'type': 'error', 'message': f'AI助手调用出错: {str(e)}'})
+        else:
+            parts.append("未配置AI服务，请在设置中选择模型。")
+            yield _sse_event({'type': 'delta', 'content': parts[-1]})
+        
+        # 流结束后一次性保存完整的助手消息
+        try:
+            assistant_msg = _save_assistant_message(session, ''.join(parts), ai_service, tokens_used)
+            yield _sse_event({'type': 'done', 'data': assistant_msg.to_dict()})
+            if needs_summary:
+                _schedule_summary(session, options, current_user_id)
+        except Exception as e:
+            db.session.rollback()
+            yield _sse_event({'type': 'error', 'message': f'保存AI回复失败: {str(e)}'})
+    
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'  # 禁用 nginx 缓冲，保证首个 token 及时到达
+    })
+
+
 @ai_assistant_bp.route('/sessions/<int:session_id>/messages/<int:message_id>', methods=['DELETE'])
 @jwt_required()
 @log_operation
@@ -257,9 +257,24 @@ def get_history():
         from app.models import DataFactoryHistory
         from app import db
         
+        from app.services.pagination import cursor_requested, total_requested, cursor_paginate
+        
         page = int(request.args.get('page', 1))
         page_size = int(request.args.get('page_size', 10))
         
+        # 游标分页：深页与第一页代价相同，总数按需统计
+        if cursor_requested():
+            try:
+                result = cursor_paginate(DataFactoryHistory.query, DataFactoryHistory, request.args['cursor'], page_size, total_requested())
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            return jsonify({
+                'results': [record.to_dict() for record in result.items],
+                'next_cursor': result.next_cursor,
+                'has_more': result.has_more,
+                'count': result.total
+            }), 200
+        
         # 从数据库获取历史记录
         query = DataFactoryHistory.query.order_by(DataFactoryHistory.created_at.desc())
         pagination = query.paginate(page=page, per_page=page_size, error_out=False)
@@ -286,29 +301,16 @@ def get_statistics():
     """
     try:
         from app.models import DataFactoryHistory
-        from app import db
-        from sqlalchemy import func
-        
-        # 获取总记录数
-        total_records = DataFactoryHistory.query.count()
-        
-        # 获取分类统计
-        category_stats = db.session.query(
-            DataFactoryHistory.tool_category,
-            func.count(DataFactoryHistory.id)
-        ).group_by(DataFactoryHistory.tool_category).all()
+        from app.services.stat_counters import get_counters
         
-        # 获取场景统计
-        scenario_stats = db.session.query(
-            DataFactoryHistory.tool_scenario,
-            func.count(DataFactoryHistory.id)
-        ).group_by(DataFactoryHistory.tool_scenario).all()
+        # 读取统计计数器（总数、分类统计、场景统计）
+        counters = get_counters(DataFactoryHistory)
         
         # 构建统计数据
         statistics = {
-            'total_records': total_records,
-            'category_stats': dict(category_stats),
-            'scenario_stats': dict(scenario_stats)
+            'total_records': counters.get('total', {}).get('', 0),
+            'category_stats': {k: v for k, v in counters.get('tool_category', {}).items() if v > 0},
+            'scenario_stats': {k: v for k, v in counters.get('tool_scenario', {}).items() if v > 0}
         }
         
         return jsonify(statistics), 200
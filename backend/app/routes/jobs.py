@@ -0,0 +1,99 @@
+"""
+后台任务路由
+"""
+from flask import Blueprint, request, jsonify
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from app.models import Job
+
+jobs_bp = Blueprint('jobs', __name__)
+
+
+def make_response(code=0, message='success', data=None):
+    """统一响应格式"""
+    return jsonify({
+        'code': code,
+        'message': message,
+        'data': data
+    })
+
+
+def wants_background(data=None):
+    """请求是否要求以后台任务方式执行（?async=1 或请求体/表单中 async: true）"""
+    value = request.args.get('async')
+    if value is None and data:
+        value = data.get('async')
+    return str(value).lower() in ('1', 'true')
+
+
+def login_required_response():
+    """未登录时不能提交后台任务（任务结果只对提交人可见）"""
+    return make_response(401, '后台执行需要登录'), 401
+
+
+def job_accepted(job):
+    """任务已提交的响应（HTTP 202）"""
+    return make_response(0, '任务已提交', job.to_dict()), 202
+
+
+def _get_user_job(job_id):
+    """获取当前用户可见的任务，没有归属用户的任务对任何人都不可见"""
+    current_user_id = get_jwt_identity()
+    job = Job.query.get(job_id)
+    if not job or job.user_id is None or str(job.user_id) != str(current_user_id):
+        return None
+    return job
+
+
+@jobs_bp.route('', methods=['GET'])
+@jwt_required()
+def get_jobs():
+    """获取当前用户的任务列表"""
+    current_user_id = get_jwt_identity()
+    page = request.args.get('page', 1, type=int)
+    per_page = request.args.get('per_page', 20, type=int)
+    status = request.args.get('status', '')
+    job_type = request.args.get('job_type', '')
+    
+    query = Job.query.filter(Job.user_id == current_user_id)
+    if status:
+        query = query.filter(Job.status == status)
+    if job_type:
+        query = query.filter(Job.job_type == job_type)
+    
+    pagination = query.order_by(Job.created_at.desc()).paginate(
+        page=page, per_page=per_page, error_out=False
+    )
+    
+    return make_response(data={
+        'items': [job.to_dict() for job in pagination.items],
+        'total': pagination.total,
+        'page': page,
+        'per_page': per_page
+    })
+
+
+@jobs_bp.route('/<int:job_id>', methods=['GET'])
+@jwt_required()
+def get_job(job_id):
+    """获取任务状态和进度"""
+    job = _get_user_job(job_id)
+    if not job:
+        return make_response(404, '任务不存在'), 404
+    
+    return make_response(data=job.to_dict())
+
+
+@jobs_bp.route('/<int:job_id>/result', methods=['GET'])
+@jwt_required()
+def get_job_result(job_id):
+    """获取任务结果，任务未完成时返回 409"""
+    job = _get_user_job(job_id)
+    if not job:
+        return make_response(404, '任务不存在'), 404
+    
+    if job.status == 'failed':
+        return make_response(500, f'任务执行失败: {job.error}', job.to_dict()), 500
+    if job.status != 'succeeded':
+        return make_response(409, '任务尚未完成', job.to_dict()), 409
+    
+    return make_response(data=job.to_dict(include_result=True))
@@ -8,6 +8,7 @@ from openpyxl import Workbook, load_workbook
 from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
 from app import db
 from app.models import Knowledge
+from app.services.knowledge_index import index_knowledge
 from app.middlewares import log_operation
 
 knowledge_bp = Blueprint('knowledge', __name__)
@@ -271,6 +272,7 @@ def import_knowledges():
         created_count = 0
         updated_count = 0
         errors = []
+        reindex = []  # 内容有变化、需要重建检索分块的知识库
         
         # 从第3行开始读取数据（跳过标题行和说明行）
         for row_num, row in enumerate(ws.iter_rows(min_row=3, values_only=True), 3):
@@ -299,6 +301,8 @@ def import_knowledges():
             existing = Knowledge.query.filter(Knowledge.name == str(name)).first()
             if existing:
                 # 更新现有记录
+                if existing.content != str(content):
+                    reindex.append(existing)
                 existing.content = str(content)
                 existing.description = str(description) if description else ''
                 existing.category = category_val
@@ -316,8 +320,13 @@ def import_knowledges():
                     is_active=is_active_val
                 )
                 db.session.add(knowledge)
+                reindex.append(knowledge)
                 created_count += 1
         
+        # 重建导入内容的检索分块
+        db.session.flush()
+        for knowledge in reindex:
+            index_knowledge(knowledge)
         db.session.commit()
         
         result = {
@@ -374,6 +383,8 @@ def create_knowledge():
     )
     
     db.session.add(knowledge)
+    db.session.flush()
+    index_knowledge(knowledge)
     db.session.commit()
     
     return jsonify({
@@ -392,8 +403,9 @@ def update_knowledge(knowledge_id):
     
     if 'name' in data:
         knowledge.name = data['name']
-    if 'content' in data:
+    if 'content' in data and data['content'] != knowledge.content:
         knowledge.content = data['content']
+        index_knowledge(knowledge)
     if 'description' in data:
         knowledge.description = data['description']
     if 'category' in data:
@@ -1,10 +1,17 @@
 """
 大模型配置路由
 """
+import math
+from datetime import datetime, timedelta
 from flask import Blueprint, request, jsonify, current_app
+from sqlalchemy import func
 from app import db
-from app.models import LLMConfig
+from app.models import LLMConfig, LLMCallLog
 from app.middlewares import log_operation
+from app.services.llm_clients import client_registry
+from app.services.llm_cache import response_cache
+from app.services.llm_governor import llm_governor
+from app.services.llm_resilience import circuit_breakers
 
 try:
     from openai import OpenAI
@@ -135,6 +142,50 @@ def get_providers():
     })
 
 
+@llm_config_bp.route('/cache/stats', methods=['GET'])
+@log_operation
+def get_cache_stats():
+    """获取 LLM 响应缓存命中统计"""
+    return jsonify({
+        'code': 0,
+        'message': 'success',
+        'data': response_cache.stats()
+    })
+
+
+@llm_config_bp.route('/governor/stats', methods=['GET'])
+@log_operation
+def get_governor_stats():
+    """获取各服务商/配置的限流排队指标（队列深度、等待时间、拒绝次数）"""
+    return jsonify({
+        'code': 0,
+        'message': 'success',
+        'data': llm_governor.stats()
+    })
+
+
+@llm_config_bp.route('/circuit-breakers', methods=['GET'])
+@log_operation
+def get_circuit_breakers():
+    """获取各配置的熔断器状态"""
+    return jsonify({
+        'code': 0,
+        'message': 'success',
+        'data': circuit_breakers.stats()
+    })
+
+
+@llm_config_bp.route('/cache', methods=['DELETE'])
+@log_operation
+def clear_cache():
+    """清空 LLM 响应缓存"""
+    response_cache.clear()
+    return jsonify({
+        'code': 0,
+        'message': '缓存已清空'
+    })
+
+
 @llm_config_bp.route('/<int:id>', methods=['GET'])
 @log_operation
 def get_llm_config(id):
@@ -147,6 +198,168 @@ def get_llm_config(id):
     })
 
 
+def _percentile(values, p):
+    """最近秩法计算百分位数，values 需已排序"""
+    if not values:
+        return None
+    index = max(0, math.ceil(p / 100.0 * len(values)) - 1)
+    return round(values[index], 2)
+
+
+def _usage_filters(config_id):
+    """解析用量查询参数（days 默认 7，最多 90；feature 可选），返回过滤条件与起始时间"""
+    days = min(max(request.args.get('days', 7, type=int), 1), 90)
+    since = datetime.utcnow() - timedelta(days=days)
+    filters = [LLMCallLog.config_id == config_id, LLMCallLog.created_at >= since]
+    feature = request.args.get('feature')
+    if feature:
+        filters.append(LLMCallLog.feature == feature)
+    return filters, days, since
+
+
+def _latency_stats(rows):
+    """根据 (latency_ms, ttfb_ms) 列表计算 p50/p95"""
+    latencies = sorted(r[0] for r in rows if r[0] is not None)
+    ttfbs = sorted(r[1] for r in rows if r[1] is not None)
+    return {
+        'latency_p50_ms': _percentile(latencies, 50),
+        'latency_p95_ms': _percentile(latencies, 95),
+        'ttfb_p50_ms': _percentile(ttfbs, 50),
+        'ttfb_p95_ms': _percentile(ttfbs, 95)
+    }
+
+
+@llm_config_bp.route('/<int:id>/usage', methods=['GET'])
+@log_operation
+def get_llm_config_usage(id):
+    """
+    获取配置的调用用量汇总
+    
+    查询参数: days（统计天数，默认 7）、feature（generate/review/chat）
+    延迟百分位只统计实际请求上游且成功的调用，token 合计不含缓存命中
+    """
+    LLMConfig.query.get_or_404(id)
+    filters, days, since = _usage_filters(id)
+    
+    by_outcome = dict(
+        db.session.query(LLMCallLog.outcome, func.count(LLMCallLog.id))
+        .filter(*filters)
+        .group_by(LLMCallLog.outcome)
+        .all()
+    )
+    by_feature = [
+        {
+            'feature': feature,
+            'calls': calls,
+            'prompt_tokens': int(prompt_tokens or 0),
+            'completion_tokens': int(completion_tokens or 0),
+            'total_tokens': int(total_tokens or 0)
+        }
+        for feature, calls, prompt_tokens, completion_tokens, total_tokens in (
+            db.session.query(
+                LLMCallLog.feature,
+                func.count(LLMCallLog.id),
+                func.sum(LLMCallLog.prompt_tokens),
+                func.sum(LLMCallLog.completion_tokens),
+                func.sum(LLMCallLog.total_tokens)
+            )
+            .filter(*filters)
+            .group_by(LLMCallLog.feature)
+            .all()
+        )
+    ]
+    latency_rows = (
+        db.session.query(LLMCallLog.latency_ms, LLMCallLog.ttfb_ms)
+        .filter(*filters, LLMCallLog.outcome == 'success')
+        .all()
+    )
+    
+    calls = sum(by_outcome.values())
+    # 客户端主动中断的流式调用不计为失败
+    failed = calls - sum(by_outcome.get(k, 0) for k in ('success', 'cached', 'cancelled'))
+    summary = {
+        'calls': calls,
+        'success': by_outcome.get('success', 0),
+        'cached': by_outcome.get('cached', 0),
+        'failed': failed,
+        'error_rate': round(failed / calls, 4) if calls else 0.0,
+        'prompt_tokens': sum(f['prompt_tokens'] for f in by_feature),
+        'completion_tokens': sum(f['completion_tokens'] for f in by_feature),
+        'total_tokens': sum(f['total_tokens'] for f in by_feature)
+    }
+    summary.update(_latency_stats(latency_rows))
+    
+    return jsonify({
+        'code': 0,
+        'message': 'success',
+        'data': {
+            'config_id': id,
+            'days': days,
+            'since': since.isoformat(),
+            'summary': summary,
+            'by_outcome': by_outcome,
+            'by_feature': by_feature
+        }
+    })
+
+
+@llm_config_bp.route('/<int:id>/usage/daily', methods=['GET'])
+@log_operation
+def get_llm_config_daily_usage(id):
+    """
+    获取配置按天的调用量、token 用量与延迟百分位
+    
+    查询参数同 /<id>/usage，无调用的日期不返回
+    """
+    LLMConfig.query.get_or_404(id)
+    filters, days, since = _usage_filters(id)
+    
+    day = func.date(LLMCallLog.created_at)
+    daily = {}
+    for date, calls, prompt_tokens, completion_tokens, total_tokens in (
+        db.session.query(
+            day,
+            func.count(LLMCallLog.id),
+            func.sum(LLMCallLog.prompt_tokens),
+            func.sum(LLMCallLog.completion_tokens),
+            func.sum(LLMCallLog.total_tokens)
+        )
+        .filter(*filters)
+        .group_by(day)
+        .all()
+    ):
+        daily[str(date)] = {
+            'date': str(date),
+            'calls': calls,
+            'prompt_tokens': int(prompt_tokens or 0),
+            'completion_tokens': int(completion_tokens or 0),
+            'total_tokens': int(total_tokens or 0)
+        }
+    
+    # 百分位无法在 MySQL 中直接聚合，按天分组后在内存中计算
+    latencies = {}
+    for created_at, latency_ms, ttfb_ms in (
+        db.session.query(LLMCallLog.created_at, LLMCallLog.latency_ms, LLMCallLog.ttfb_ms)
+        .filter(*filters, LLMCallLog.outcome == 'success')
+        .all()
+    ):
+        latencies.setdefault(created_at.date().isoformat(), []).append((latency_ms, ttfb_ms))
+    
+    for date, item in daily.items():
+        item.update(_latency_stats(latencies.get(date, [])))
+    
+    return jsonify({
+        'code': 0,
+        'message': 'success',
+        'data': {
+            'config_id': id,
+            'days': days,
+            'since': since.isoformat(),
+            'daily': [daily[date] for date in sorted(daily)]
+        }
+    })
+
+
 @llm_config_bp.route('', methods=['POST'])
 @log_operation
 def create_llm_config():
@@ -226,6 +439,8 @@ def update_llm_config(id):
         config.is_default = data['is_default']
     
     db.session.commit()
+    # 配置变更后淘汰旧客户端，下次调用时按新配置重建
+    client_registry.evict(id)
     
     return jsonify({
         'code': 0,
@@ -241,6 +456,7 @@ def delete_llm_config(id):
     config = LLMConfig.query.get_or_404(id)
     db.session.delete(config)
     db.session.commit()
+    client_registry.evict(id)
     
     return jsonify({
         'code': 0,
@@ -7,9 +7,11 @@ from datetime import datetime
 from sqlalchemy import or_, and_
 import io
 import csv
-from app import db
 from app.models import User, OperationLog
 from app.middlewares import log_operation
+from app.services.pagination import cursor_requested, total_requested, cursor_paginate
+from app.services.stat_counters import get_counters
+from app.services.timeseries import RANGES, get_timeseries
 
 logs_bp = Blueprint('logs', __name__)
 
@@ -79,6 +81,20 @@ def get_logs():
         except:
             pass
     
+    # 游标分页：深页与第一页代价相同，总数按需统计
+    if cursor_requested():
+        try:
+            result = cursor_paginate(query, OperationLog, request.args['cursor'], page_size, total_requested())
+        except ValueError as e:
+            return make_response(400, str(e))
+        return make_response(0, 'success', {
+            'list': [log.to_dict() for log in result.items],
+            'next_cursor': result.next_cursor,
+            'has_more': result.has_more,
+            'total': result.total,
+            'pageSize': page_size
+        })
+    
     # 按时间倒序排列
     query = query.order_by(OperationLog.created_at.desc())
     
@@ -214,31 +230,28 @@ def export_logs():
 @logs_bp.route('/statistics', methods=['GET'])
 @jwt_required()
 def get_statistics():
-    """获取日志统计信息"""
-    from sqlalchemy import func
+    """获取日志统计信息（读取统计计数器）"""
+    counters = get_counters(OperationLog)
+    by_status = counters.get('status', {})
     
     # 统计总数
-    total = OperationLog.query.count()
+    total = counters.get('total', {}).get('', 0)
     
-    # 统计今日日志数
-    today_start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
-    today_count = OperationLog.query.filter(OperationLog.created_at >= today_start).count()
+    # 统计今日日志数（按日计数以 UTC 的 created_at 日期为键）
+    today_count = counters.get('day', {}).get(datetime.utcnow().date().isoformat(), 0)
     
     # 统计成功/失败数
-    success_count = OperationLog.query.filter(OperationLog.status == 'success').count()
-    fail_count = OperationLog.query.filter(OperationLog.status.in_(['fail', 'error'])).count()
+    success_count = by_status.get('success', 0)
+    fail_count = by_status.get('fail', 0) + by_status.get('error', 0)
     
     # 按操作类型统计
-    action_stats = db.session.query(
-        OperationLog.action,
-        func.count(OperationLog.id).label('count')
-    ).group_by(OperationLog.action).all()
+    action_stats = [(a, c) for a, c in counters.get('action', {}).items() if c > 0]
     
     # 按模块统计
-    module_stats = db.session.query(
-        OperationLog.module,
-        func.count(OperationLog.id).label('count')
-    ).group_by(OperationLog.module).order_by(func.count(OperationLog.id).desc()).limit(10).all()
+    module_stats = sorted(
+        ((m, c) for m, c in counters.get('module', {}).items() if c > 0),
+        key=lambda item: -item[1]
+    )[:10]
     
     return make_response(0, 'success', {
         'total': total,
@@ -248,3 +261,18 @@ def get_statistics():
         'action_stats': [{'action': a, 'count': c} for a, c in action_stats],
         'module_stats': [{'module': m, 'count': c} for m, c in module_stats]
     })
+
+
+@logs_bp.route('/timeseries', methods=['GET'])
+@jwt_required()
+def get_timeseries_stats():
+    """
+    按时间桶统计日志数量（读取小时/天汇总，用于仪表盘图表）
+    
+    range: day（最近24小时）/week（最近7天）/month（本月每天）/quarter（今年各季度）/year（历年）
+    """
+    range_name = request.args.get('range', 'month')
+    if range_name not in RANGES:
+        return make_response(400, f"range 只能是 {'/'.join(RANGES)}")
+    
+    return make_response(0, 'success', get_timeseries(OperationLog, range_name))
@@ -3,6 +3,7 @@
 """
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
+from sqlalchemy.orm import selectinload
 from app import db
 from app.models import Role, Permission, Menu, User
 from app.middlewares import log_operation
@@ -47,7 +48,8 @@ def get_roles():
     name = request.args.get('name', '')
     status = request.args.get('status', type=int)
     
-    query = Role.query
+    # 权限和菜单各用一条 IN 查询批量加载
+    query = Role.query.options(selectinload(Role.permissions), selectinload(Role.menus))
     
     if name:
         query = query.filter(Role.name.like(f'%{name}%'))
@@ -71,7 +73,9 @@ def get_roles():
 @log_operation
 def get_all_roles():
     """获取所有启用的角色"""
-    roles = Role.query.filter(Role.status == 1).order_by(Role.sort.asc()).all()
+    roles = Role.query.options(
+        selectinload(Role.permissions), selectinload(Role.menus)
+    ).filter(Role.status == 1).order_by(Role.sort.asc()).all()
     return make_response(0, 'success', [role.to_dict() for role in roles])
 
 
@@ -37,12 +37,14 @@ def get_requirements():
     
     query = query.order_by(Requirement.created_at.desc())
     pagination = query.paginate(page=page, per_page=per_page, error_out=False)
+    # 本页需求的用例统计用一条分组查询取得
+    stats = Requirement.testcase_stats([item.id for item in pagination.items])
     
     return jsonify({
         'code': 0,
         'message': 'success',
         'data': {
-            'list': [item.to_dict() for item in pagination.items],
+            'list': [item.to_dict(stats[item.id]) for item in pagination.items],
             'total': pagination.total,
             'page': page,
             'per_page': per_page
@@ -1,18 +1,41 @@
 """
 测试用例评审路由
 """
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
+from sqlalchemy.orm import joinedload
 from datetime import datetime
 from app import db
-from app.models import TestCase, User, TestcaseReview, ReviewComment, ReviewTemplate, Prompt, Knowledge, LLMConfig
+from app.models import TestCase, User, TestcaseReview, ReviewComment, ReviewTemplate, Prompt, LLMConfig
 from app.services.ai_review_service import AIReviewServiceFactory
+from app.services.knowledge_index import retrieve_knowledge
+from app.services.job_service import job_manager
+from app.services.pagination import cursor_requested, total_requested, cursor_paginate
+from app.services.stat_counters import get_counters
 from app.middlewares import log_operation
+from app.routes.jobs import wants_background, job_accepted
 import json
 
 review_bp = Blueprint('review', __name__)
 
 
+def with_review_relations(query):
+    """联表带出评审列表序列化所需的用例标题和评审人，避免逐行查询"""
+    return query.options(
+        joinedload(TestcaseReview.testcase).load_only(TestCase.title),
+        joinedload(TestcaseReview.reviewer).load_only(User.username)
+    )
+
+
+def load_reviews(review_ids):
+    """按ID一次查出评审记录（带用例标题和评审人），保持传入顺序"""
+    reviews = {
+        review.id: review
+        for review in with_review_relations(TestcaseReview.query).filter(TestcaseReview.id.in_(review_ids))
+    }
+    return [reviews[review_id] for review_id in review_ids if review_id in reviews]
+
+
 def make_response(code=0, message='success', data=None):
     """统一响应格式"""
     return jsonify({
@@ -37,7 +60,7 @@ def get_reviews():
     status = request.args.get('status', '')
     keyword = request.args.get('keyword', '')
     
-    query = TestcaseReview.query
+    query = with_review_relations(TestcaseReview.query)
     
     if testcase_id:
         query = query.filter(TestcaseReview.testcase_id == testcase_id)
@@ -48,6 +71,19 @@ def get_reviews():
     if keyword:
         query = query.join(TestCase).filter(TestCase.title.contains(keyword))
     
+    if cursor_requested():
+        try:
+            result = cursor_paginate(query, TestcaseReview, request.args['cursor'], per_page, total_requested())
+        except ValueError as e:
+            return make_response(400, str(e))
+        return make_response(0, 'success', {
+            'list': [item.to_dict() for item in result.items],
+            'next_cursor': result.next_cursor,
+            'has_more': result.has_more,
+            'total': result.total,
+            'per_page': per_page
+        })
+    
     query = query.order_by(TestcaseReview.created_at.desc())
     pagination = query.paginate(page=page, per_page=per_page, error_out=False)
     
@@ -73,7 +109,7 @@ def get_review(review_id):
 @log_operation
 def get_testcase_reviews(testcase_id):
     """获取测试用例的所有评审"""
-    reviews = TestcaseReview.query.filter_by(testcase_id=testcase_id).order_by(
+    reviews = with_review_relations(TestcaseReview.query).filter_by(testcase_id=testcase_id).order_by(
         TestcaseReview.created_at.desc()
     ).all()
     
@@ -198,33 +234,37 @@ def batch_create_reviews():
     if not testcase_ids:
         return make_response(400, '测试用例ID列表不能为空')
     
+    # 一次查出存在的用例和已有待评审记录的用例
+    existing_testcase_ids = {
+        testcase_id for (testcase_id,) in db.session.query(TestCase.id).filter(TestCase.id.in_(testcase_ids))
+    }
+    pending_testcase_ids = {
+        testcase_id for (testcase_id,) in db.session.query(TestcaseReview.testcase_id).filter(
+            TestcaseReview.testcase_id.in_(testcase_ids),
+            TestcaseReview.reviewer_id == current_user_id,
+            TestcaseReview.status == 'pending'
+        )
+    }
+    
     created_reviews = []
-    for testcase_id in testcase_ids:
-        testcase = TestCase.query.get(testcase_id)
-        if not testcase:
+    for testcase_id in dict.fromkeys(testcase_ids):
+        if testcase_id not in existing_testcase_ids or testcase_id in pending_testcase_ids:
             continue
-        
-        # 检查是否已有待评审的记录
-        existing_review = TestcaseReview.query.filter_by(
+        review = TestcaseReview(
             testcase_id=testcase_id,
             reviewer_id=current_user_id,
             status='pending'
-        ).first()
-        
-        if not existing_review:
-            review = TestcaseReview(
-                testcase_id=testcase_id,
-                reviewer_id=current_user_id,
-                status='pending'
-            )
-            db.session.add(review)
-            created_reviews.append(review)
+        )
+        db.session.add(review)
+        created_reviews.append(review)
     
+    db.session.flush()
+    review_ids = [r.id for r in created_reviews]
     db.session.commit()
     
-    return make_response(0, f'成功创建 {len(created_reviews)} 条评审记录', {
-        'count': len(created_reviews),
-        'list': [r.to_dict() for r in created_reviews]
+    return make_response(0, f'成功创建 {len(review_ids)} 条评审记录', {
+        'count': len(review_ids),
+        'list': [r.to_dict() for r in load_reviews(review_ids)]
     })
 
 
@@ -236,7 +276,9 @@ def batch_create_reviews():
 def get_comments(review_id):
     """获取评审的评论列表"""
     review = TestcaseReview.query.get_or_404(review_id)
-    comments = ReviewComment.query.filter_by(review_id=review_id).order_by(
+    comments = ReviewComment.query.options(
+        joinedload(ReviewComment.user).load_only(User.username)
+    ).filter_by(review_id=review_id).order_by(
         ReviewComment.created_at.asc()
     ).all()
     
@@ -379,17 +421,18 @@ def delete_template(template_id):
 @jwt_required()
 @log_operation
 def get_stats():
-    """获取评审统计"""
-    total = TestcaseReview.query.count()
-    pending = TestcaseReview.query.filter_by(status='pending').count()
-    approved = TestcaseReview.query.filter_by(status='approved').count()
-    rejected = TestcaseReview.query.filter_by(status='rejected').count()
-    need_revision = TestcaseReview.query.filter_by(status='need_revision').count()
-    
-    # 计算平均评分
-    avg_rating = db.session.query(
-        db.func.avg(TestcaseReview.overall_rating)
-    ).filter(TestcaseReview.overall_rating.isnot(None)).scalar()
+    """获取评审统计（读取统计计数器）"""
+    counters = get_counters(TestcaseReview)
+    by_status = counters.get('status', {})
+    total = counters.get('total', {}).get('', 0)
+    pending = by_status.get('pending', 0)
+    approved = by_status.get('approved', 0)
+    rejected = by_status.get('rejected', 0)
+    need_revision = by_status.get('need_revision', 0)
+    
+    # 平均评分 = 评分合计 / 已评分数
+    rating_count = counters.get('rating_count', {}).get('', 0)
+    avg_rating = counters.get('rating_sum', {}).get('', 0) / rating_count if rating_count else 0
     
     return make_response(0, 'success', {
         'total': total,
@@ -404,29 +447,27 @@ def get_stats():
 
 # ========== AI评审接口 ==========
 
-@review_bp.route('/ai-review', methods=['POST'])
-@jwt_required()
-@log_operation
-def ai_review():
-    """AI自动评审测试用例"""
-    current_user_id = get_jwt_identity()
-    data = request.get_json()
+async def perform_ai_review(data, reviewer_id, ctx=None):
+    """
+    执行AI评审并保存评审结果
     
-    testcase_ids = data.get('testcase_ids', [])
-    if not testcase_ids:
-        return make_response(400, '请选择要评审的测试用例')
+    Args:
+        data: 请求参数（testcase_ids、prompt_id、knowledge_ids、llm_config_id 等）
+        reviewer_id: 评审人ID
+        ctx: 后台任务上下文，用于上报进度
     
-    # 获取测试用例
-    testcases = TestCase.query.filter(TestCase.id.in_(testcase_ids)).all()
+    Returns:
+        评审结果数据
+    """
+    testcases = TestCase.query.filter(TestCase.id.in_(data.get('testcase_ids', []))).all()
     if not testcases:
-        return make_response(404, '未找到测试用例')
+        raise ValueError('未找到测试用例')
     
     # 转换为字典格式
     testcase_list = [tc.to_dict() for tc in testcases]
     
     # 获取提示词和知识库
     prompt_content = None
-    knowledge_contents = None
     
     # 获取提示词内容
     prompt_id = data.get('prompt_id')
@@ -446,15 +487,11 @@ def ai_review():
         if default_prompt:
             prompt_content = default_prompt.content
     
-    # 获取知识库内容
-    knowledge_ids = data.get('knowledge_ids', [])
-    if knowledge_ids:
-        knowledges = Knowledge.query.filter(
-            Knowledge.id.in_(knowledge_ids),
-            Knowledge.is_active == True
-        ).all()
-        if knowledges:
-            knowledge_contents = [k.content for k in knowledges]
+    # 获取知识库中与被评审用例相关的内容
+    knowledge_contents = retrieve_knowledge(
+        data.get('knowledge_ids', []),
+        '\n'.join(tc['title'] or '' for tc in testcase_list)
+    )
     
     # 获取AI服务实例
     llm_config_id = data.get('llm_config_id')
@@ -467,64 +504,133 @@ def ai_review():
     options = {
         'review_dimensions': data.get('review_dimensions', ['clarity', 'completeness', 'feasibility', 'coverage']),
         'scoring_criteria': data.get('scoring_criteria', {}),
-        'count': len(testcase_list)
+        'count': len(testcase_list),
+        'use_cache': data.get('use_cache', True)
     }
     
-    try:
-        # 调用AI评审
-        reviews = ai_service.review_testcases(testcase_list, options, prompt_content, knowledge_contents)
+    if ctx:
+        ctx.set_progress(10)
+    
+    # 分块并发评审，每完成一块立即批量保存；未得到评审结果的用例不保存，单独返回
+    saved_review_ids = []
+    failed = []
+    reviewed = 0
+    async for batch in ai_service.aiter_reviews(testcase_list, options, prompt_content, knowledge_contents):
+        saved_review_ids.extend(save_ai_reviews(batch.reviews, reviewer_id))
+        failed.extend(batch.failed)
+        reviewed += len(batch.reviews) + len(batch.failed)
+        if ctx:
+            ctx.set_progress(10 + reviewed * 85 // len(testcase_list))
+    
+    return {
+        'count': len(saved_review_ids),
+        'reviews': [r.to_dict() for r in load_reviews(saved_review_ids)],
+        'failed_count': len(failed),
+        'failed': failed
+    }
+
+
+def save_ai_reviews(reviews, reviewer_id):
+    """
+    批量保存一块AI评审结果：更新该用户待处理的评审，其余新建，一次查询、一次提交
+    
+    Returns:
+        保存的评审记录ID列表
+    """
+    testcase_ids = [r.get('testcase_id') for r in reviews if r.get('testcase_id')]
+    if not testcase_ids:
+        return []
+    
+    # 一次查出该用户已有的待处理评审记录
+    existing_reviews = {
+        review.testcase_id: review
+        for review in TestcaseReview.query.filter(
+            TestcaseReview.testcase_id.in_(testcase_ids),
+            TestcaseReview.reviewer_id == reviewer_id,
+            TestcaseReview.status == 'pending'
+        )
+    }
+    
+    saved_reviews = []
+    for review_data in reviews:
+        testcase_id = review_data.get('testcase_id')
+        if not testcase_id:
+            continue
         
-        # 保存评审结果
-        saved_reviews = []
-        for review_data in reviews:
-            # 查找对应的测试用例ID
-            testcase_id = review_data.get('testcase_id')
-            if not testcase_id:
-                continue
-            
-            # 检查是否已有该用户的评审记录
-            existing_review = TestcaseReview.query.filter_by(
+        existing_review = existing_reviews.get(testcase_id)
+        if existing_review:
+            # 更新现有评审
+            existing_review.status = review_data.get('status', 'approved')
+            existing_review.overall_rating = review_data.get('overall_rating', 3)
+            existing_review.comments = review_data.get('comments', '')
+            existing_review.improvement_suggestions = review_data.get('improvement_suggestions', '')
+            existing_review.clarity_score = review_data.get('clarity_score', 3)
+            existing_review.completeness_score = review_data.get('completeness_score', 3)
+            existing_review.feasibility_score = review_data.get('feasibility_score', 3)
+            existing_review.coverage_score = review_data.get('coverage_score', 3)
+            existing_review.reviewed_at = datetime.utcnow()
+            saved_reviews.append(existing_review)
+        else:
+            # 创建新评审
+            review = TestcaseReview(
                 testcase_id=testcase_id,
-                reviewer_id=current_user_id,
-                status='pending'
-            ).first()
-            
-            if existing_review:
-                # 更新现有评审
-                existing_review.status = review_data.get('status', 'approved')
-                existing_review.overall_rating = review_data.get('overall_rating', 3)
-                existing_review.comments = review_data.get('comments', '')
-                existing_review.improvement_suggestions = review_data.get('improvement_suggestions', '')
-                existing_review.clarity_score = review_data.get('clarity_score', 3)
-                existing_review.completeness_score = review_data.get('completeness_score', 3)
-                existing_review.feasibility_score = review_data.get('feasibility_score', 3)
-                existing_review.coverage_score = review_data.get('coverage_score', 3)
-                existing_review.reviewed_at = datetime.utcnow()
-                saved_reviews.append(existing_review)
-            else:
-                # 创建新评审
-                review = TestcaseReview(
-                    testcase_id=testcase_id,
-                    reviewer_id=current_user_id,
-                    status=review_data.get('status', 'approved'),
-                    overall_rating=review_data.get('overall_rating', 3),
-                    comments=review_data.get('comments', ''),
-                    improvement_suggestions=review_data.get('improvement_suggestions', ''),
-                    clarity_score=review_data.get('clarity_score', 3),
-                    completeness_score=review_data.get('completeness_score', 3),
-                    feasibility_score=review_data.get('feasibility_score', 3),
-                    coverage_score=review_data.get('coverage_score', 3),
-                    reviewed_at=datetime.utcnow()
-                )
-                db.session.add(review)
-                saved_reviews.append(review)
-        
-        db.session.commit()
-        
-        return make_response(0, f'AI评审完成，共评审 {len(saved_reviews)} 条用例', {
-            'count': len(saved_reviews),
-            'reviews': [r.to_dict() for r in saved_reviews]
-        })
+                reviewer_id=reviewer_id,
+                status=review_data.get('status', 'approved'),
+                overall_rating=review_data.get('overall_rating', 3),
+                comments=review_data.get('comments', ''),
+                improvement_suggestions=review_data.get('improvement_suggestions', ''),
+                clarity_score=review_data.get('clarity_score', 3),
+                completeness_score=review_data.get('completeness_score', 3),
+                feasibility_score=review_data.get('feasibility_score', 3),
+                coverage_score=review_data.get('coverage_score', 3),
+                reviewed_at=datetime.utcnow()
+            )
+            saved_reviews.append(review)
+    
+    db.session.add_all(saved_reviews)
+    db.session.flush()
+    review_ids = [review.id for review in saved_reviews]
+    db.session.commit()
+    return review_ids
+
+
+@job_manager.handler('review.ai_review')
+async def ai_review_job(params, ctx):
+    """后台任务：AI评审测试用例"""
+    return await perform_ai_review(params['data'], params['reviewer_id'], ctx)
+
+
+@review_bp.route('/ai-review', methods=['POST'])
+@jwt_required()
+@log_operation
+async def ai_review():
+    """
+    AI自动评审测试用例
+    传入 async=true 时以后台任务执行，返回 202 和任务信息
+    """
+    current_user_id = get_jwt_identity()
+    data = request.get_json()
+    
+    testcase_ids = data.get('testcase_ids', [])
+    if not testcase_ids:
+        return make_response(400, '请选择要评审的测试用例')
+    
+    if not TestCase.query.filter(TestCase.id.in_(testcase_ids)).first():
+        return make_response(404, '未找到测试用例')
+    
+    if wants_background(data):
+        job = job_manager.submit('review.ai_review', {
+            'data': data,
+            'reviewer_id': current_user_id
+        }, current_user_id)
+        return job_accepted(job)
+    
+    try:
+        result = await perform_ai_review(data, current_user_id)
+        message = f'AI评审完成，共评审 {result["count"]} 条用例'
+        if result['failed_count']:
+            message += f'，{result["failed_count"]} 条用例评审失败未保存'
+        return make_response(0, message, result)
         
     except Exception as e:
         current_app.logger.error(f'AI评审失败: {str(e)}')
@@ -534,8 +640,8 @@ def ai_review():
 @review_bp.route('/ai-review-preview', methods=['POST'])
 @jwt_required()
 @log_operation
-def ai_review_preview():
-    """AI评审预览（不保存）"""
+async def ai_review_preview():
+    """AI评审预览（不保存），各块并发评审"""
     data = request.get_json()
     
     testcase_ids = data.get('testcase_ids', [])
@@ -552,7 +658,6 @@ def ai_review_preview():
     
     # 获取提示词和知识库
     prompt_content = None
-    knowledge_contents = None
     
     # 获取提示词内容
     prompt_id = data.get('prompt_id')
@@ -571,15 +676,11 @@ def ai_review_preview():
         if default_prompt:
             prompt_content = default_prompt.content
     
-    # 获取知识库内容
-    knowledge_ids = data.get('knowledge_ids', [])
-    if knowledge_ids:
-        knowledges = Knowledge.query.filter(
-            Knowledge.id.in_(knowledge_ids),
-            Knowledge.is_active == True
-        ).all()
-        if knowledges:
-            knowledge_contents = [k.content for k in knowledges]
+    # 获取知识库中与被评审用例相关的内容
+    knowledge_contents = retrieve_knowledge(
+        data.get('knowledge_ids', []),
+        '\n'.join(tc['title'] or '' for tc in testcase_list)
+    )
     
     # 获取AI服务实例
     llm_config_id = data.get('llm_config_id')
@@ -592,15 +693,17 @@ def ai_review_preview():
     options = {
         'review_dimensions': data.get('review_dimensions', ['clarity', 'completeness', 'feasibility', 'coverage']),
         'scoring_criteria': data.get('scoring_criteria', {}),
-        'count': len(testcase_list)
+        'count': len(testcase_list),
+        'use_cache': data.get('use_cache', True)
     }
     
     try:
         # 调用AI评审
-        reviews = ai_service.review_testcases(testcase_list, options, prompt_content, knowledge_contents)
+        batch = await ai_service.areview_testcases(testcase_list, options, prompt_content, knowledge_contents)
         
         return make_response(0, 'AI评审预览成功', {
-            'reviews': reviews
+            'reviews': batch.reviews,
+            'failed': batch.failed
         })
         
     except Exception as e:
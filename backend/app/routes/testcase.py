@@ -5,10 +5,15 @@ import io
 from datetime import datetime
 from flask import Blueprint, request, jsonify, send_file
 from flask_jwt_extended import jwt_required
+from sqlalchemy.orm import joinedload
 from openpyxl import Workbook, load_workbook
 from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
 from app import db
 from app.models import TestCase, Requirement
+from app.services.testcase_dedup import DuplicateFilter, refresh_signature, find_duplicate_clusters
+from app.services.pagination import cursor_requested, total_requested, cursor_paginate
+from app.services.stat_counters import get_counters
+from app.services.timeseries import RANGES, get_timeseries
 from app.middlewares import log_operation
 
 testcase_bp = Blueprint('testcase', __name__)
@@ -47,7 +52,8 @@ def get_testcases():
     status = request.args.get('status', '')
     is_ai_generated = request.args.get('is_ai_generated', '')
     
-    query = TestCase.query
+    # 一次联表带出需求标题，避免逐行查询需求
+    query = TestCase.query.options(joinedload(TestCase.requirement).load_only(Requirement.title))
     
     if keyword:
         query = query.filter(
@@ -65,6 +71,23 @@ def get_testcases():
     if is_ai_generated:
         query = query.filter(TestCase.is_ai_generated == (is_ai_generated == 'true'))
     
+    if cursor_requested():
+        try:
+            result = cursor_paginate(query, TestCase, request.args['cursor'], per_page, total_requested())
+        except ValueError as e:
+            return jsonify({'code': 400, 'message': str(e)}), 400
+        return jsonify({
+            'code': 0,
+            'message': 'success',
+            'data': {
+                'list': [item.to_dict() for item in result.items],
+                'next_cursor': result.next_cursor,
+                'has_more': result.has_more,
+                'total': result.total,
+                'per_page': per_page
+            }
+        })
+    
     query = query.order_by(TestCase.created_at.desc())
     pagination = query.paginate(page=page, per_page=per_page, error_out=False)
     
@@ -125,6 +148,7 @@ def create_testcase():
         status=data.get('status', 'pending'),
         is_ai_generated=data.get('is_ai_generated', False)
     )
+    refresh_signature(testcase)
 
     db.session.add(testcase)
     db.session.commit()
@@ -140,13 +164,19 @@ def create_testcase():
 @jwt_required()
 @log_operation
 def create_testcases_batch():
-    """批量创建测试用例"""
+    """
+    批量创建测试用例
+    
+    dedup: 与同一需求下已有用例（及本批次用例）近似重复时的处理方式，
+        skip 跳过（默认）/ flag 照常创建并在 duplicates 中标记 / off 不检测
+    """
     data = request.get_json()
     testcases_data = data.get('testcases', [])
     
     if not testcases_data:
         return jsonify({'code': 400, 'message': '测试用例列表不能为空'}), 400
     
+    dedup = DuplicateFilter(data.get('dedup', 'skip'))
     created_testcases = []
     for tc_data in testcases_data:
         # 处理 steps 和 expected_result 字段 - 如果是列表则转换为字符串
@@ -163,15 +193,21 @@ def create_testcases_batch():
             status='pending',
             is_ai_generated=tc_data.get('is_ai_generated', False)
         )
+        if not dedup.check(testcase):
+            continue
         db.session.add(testcase)
         created_testcases.append(testcase)
     
     db.session.commit()
     
+    message = f'成功创建 {len(created_testcases)} 条测试用例'
+    if dedup.skipped:
+        message += f'，跳过 {dedup.skipped} 条重复用例'
     return jsonify({
         'code': 0,
-        'message': f'成功创建 {len(created_testcases)} 条测试用例',
-        'data': [tc.to_dict() for tc in created_testcases]
+        'message': message,
+        'data': [tc.to_dict() for tc in created_testcases],
+        'duplicates': dedup.report()
     })
 
 
@@ -191,6 +227,8 @@ def update_testcase(testcase_id):
         testcase.steps = ensure_string(data['steps'])
     if 'expected_result' in data:
         testcase.expected_result = ensure_string(data['expected_result'])
+    if {'title', 'steps', 'expected_result'} & data.keys():
+        refresh_signature(testcase)
     if 'case_type' in data:
         testcase.case_type = data['case_type']
     if 'priority' in data:
@@ -222,17 +260,52 @@ def delete_testcase(testcase_id):
     })
 
 
+@testcase_bp.route('/duplicates', methods=['GET'])
+@jwt_required()
+@log_operation
+def get_duplicate_clusters():
+    """
+    查询需求下已有用例的近似重复簇
+    
+    查询参数:
+        requirement_id: 需求ID
+        threshold: 可选，相似度阈值（0~1），默认 TESTCASE_DEDUP_THRESHOLD
+    """
+    requirement_id = request.args.get('requirement_id', type=int)
+    if not requirement_id:
+        return jsonify({'code': 400, 'message': '请选择需求'}), 400
+    threshold = request.args.get('threshold', type=float)
+    if threshold is not None and not 0 < threshold <= 1:
+        return jsonify({'code': 400, 'message': 'threshold 必须在 0~1 之间'}), 400
+    
+    clusters = find_duplicate_clusters(requirement_id, threshold)
+    # 保存首次计算的签名
+    db.session.commit()
+    
+    return jsonify({
+        'code': 0,
+        'message': 'success',
+        'data': {
+            'requirement_id': requirement_id,
+            'clusters': clusters,
+            'duplicate_count': sum(len(c['testcases']) - 1 for c in clusters)
+        }
+    })
+
+
 @testcase_bp.route('/stats', methods=['GET'])
 @jwt_required()
 @log_operation
 def get_stats():
-    """获取测试用例统计"""
-    total = TestCase.query.count()
-    passed = TestCase.query.filter_by(status='passed').count()
-    failed = TestCase.query.filter_by(status='failed').count()
-    pending = TestCase.query.filter_by(status='pending').count()
-    blocked = TestCase.query.filter_by(status='blocked').count()
-    ai_generated = TestCase.query.filter_by(is_ai_generated=True).count()
+    """获取测试用例统计（读取统计计数器）"""
+    counters = get_counters(TestCase)
+    by_status = counters.get('status', {})
+    total = counters.get('total', {}).get('', 0)
+    passed = by_status.get('passed', 0)
+    failed = by_status.get('failed', 0)
+    pending = by_status.get('pending', 0)
+    blocked = by_status.get('blocked', 0)
+    ai_generated = counters.get('ai_generated', {}).get('', 0)
     
     return jsonify({
         'code': 0,
@@ -249,6 +322,25 @@ def get_stats():
     })
 
 
+@testcase_bp.route('/timeseries', methods=['GET'])
+@jwt_required()
+def get_timeseries_stats():
+    """
+    按时间桶统计新增用例数量及其当前状态（读取小时/天汇总，用于仪表盘图表）
+    
+    range: day（最近24小时）/week（最近7天）/month（本月每天）/quarter（今年各季度）/year（历年）
+    """
+    range_name = request.args.get('range', 'week')
+    if range_name not in RANGES:
+        return jsonify({'code': 400, 'message': f"range 只能是 {'/'.join(RANGES)}"}), 400
+    
+    return jsonify({
+        'code': 0,
+        'message': 'success',
+        'data': get_timeseries(TestCase, range_name)
+    })
+
+
 @testcase_bp.route('/export', methods=['GET'])
 @jwt_required()
 @log_operation
@@ -261,7 +353,8 @@ def export_testcases():
     status = request.args.get('status', '')
     is_ai_generated = request.args.get('is_ai_generated', '')
     
-    query = TestCase.query
+    # 一次联表带出需求标题，避免逐行查询需求
+    query = TestCase.query.options(joinedload(TestCase.requirement).load_only(Requirement.title))
     
     if keyword:
         query = query.filter(
@@ -435,7 +528,11 @@ def download_template():
 @jwt_required()
 @log_operation
 def import_testcases():
-    """导入测试用例"""
+    """
+    导入测试用例
+    
+    表单参数 dedup: 近似重复用例的处理方式，同批量创建接口（默认 skip）
+    """
     if 'file' not in request.files:
         return jsonify({'code': 400, 'message': '请上传文件'}), 400
     
@@ -453,6 +550,7 @@ def import_testcases():
         
         created_count = 0
         errors = []
+        dedup = DuplicateFilter(request.form.get('dedup', 'skip'))
         
         # 从第3行开始读取数据（跳过标题行和说明行）
         for row_num, row in enumerate(ws.iter_rows(min_row=3, values_only=True), 3):
@@ -501,6 +599,8 @@ def import_testcases():
                 status='pending',
                 is_ai_generated=False
             )
+            if not dedup.check(testcase):
+                continue
             db.session.add(testcase)
             created_count += 1
         
@@ -511,10 +611,14 @@ def import_testcases():
             'message': f'成功导入 {created_count} 条测试用例',
             'data': {
                 'success_count': created_count,
+                'duplicate_count': dedup.skipped,
+                'duplicates': dedup.report(),
                 'errors': errors
             }
         }
         
+        if dedup.skipped:
+            result['message'] += f'，跳过 {dedup.skipped} 条重复用例'
         if errors:
             result['message'] += f'，{len(errors)} 条失败'
         
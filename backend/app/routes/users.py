@@ -3,6 +3,7 @@
 """
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
+from sqlalchemy.orm import selectinload
 from app import db
 from app.models import User, Role
 from app.middlewares import log_operation
@@ -45,7 +46,11 @@ def get_users():
     keyword = request.args.get('keyword', '')
     status = request.args.get('status', '')
     
-    query = User.query
+    # 角色及其权限、菜单各用一条 IN 查询批量加载，避免逐个用户、逐个角色查询
+    query = User.query.options(
+        selectinload(User.roles).selectinload(Role.permissions),
+        selectinload(User.roles).selectinload(Role.menus)
+    )
     
     if keyword:
         query = query.filter(
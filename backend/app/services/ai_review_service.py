@@ -5,7 +5,9 @@ AI 评审服务 - 测试用例AI评审
 """
 import json
 import os
-from typing import List, Dict, Any, Optional
+import asyncio
+from dataclasses import dataclass, field
+from typing import List, Dict, Any, Optional, AsyncIterator
 from flask import current_app
 
 from app.services.ai_service import AIService
@@ -13,6 +15,23 @@ from app.services.llm_clients import (
     ChatMessage,
     ChatResponse
 )
+from app.services.prompt_budget import count_tokens
+
+
+@dataclass
+class ReviewBatch:
+    """
+    一批评审结果
+    
+    reviews 为评审结果；failed 为未得到评审结果的用例（调用失败或模型遗漏），
+    每项包含 testcase_id、testcase_title、reason，不能当作评审结论保存
+    """
+    reviews: List[Dict] = field(default_factory=list)
+    failed: List[Dict] = field(default_factory=list)
+    
+    def extend(self, other: 'ReviewBatch'):
+        self.reviews.extend(other.reviews)
+        self.failed.extend(other.failed)
 
 
 class AIReviewService(AIService):
@@ -21,80 +40,231 @@ class AIReviewService(AIService):
     用于对测试用例进行AI自动评审
     """
     
+    FEATURE = 'review'
+    
+    # 每次调用评审的用例数上限（按 token 预算可能更少），以及每条评审结果的输出 token 估算
+    CHUNK_SIZE = 10
+    TOKENS_PER_ITEM = 500
+    
     def review_testcases(
         self,
         testcases: List[Dict],
         options: Dict[str, Any],
         prompt_content: str = None,
         knowledge_contents: List[str] = None
-    ) -> List[Dict]:
+    ) -> ReviewBatch:
         """
         使用AI对测试用例进行评审
         
+        用例按 token 预算分块依次评审（各块并发评审见 areview_testcases），
+        单块失败或模型遗漏的用例记入 failed，不使用模板结论代替
+        
         Args:
             testcases: 测试用例列表
             options: 评审选项
                 - review_dimensions: 评审维度列表
                 - scoring_criteria: 评分标准
                 - count: 评审数量限制
+                - use_cache: 是否使用 LLM 响应缓存，默认 True
             prompt_content: 自定义提示词内容
             knowledge_contents: 知识库内容列表
         
         Returns:
-            评审结果列表
+            评审结果与未评审的用例
         """
-        if self.client:
-            return self._review_with_ai(testcases, options, prompt_content, knowledge_contents)
-        else:
+        if not self.client:
             # 如果没有配置AI，使用模板评审
-            return self._review_with_template(testcases, options)
+            return ReviewBatch(self._review_with_template(testcases, options))
+        
+        batch = ReviewBatch()
+        for chunk in self._chunk_testcases(testcases, options, prompt_content, knowledge_contents):
+            batch.extend(self._review_with_ai(chunk, options, prompt_content, knowledge_contents))
+        return batch
     
-    def _review_with_ai(
+    async def areview_testcases(
         self,
         testcases: List[Dict],
         options: Dict[str, Any],
         prompt_content: str = None,
         knowledge_contents: List[str] = None
-    ) -> List[Dict]:
-        """使用AI对测试用例进行评审"""
-        prompt = self._build_review_prompt(testcases, options, knowledge_contents)
+    ) -> ReviewBatch:
+        """异步评审测试用例，参数与返回值同 review_testcases，各块并发评审"""
+        batch = ReviewBatch()
+        async for chunk_batch in self.aiter_reviews(testcases, options, prompt_content, knowledge_contents):
+            batch.extend(chunk_batch)
         
-        # 构建系统提示词
-        system_prompt = self._build_system_prompt(prompt_content, options)
+        # 按传入用例的顺序返回
+        order = {tc.get('id'): i for i, tc in enumerate(testcases)}
+        for items in (batch.reviews, batch.failed):
+            items.sort(key=lambda item: order.get(item.get('testcase_id'), len(order)))
+        return batch
+    
+    async def aiter_reviews(
+        self,
+        testcases: List[Dict],
+        options: Dict[str, Any],
+        prompt_content: str = None,
+        knowledge_contents: List[str] = None
+    ) -> AsyncIterator[ReviewBatch]:
+        """
+        分块并发评审，每完成一块立即产出该块的 ReviewBatch（按完成顺序）
+        
+        所有块共享一个异步客户端（连接池），并发数受 max_concurrency 限制，
+        总耗时接近最慢的一块而非各块之和。单块失败时该块的用例全部记入 failed。
+        """
+        chunks = self._chunk_testcases(testcases, options, prompt_content, knowledge_contents)
+        async_client = self.create_async_client()
+        if not async_client:
+            for chunk in chunks:
+                yield ReviewBatch(self._review_with_template(chunk, options))
+            return
         
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        # 备用配置的异步客户端在各块间复用
+        fallback_clients = {}
+        
+        async def review_chunk(chunk):
+            async with semaphore:
+                try:
+                    response = await self.achat(
+                        async_client,
+                        self._build_review_messages(chunk, options, prompt_content, knowledge_contents),
+                        fallback_clients=fallback_clients,
+                        temperature=0.3,
+                        max_tokens=self._review_max_tokens(chunk),
+                        use_cache=options.get('use_cache', True)
+                    )
+                    return self._merge_reviews(chunk, self._parse_reviews(response.content))
+                except Exception as e:
+                    current_app.logger.error(f'AI评审失败 (provider={self.provider}, {len(chunk)} 条用例): {str(e)}')
+                    return self._failed_batch(chunk, f'AI评审失败: {str(e)}')
+        
+        async with async_client:
+            tasks = [asyncio.ensure_future(review_chunk(chunk)) for chunk in chunks]
+            try:
+                for future in asyncio.as_completed(tasks):
+                    yield await future
+            finally:
+                # 调用方提前结束迭代时取消未完成的块
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                for client in fallback_clients.values():
+                    await client.aclose()
+    
+    def _review_with_ai(
+        self,
+        testcases: List[Dict],
+        options: Dict[str, Any],
+        prompt_content: str = None,
+        knowledge_contents: List[str] = None
+    ) -> ReviewBatch:
+        """使用AI对一块测试用例进行评审"""
         try:
             # 使用统一的客户端接口
-            messages = [
-                ChatMessage(role="system", content=system_prompt),
-                ChatMessage(role="user", content=prompt)
-            ]
-            
-            response = self.client.chat(
-                messages=messages,
+            response = self.chat(
+                messages=self._build_review_messages(testcases, options, prompt_content, knowledge_contents),
                 temperature=0.3,  # 评审需要较低的温度，保证稳定性
-                max_tokens=8000
+                max_tokens=self._review_max_tokens(testcases),
+                use_cache=options.get('use_cache', True)
             )
-            
-            content = response.content
-            
-            # 尝试解析JSON
-            if content.startswith('```'):
-                content = content.split('```')[1]
-                if content.startswith('json'):
-                    content = content[4:]
-            
-            reviews = json.loads(content)
-            
-            # 确保返回的是列表
-            if not isinstance(reviews, list):
-                reviews = [reviews]
-            
-            return reviews
+            return self._merge_reviews(testcases, self._parse_reviews(response.content))
             
         except Exception as e:
             current_app.logger.error(f'AI评审失败 (provider={self.provider}): {str(e)}')
-            # 降级使用模板评审
-            return self._review_with_template(testcases, options)
+            return self._failed_batch(testcases, f'AI评审失败: {str(e)}')
+    
+    def _chunk_testcases(
+        self,
+        testcases: List[Dict],
+        options: Dict[str, Any],
+        prompt_content: str = None,
+        knowledge_contents: List[str] = None
+    ) -> List[List[Dict]]:
+        """按 token 预算把用例分块，知识库最多占用每块一半的提示词预算"""
+        fixed_tokens = (
+            count_tokens(self._build_system_prompt(prompt_content, options))
+            + count_tokens(self._build_review_prompt([], options))
+        )
+        knowledge_tokens = sum(count_tokens(content) for content in knowledge_contents or [])
+        available = self.prompt_budget.context_window - self.prompt_budget.max_output_tokens - fixed_tokens
+        return self.prompt_budget.chunk(
+            testcases,
+            [count_tokens(self._format_testcase(i, tc)) for i, tc in enumerate(testcases, 1)],
+            self.TOKENS_PER_ITEM,
+            fixed_tokens=fixed_tokens,
+            reserve_tokens=min(knowledge_tokens, max(available, 0) // 2),
+            max_items=self.CHUNK_SIZE
+        )
+    
+    def _merge_reviews(self, testcases: List[Dict], reviews: List[Dict]) -> ReviewBatch:
+        """
+        按 testcase_id 把模型返回的评审结果对应到本块用例
+        
+        丢弃不属于本块的结果，同一用例只保留第一条，模型遗漏的用例记入 failed
+        """
+        ids = {str(tc.get('id')): tc.get('id') for tc in testcases}
+        merged = {}
+        for review in reviews:
+            if not isinstance(review, dict):
+                continue
+            testcase_id = ids.get(str(review.get('testcase_id')))
+            if testcase_id is not None and testcase_id not in merged:
+                merged[testcase_id] = dict(review, testcase_id=testcase_id)
+        
+        missing = [tc for tc in testcases if tc.get('id') not in merged]
+        if missing:
+            current_app.logger.warning(f'AI评审结果缺少 {len(missing)} 条用例')
+        return ReviewBatch(
+            [merged[tc.get('id')] for tc in testcases if tc.get('id') in merged],
+            self._failed_batch(missing, '模型未返回该用例的评审结果').failed
+        )
+    
+    @staticmethod
+    def _failed_batch(testcases: List[Dict], reason: str) -> ReviewBatch:
+        """未得到评审结果的用例"""
+        return ReviewBatch(failed=[
+            {'testcase_id': tc.get('id'), 'testcase_title': tc.get('title'), 'reason': reason}
+            for tc in testcases
+        ])
+    
+    def _build_review_messages(
+        self,
+        testcases: List[Dict],
+        options: Dict[str, Any],
+        prompt_content: str = None,
+        knowledge_contents: List[str] = None
+    ) -> List[ChatMessage]:
+        """构建评审消息列表，知识库按模型上下文预算裁剪，系统提示词与知识库标记为可缓存前缀"""
+        # 构建系统提示词
+        system_prompt = self._build_system_prompt(prompt_content, options)
+        
+        fitted = self.prompt_budget.fit(
+            self._review_max_tokens(testcases),
+            fixed=[system_prompt, self._build_review_prompt(testcases, options)],
+            knowledge_contents=knowledge_contents
+        )
+        self._log_trimmed(fitted)
+        prompt = self._build_review_prompt(testcases, options)
+        
+        return [
+            ChatMessage(role="system", content=system_prompt + self._build_knowledge_context(fitted.knowledge_contents), cache=True),
+            ChatMessage(role="user", content=prompt)
+        ]
+    
+    def _review_max_tokens(self, testcases: List[Dict]) -> int:
+        """按评审用例数计算输出上限"""
+        return self.prompt_budget.output_tokens(len(testcases), self.TOKENS_PER_ITEM)
+    
+    def _parse_reviews(self, content: str) -> List[Dict]:
+        """解析模型返回的评审结果 JSON"""
+        reviews = json.loads(self._strip_code_fence(content))
+        
+        # 确保返回的是列表
+        if not isinstance(reviews, list):
+            reviews = [reviews]
+        
+        return reviews
     
     def _review_with_template(
         self,
@@ -148,18 +318,11 @@ class AIReviewService(AIService):
         
         return reviews
     
-    def _build_review_prompt(
-        self,
-        testcases: List[Dict],
-        options: Dict[str, Any],
-        knowledge_contents: List[str] = None
-    ) -> str:
-        """构建评审提示词"""
-        # 构建测试用例列表文本
-        testcase_list = []
-        for i, tc in enumerate(testcases[:10], 1):  # 限制最多评审10个
-            testcase_list.append(f"""
-用例 {i}:
+    @staticmethod
+    def _format_testcase(index: int, tc: Dict) -> str:
+        """评审提示词中的单条用例"""
+        return f"""
+用例 {index}:
 - ID: {tc.get('id')}
 - 标题: {tc.get('title')}
 - 前置条件: {tc.get('precondition', '无')}
@@ -167,14 +330,16 @@ class AIReviewService(AIService):
 - 预期结果: {tc.get('expected_result')}
 - 类型: {tc.get('case_type')}
 - 优先级: {tc.get('priority')}
-""")
-        
-        # 构建知识库上下文
-        knowledge_context = ""
-        if knowledge_contents:
-            knowledge_context = "\n\n**参考知识库**:\n"
-            for i, content in enumerate(knowledge_contents, 1):
-                knowledge_context += f"\n--- 知识库 {i} ---\n{content}\n"
+"""
+    
+    def _build_review_prompt(
+        self,
+        testcases: List[Dict],
+        options: Dict[str, Any]
+    ) -> str:
+        """构建评审提示词"""
+        # 构建测试用例列表文本
+        testcase_list = [self._format_testcase(i, tc) for i, tc in enumerate(testcases, 1)]
         
         # 构建评分标准说明
         scoring_desc = """
@@ -189,7 +354,7 @@ class AIReviewService(AIService):
         prompt = f"""请对以下测试用例进行专业评审，给出详细的质量评估和改进建议：
 
 **测试用例列表**:
-{''.join(testcase_list)}{knowledge_context}
+{''.join(testcase_list)}
 
 **评审要求**:
 1. 对每个测试用例进行独立评审
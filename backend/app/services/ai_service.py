@@ -7,15 +7,21 @@ AI 服务 - 测试用例生成
 """
 import json
 import os
-from typing import List, Dict, Any, Optional
+import asyncio
+from typing import List, Dict, Any, Optional, Iterator, AsyncIterator
 from flask import current_app
 
 from app.services.llm_clients import (
+    client_registry,
     LLMClientFactory,
     BaseLLMClient,
     ChatMessage,
     ChatResponse
 )
+from app.services.llm_resilience import should_failover, circuit_breakers
+from app.services.llm_ledger import llm_feature
+from app.services.json_stream import JSONArrayStreamParser, parse_json_array_items
+from app.services.prompt_budget import PromptBudget
 
 
 class AIService:
@@ -24,6 +30,15 @@ class AIService:
     采用工厂模式支持多种 LLM 服务商
     """
     
+    # 批量生成时的默认并发数，可通过 LLMConfig.extra_params.max_concurrency 调整
+    DEFAULT_MAX_CONCURRENCY = 5
+    
+    # 调用场景标识，记录到 llm_call_log.feature
+    FEATURE = 'generate'
+    
+    # 每条生成结果的输出 token 估算，用于按条数计算 max_tokens
+    TOKENS_PER_ITEM = 400
+    
     def __init__(self, llm_config=None):
         """
         初始化 AI 服务
@@ -33,6 +48,10 @@ class AIService:
         """
         self.llm_config = llm_config
         self.client: Optional[BaseLLMClient] = None
+        # 上下文窗口与输出上限来自 LLMConfig.extra_params
+        self.prompt_budget = PromptBudget.from_extra_params(
+            LLMClientFactory.parse_extra_params(llm_config) if llm_config else None
+        )
         
         if llm_config:
             # 使用传入的配置，通过工厂创建客户端
@@ -42,7 +61,8 @@ class AIService:
             self.provider = llm_config.provider
             
             if self.api_key:
-                self.client = LLMClientFactory.create_from_config(llm_config)
+                # 从注册表获取复用的长连接客户端
+                self.client = client_registry.get(llm_config)
         else:
             # 使用环境变量配置（兼容旧版本）
             self.api_key = os.getenv('AI_API_KEY', '')
@@ -51,7 +71,7 @@ class AIService:
             self.provider = os.getenv('AI_PROVIDER', 'openai')
             
             if self.api_key:
-                self.client = LLMClientFactory.create(
+                self.client = client_registry.get_for_env(
                     provider=self.provider,
                     api_key=self.api_key,
                     api_base=self.api_base,
@@ -110,6 +130,7 @@ class AIService:
                 - include_exception: 是否包含异常测试
                 - include_performance: 是否包含性能测试
                 - count: 生成数量
+                - use_cache: 是否使用 LLM 响应缓存，默认 True
             prompt_content: 自定义提示词内容
             knowledge_contents: 知识库内容列表
         
@@ -122,41 +143,371 @@ class AIService:
             # 如果没有配置 AI，使用模板生成
             return self._generate_with_template(requirement, options)
     
-    def _generate_with_ai(self, requirement, options: Dict[str, Any], prompt_content: str = None, knowledge_contents: List[str] = None) -> List[Dict]:
-        """使用 AI API 生成测试用例（通过工厂模式创建的客户端）"""
-        prompt = self._build_prompt(requirement, options, knowledge_contents)
+    async def agenerate_testcases(self, requirement, options: Dict[str, Any], prompt_content: str = None, knowledge_contents: List[str] = None) -> List[Dict]:
+        """
+        异步生成测试用例，参数与返回值同 generate_testcases
         
-        # 构建系统提示词
-        system_prompt = self._build_system_prompt(prompt_content)
+        使用请求内创建的异步客户端，等待 LLM 响应期间不阻塞事件循环
+        """
+        async_client = self.create_async_client()
+        if not async_client:
+            return self._generate_with_template(requirement, options)
+        
+        async with async_client:
+            try:
+                return await self._agenerate_with_client(async_client, requirement, options, prompt_content, knowledge_contents)
+            except Exception as e:
+                current_app.logger.error(f'AI API 调用失败 (provider={self.provider}): {str(e)}')
+                return self._generate_with_template(requirement, options)
+    
+    def stream_testcases(self, requirement, options: Dict[str, Any], prompt_content: str = None, knowledge_contents: List[str] = None) -> Iterator[Dict]:
+        """
+        流式生成测试用例，每条用例在 JSON 中闭合后立即产出
         
+        参数同 generate_testcases。未配置 AI 或尚未产出任何用例就失败时降级为模板生成；
+        已产出部分用例后失败或输出被截断时，保留已产出的用例并结束。
+        """
+        if not self.client:
+            yield from self._generate_with_template(requirement, options)
+            return
+        
+        parser = JSONArrayStreamParser()
+        emitted = 0
         try:
-            # 使用统一的客户端接口
-            messages = [
-                ChatMessage(role="system", content=system_prompt),
-                ChatMessage(role="user", content=prompt)
+            with llm_feature(self.FEATURE):
+                for delta in self.client.stream_chat(
+                    self._build_generation_messages(requirement, options, prompt_content, knowledge_contents),
+                    temperature=0.7,
+                    max_tokens=self._generation_max_tokens(options)
+                ):
+                    for item in self._valid_testcases(parser.feed(delta)):
+                        emitted += 1
+                        yield item
+        except Exception as e:
+            current_app.logger.error(f'AI 流式生成失败 (provider={self.provider}, 已生成 {emitted} 条): {str(e)}')
+        
+        if parser.pending or parser.errors:
+            current_app.logger.warning(f'模型输出不完整，已保留 {emitted} 条完整的测试用例')
+        if not emitted:
+            yield from self._generate_with_template(requirement, options)
+    
+    async def astream_testcases(self, requirement, options: Dict[str, Any], prompt_content: str = None, knowledge_contents: List[str] = None) -> AsyncIterator[Dict]:
+        """stream_testcases 的异步版本"""
+        async_client = self.create_async_client()
+        if not async_client:
+            for item in self._generate_with_template(requirement, options):
+                yield item
+            return
+        
+        parser = JSONArrayStreamParser()
+        emitted = 0
+        async with async_client:
+            try:
+                with llm_feature(self.FEATURE):
+                    async for delta in async_client.stream_chat(
+                        self._build_generation_messages(requirement, options, prompt_content, knowledge_contents),
+                        temperature=0.7,
+                        max_tokens=self._generation_max_tokens(options)
+                    ):
+                        for item in self._valid_testcases(parser.feed(delta)):
+                            emitted += 1
+                            yield item
+            except Exception as e:
+                current_app.logger.error(f'AI 流式生成失败 (provider={self.provider}, 已生成 {emitted} 条): {str(e)}')
+        
+        if parser.pending or parser.errors:
+            current_app.logger.warning(f'模型输出不完整，已保留 {emitted} 条完整的测试用例')
+        if not emitted:
+            for item in self._generate_with_template(requirement, options):
+                yield item
+    
+    @staticmethod
+    def _valid_testcases(items: List[Any]) -> List[Dict]:
+        """过滤掉不是测试用例对象的元素"""
+        return [item for item in items if isinstance(item, dict) and item.get('title')]
+    
+    async def agenerate_batch(self, requirements: List[Any], options: Dict[str, Any], prompt_content: str = None, knowledge_map: Dict[Any, List[str]] = None) -> List[Dict[str, Any]]:
+        """
+        为多个需求并发生成测试用例
+        
+        所有需求共享一个异步客户端（连接池），并发数受 max_concurrency 限制。
+        与单条生成不同，调用失败不会降级为模板生成，而是在结果中返回错误信息。
+        
+        Args:
+            requirements: 需求对象列表
+            options: 生成选项，同 generate_testcases
+            prompt_content: 自定义提示词内容
+            knowledge_map: 需求ID -> 针对该需求检索的知识库内容列表
+        
+        Returns:
+            与 requirements 顺序一致的结果列表，每项包含 requirement / testcases / error
+        """
+        async_client = self.create_async_client()
+        if not async_client:
+            return [
+                {'requirement': req, 'testcases': self._generate_with_template(req, options), 'error': None}
+                for req in requirements
             ]
-            
-            response = self.client.chat(
-                messages=messages,
+        
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        
+        async def generate_one(requirement):
+            async with semaphore:
+                try:
+                    testcases = await self._agenerate_with_client(
+                        async_client, requirement, options, prompt_content,
+                        (knowledge_map or {}).get(requirement.id), fallback_clients
+                    )
+                    return {'requirement': requirement, 'testcases': testcases, 'error': None}
+                except Exception as e:
+                    current_app.logger.error(f'批量生成失败 (requirement_id={requirement.id}): {str(e)}')
+                    return {'requirement': requirement, 'testcases': [], 'error': str(e)}
+        
+        # 备用配置的异步客户端在整批请求间复用
+        fallback_clients = {}
+        async with async_client:
+            try:
+                return await asyncio.gather(*(generate_one(req) for req in requirements))
+            finally:
+                for client in fallback_clients.values():
+                    await client.aclose()
+    
+    async def _agenerate_with_client(self, async_client, requirement, options: Dict[str, Any], prompt_content: str = None, knowledge_contents: List[str] = None, fallback_clients: Dict[int, Any] = None) -> List[Dict]:
+        """使用指定的异步客户端生成测试用例，失败时抛出异常"""
+        response = await self.achat(
+            async_client,
+            self._build_generation_messages(requirement, options, prompt_content, knowledge_contents),
+            fallback_clients=fallback_clients,
+            temperature=0.7,
+            max_tokens=self._generation_max_tokens(options),
+            use_cache=options.get('use_cache', True)
+        )
+        return self._parse_testcases(response.content)
+    
+    def chat(self, messages: List[ChatMessage], feature: str = None, **kwargs) -> ChatResponse:
+        """
+        调用大模型
+        
+        当前配置熔断、限流排队超时、重试耗尽或出现鉴权失败等上游/配置错误时，按优先级依次切换到其他启用的配置
+        
+        Args:
+            messages: 消息列表
+            feature: 调用场景标识，默认为服务的 FEATURE
+            **kwargs: 透传给 BaseLLMClient.chat 的参数
+        
+        Returns:
+            ChatResponse 对象
+        """
+        with llm_feature(feature or self.FEATURE):
+            return self._chat_with_failover(messages, **kwargs)
+    
+    def _chat_with_failover(self, messages: List[ChatMessage], **kwargs) -> ChatResponse:
+        try:
+            return self.client.chat(messages, **kwargs)
+        except Exception as e:
+            if not should_failover(e):
+                raise
+            error = e
+        
+        for config in self._failover_configs():
+            try:
+                response = client_registry.get(config).chat(messages, **kwargs)
+            except Exception as e:
+                if not should_failover(e):
+                    raise
+                error = e
+                continue
+            current_app.logger.warning(f'LLM 调用已切换到备用配置 {config.name} (原配置 provider={self.provider}): {str(error)}')
+            return response
+        raise error
+    
+    async def achat(self, async_client, messages: List[ChatMessage], fallback_clients: Dict[int, Any] = None, feature: str = None, **kwargs) -> ChatResponse:
+        """
+        异步调用大模型，故障切换规则同 chat
+        
+        Args:
+            async_client: 当前配置的异步客户端
+            messages: 消息列表
+            fallback_clients: 备用配置异步客户端缓存（配置ID -> 客户端），由调用方负责关闭；
+                不传时在本次调用结束后关闭
+            feature: 调用场景标识，默认为服务的 FEATURE
+            **kwargs: 透传给 AsyncBaseLLMClient.chat 的参数
+        """
+        with llm_feature(feature or self.FEATURE):
+            return await self._achat_with_failover(async_client, messages, fallback_clients, **kwargs)
+    
+    async def _achat_with_failover(self, async_client, messages: List[ChatMessage], fallback_clients: Dict[int, Any] = None, **kwargs) -> ChatResponse:
+        try:
+            return await async_client.chat(messages, **kwargs)
+        except Exception as e:
+            if not should_failover(e):
+                raise
+            error = e
+        
+        owned = fallback_clients is None
+        clients = {} if owned else fallback_clients
+        try:
+            for config in self._failover_configs():
+                client = clients.get(config.id)
+                if client is None:
+                    client = clients[config.id] = LLMClientFactory.create_async_from_config(config)
+                try:
+                    response = await client.chat(messages, **kwargs)
+                except Exception as e:
+                    if not should_failover(e):
+                        raise
+                    error = e
+                    continue
+                current_app.logger.warning(f'LLM 调用已切换到备用配置 {config.name} (原配置 provider={self.provider}): {str(error)}')
+                return response
+            raise error
+        finally:
+            if owned:
+                for client in clients.values():
+                    await client.aclose()
+    
+    def _failover_configs(self) -> List[Any]:
+        """
+        可切换的备用配置：其他启用且配置了 API Key 的配置，跳过熔断中的配置
+        按 extra_params.priority 升序（默认 100），其次默认配置优先
+        当前配置 extra_params.failover 为 false 时不切换
+        """
+        if not self.llm_config:
+            return []
+        if LLMClientFactory.parse_extra_params(self.llm_config).get('failover', True) is False:
+            return []
+        
+        from app.models import LLMConfig
+        configs = LLMConfig.query.filter(
+            LLMConfig.is_active == True,
+            LLMConfig.id != self.llm_config.id
+        ).all()
+        candidates = [c for c in configs if c.api_key and not circuit_breakers.is_open(c.id)]
+        
+        def priority(config):
+            try:
+                value = float(LLMClientFactory.parse_extra_params(config).get('priority', 100))
+            except (TypeError, ValueError):
+                value = 100
+            return (value, not config.is_default, config.id)
+        
+        return sorted(candidates, key=priority)
+    
+    @property
+    def max_concurrency(self) -> int:
+        """当前配置允许的最大并发请求数"""
+        if not self.llm_config:
+            return self.DEFAULT_MAX_CONCURRENCY
+        extra_params = LLMClientFactory.parse_extra_params(self.llm_config)
+        try:
+            return max(1, int(extra_params.get('max_concurrency', self.DEFAULT_MAX_CONCURRENCY)))
+        except (TypeError, ValueError):
+            return self.DEFAULT_MAX_CONCURRENCY
+    
+    def create_async_client(self):
+        """
+        创建与当前配置对应的异步客户端
+        
+        Returns:
+            AsyncBaseLLMClient 实例，未配置 API Key 时返回 None
+        """
+        if not self.api_key:
+            return None
+        if self.llm_config:
+            return LLMClientFactory.create_async_from_config(self.llm_config)
+        return LLMClientFactory.create_async(
+            provider=self.provider,
+            api_key=self.api_key,
+            api_base=self.api_base,
+            model=self.model
+        )
+    
+    def _generate_with_ai(self, requirement, options: Dict[str, Any], prompt_content: str = None, knowledge_contents: List[str] = None) -> List[Dict]:
+        """使用 AI API 生成测试用例（通过工厂模式创建的客户端）"""
+        try:
+            # 使用统一的客户端接口
+            response = self.chat(
+                messages=self._build_generation_messages(requirement, options, prompt_content, knowledge_contents),
                 temperature=0.7,
-                max_tokens=4000
+                max_tokens=self._generation_max_tokens(options),
+                use_cache=options.get('use_cache', True)
             )
-            
-            content = response.content
-            # 尝试解析 JSON
-            if content.startswith('```'):
-                content = content.split('```')[1]
-                if content.startswith('json'):
-                    content = content[4:]
-            
-            testcases = json.loads(content)
-            return testcases
+            return self._parse_testcases(response.content)
             
         except Exception as e:
             current_app.logger.error(f'AI API 调用失败 (provider={self.provider}): {str(e)}')
             # 降级使用模板生成
             return self._generate_with_template(requirement, options)
     
+    def _generation_max_tokens(self, options: Dict[str, Any]) -> int:
+        """按生成条数计算输出上限"""
+        return self.prompt_budget.output_tokens(options.get('count', 5), self.TOKENS_PER_ITEM)
+    
+    def _build_generation_messages(self, requirement, options: Dict[str, Any], prompt_content: str = None, knowledge_contents: List[str] = None) -> List[ChatMessage]:
+        """
+        构建生成测试用例的消息列表，需求内容和知识库按模型上下文预算裁剪
+        
+        系统提示词与知识库组成跨需求不变的前缀，标记为可缓存
+        """
+        # 构建系统提示词
+        system_prompt = self._build_system_prompt(prompt_content)
+        
+        fitted = self.prompt_budget.fit(
+            self._generation_max_tokens(options),
+            fixed=[system_prompt, self._build_prompt(requirement, options, requirement_content='')],
+            content=requirement.content,
+            knowledge_contents=knowledge_contents
+        )
+        self._log_trimmed(fitted)
+        prompt = self._build_prompt(requirement, options, requirement_content=fitted.content)
+        
+        return [
+            ChatMessage(role="system", content=system_prompt + self._build_knowledge_context(fitted.knowledge_contents), cache=True),
+            ChatMessage(role="user", content=prompt)
+        ]
+    
+    @staticmethod
+    def _build_knowledge_context(knowledge_contents: List[str] = None) -> str:
+        """构建知识库上下文，追加在系统提示词之后"""
+        if not knowledge_contents:
+            return ""
+        knowledge_context = "\n\n**参考知识库**:\n"
+        for i, content in enumerate(knowledge_contents, 1):
+            knowledge_context += f"\n--- 知识库 {i} ---\n{content}\n"
+        return knowledge_context
+    
+    def _log_trimmed(self, fitted):
+        """记录提示词裁剪情况"""
+        if fitted.trimmed:
+            current_app.logger.warning(
+                f'提示词超出预算 {fitted.prompt_budget} tokens (provider={self.provider}, model={self.model})，'
+                f'已裁剪: {"; ".join(fitted.trimmed)}'
+            )
+    
+    @staticmethod
+    def _strip_code_fence(content: str) -> str:
+        """去除模型返回内容外层的 ``` 代码块标记"""
+        if content.startswith('```'):
+            content = content.split('```')[1]
+            if content.startswith('json'):
+                content = content[4:]
+        return content
+    
+    def _parse_testcases(self, content: str) -> List[Dict]:
+        """
+        解析模型返回的测试用例 JSON
+        
+        输出被截断或个别元素不合法时，保留其中完整的用例，全部无法解析时抛出异常
+        """
+        try:
+            return json.loads(self._strip_code_fence(content))
+        except json.JSONDecodeError:
+            testcases = self._valid_testcases(parse_json_array_items(content))
+            if not testcases:
+                raise
+            current_app.logger.warning(f'模型输出不完整，已保留 {len(testcases)} 条完整的测试用例')
+            return testcases
+    
     def _generate_with_template(self, requirement, options: Dict[str, Any]) -> List[Dict]:
         """使用模板生成测试用例（无 AI 时的降级方案）"""
         testcases = []
@@ -228,8 +579,15 @@ class AIService:
         
         return testcases[:count]
     
-    def _build_prompt(self, requirement, options: Dict[str, Any], knowledge_contents: List[str] = None) -> str:
-        """构建用户提示词"""
+    def _build_prompt(self, requirement, options: Dict[str, Any], requirement_content: str = None) -> str:
+        """
+        构建用户提示词
+        
+        requirement_content 为裁剪后的需求内容，未传入时使用 requirement.content
+        """
+        if requirement_content is None:
+            requirement_content = requirement.content
+        
         case_types = ['功能测试']
         if options.get('include_boundary', True):
             case_types.append('边界值测试')
@@ -238,21 +596,14 @@ class AIService:
         if options.get('include_performance', False):
             case_types.append('性能测试')
         
-        # 构建知识库上下文
-        knowledge_context = ""
-        if knowledge_contents:
-            knowledge_context = "\n\n**参考知识库**:\n"
-            for i, content in enumerate(knowledge_contents, 1):
-                knowledge_context += f"\n--- 知识库 {i} ---\n{content}\n"
-        
         prompt = f"""请根据以下需求文档生成 {options.get('count', 5)} 条测试用例：
 
 **需求标题**: {requirement.title}
 
 **需求内容**:
-{requirement.content}
+{requirement_content}
 
-**所属模块**: {requirement.module or '未指定'}{knowledge_context}
+**所属模块**: {requirement.module or '未指定'}
 
 **要求**:
 1. 生成的测试用例类型应包括: {', '.join(case_types)}
@@ -0,0 +1,333 @@
+"""
+异步 LLM 客户端
+
+与 llm_clients 中的同步客户端一一对应：
+- AsyncOpenAIClient: 基于 openai.AsyncOpenAI，用于 OpenAI 官方服务
+- AsyncHTTPXClient: 基于 httpx.AsyncClient，用于其他兼容 OpenAI API 的服务
+- AsyncAnthropicClient: 基于 httpx.AsyncClient，使用 Anthropic Messages API
+
+异步客户端绑定创建时的事件循环，通过 LLMClientFactory.create_async* 创建，
+在单个请求内使用 `async with` 管理生命周期。
+"""
+from abc import ABC, abstractmethod
+from typing import List, AsyncIterator
+
+from app.services.llm_clients import (
+    ChatMessage,
+    ChatResponse,
+    OpenAICompatibleMixin,
+    AnthropicMessagesMixin,
+    build_async_http_client
+)
+from app.services.llm_cache import response_cache
+from app.services.llm_governor import llm_governor
+from app.services.llm_resilience import acall_with_resilience, astream_with_resilience
+from app.services.llm_ledger import call_ledger
+
+
+class AsyncBaseLLMClient(ABC):
+    """
+    异步 LLM 客户端抽象基类
+    接口与 BaseLLMClient 保持一致，方法均为协程
+    """
+    
+    def __init__(self, api_key: str, api_base: str, model: str, **kwargs):
+        """
+        初始化客户端
+        
+        Args:
+            api_key: API 密钥
+            api_base: API 基础 URL
+            model: 模型名称
+            **kwargs: 其他参数
+        """
+        self.api_key = api_key
+        self.api_base = api_base
+        self.model = model
+        self.provider = kwargs.pop('provider', None)
+        self.config_id = kwargs.pop('config_id', None)
+        self.extra_params = kwargs
+    
+    async def chat(
+        self,
+        messages: List[ChatMessage],
+        temperature: float = 0.7,
+        max_tokens: int = 4000,
+        use_cache: bool = True,
+        **kwargs
+    ) -> ChatResponse:
+        """
+        异步聊天补全接口，与同步客户端共享响应缓存，调用记录到 llm_call_log
+        
+        Args:
+            messages: 消息列表
+            temperature: 温度参数
+            max_tokens: 最大 token 数
+            use_cache: 是否使用响应缓存
+            **kwargs: 其他参数
+        
+        Returns:
+            ChatResponse 对象
+        """
+        with call_ledger.track(self, messages) as call:
+            if not use_cache:
+                call.response = await self._upstream_chat(messages, temperature, max_tokens, **kwargs)
+            else:
+                key = response_cache.make_key(
+                    self.provider, self.api_base, self.model, messages, temperature, max_tokens, kwargs
+                )
+                call.response = await response_cache.aget_or_call(
+                    key,
+                    lambda: self._upstream_chat(messages, temperature, max_tokens, **kwargs)
+                )
+            return call.response
+    
+    async def _upstream_chat(self, messages: List[ChatMessage], temperature: float, max_tokens: int, **kwargs) -> ChatResponse:
+        """经熔断检查、失败重试后调用上游，与同步客户端共享熔断状态"""
+        return await acall_with_resilience(
+            self,
+            lambda: self._governed_chat(messages, temperature, max_tokens, **kwargs)
+        )
+    
+    async def _governed_chat(self, messages: List[ChatMessage], temperature: float, max_tokens: int, **kwargs) -> ChatResponse:
+        """经服务商/配置维度限流后调用上游，与同步客户端共享限额"""
+        async with llm_governor.alimit(self, messages, max_tokens) as permit:
+            response = await self._chat(messages, temperature, max_tokens, **kwargs)
+            permit.record_usage(response.usage)
+            return response
+    
+    @abstractmethod
+    async def _chat(
+        self,
+        messages: List[ChatMessage],
+        temperature: float,
+        max_tokens: int,
+        **kwargs
+    ) -> ChatResponse:
+        """实际调用上游服务的聊天补全，由子类实现"""
+        pass
+    
+    async def stream_chat(
+        self,
+        messages: List[ChatMessage],
+        temperature: float = 0.7,
+        max_tokens: int = 4000,
+        **kwargs
+    ) -> AsyncIterator[str]:
+        """异步流式聊天补全，整个流式响应期间占用一个并发名额，尚未产出内容前失败会重试"""
+        with call_ledger.track(self, messages, stream=True) as call:
+            async for delta in astream_with_resilience(
+                self,
+                lambda: self._governed_stream(messages, temperature, max_tokens, **kwargs)
+            ):
+                call.add_delta(delta)
+                yield delta
+    
+    async def _governed_stream(self, messages: List[ChatMessage], temperature: float, max_tokens: int, **kwargs) -> AsyncIterator[str]:
+        async with llm_governor.alimit(self, messages, max_tokens):
+            async for delta in self._stream_chat(messages, temperature, max_tokens, **kwargs):
+                yield delta
+    
+    async def _stream_chat(
+        self,
+        messages: List[ChatMessage],
+        temperature: float,
+        max_tokens: int,
+        **kwargs
+    ) -> AsyncIterator[str]:
+        """实际的流式调用，默认退化为一次性返回完整内容"""
+        response = await self._chat(messages, temperature, max_tokens, **kwargs)
+        if response.content:
+            yield response.content
+    
+    @abstractmethod
+    def is_available(self) -> bool:
+        """检查客户端是否可用"""
+        pass
+    
+    async def aclose(self):
+        """释放底层连接"""
+        pass
+    
+    async def __aenter__(self):
+        return self
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.aclose()
+
+
+class AsyncOpenAIClient(AsyncBaseLLMClient):
+    """
+    OpenAI SDK 异步客户端
+    用于 OpenAI 官方服务
+    """
+    
+    def __init__(self, api_key: str, api_base: str, model: str, **kwargs):
+        super().__init__(api_key, api_base, model, **kwargs)
+        self.client = None
+        self._init_client()
+    
+    def _init_client(self):
+        """初始化 AsyncOpenAI 客户端"""
+        try:
+            from openai import AsyncOpenAI
+            self.client = AsyncOpenAI(
+                api_key=self.api_key,
+                base_url=self.api_base,
+                http_client=build_async_http_client(self.extra_params)
+            )
+        except ImportError:
+            self.client = None
+    
+    def is_available(self) -> bool:
+        """检查 OpenAI SDK 是否可用"""
+        return self.client is not None and bool(self.api_key)
+    
+    async def _chat(
+        self,
+        messages: List[ChatMessage],
+        temperature: float = 0.7,
+        max_tokens: int = 4000,
+        **kwargs
+    ) -> ChatResponse:
+        """使用 AsyncOpenAI 进行聊天补全"""
+        if not self.is_available():
+            raise RuntimeError("OpenAI SDK 不可用或未配置 API Key")
+        
+        api_messages = [{"role": msg.role, "content": msg.content} for msg in messages]
+        
+        response = await self.client.chat.completions.create(
+            model=self.model,
+            messages=api_messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            **kwargs
+        )
+        
+        content = response.choices[0].message.content.strip()
+        usage = None
+        if response.usage:
+            usage = {
+                "prompt_tokens": response.usage.prompt_tokens,
+                "completion_tokens": response.usage.completion_tokens,
+                "total_tokens": response.usage.total_tokens
+            }
+        
+        return ChatResponse(
+            content=content,
+            model=response.model,
+            usage=usage,
+            raw_response=response
+        )
+    
+    async def _stream_chat(
+        self,
+        messages: List[ChatMessage],
+        temperature: float = 0.7,
+        max_tokens: int = 4000,
+        **kwargs
+    ) -> AsyncIterator[str]:
+        """使用 AsyncOpenAI 进行流式聊天补全"""
+        if not self.is_available():
+            raise RuntimeError("OpenAI SDK 不可用或未配置 API Key")
+        
+        api_messages = [{"role": msg.role, "content": msg.content} for msg in messages]
+        
+        stream = await self.client.chat.completions.create(
+            model=self.model,
+            messages=api_messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            stream=True,
+            **kwargs
+        )
+        try:
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    yield delta
+        finally:
+            await stream.close()
+    
+    async def aclose(self):
+        """关闭 AsyncOpenAI 客户端"""
+        if self.client:
+            try:
+                await self.client.close()
+            except Exception:
+                pass
+
+
+class AsyncHTTPXClient(OpenAICompatibleMixin, AsyncBaseLLMClient):
+    """
+    HTTPX 异步客户端
+    用于其他兼容 OpenAI API 格式的服务
+    """
+    
+    def __init__(self, api_key: str, api_base: str, model: str, **kwargs):
+        super().__init__(api_key, api_base, model, **kwargs)
+        self.client = build_async_http_client(self.extra_params)
+    
+    def is_available(self) -> bool:
+        """检查 HTTPX 是否可用"""
+        return self.client is not None and bool(self.api_key)
+    
+    async def _chat(
+        self,
+        messages: List[ChatMessage],
+        temperature: float = 0.7,
+        max_tokens: int = 4000,
+        **kwargs
+    ) -> ChatResponse:
+        """使用 httpx.AsyncClient 进行聊天补全"""
+        if not self.is_available():
+            raise RuntimeError("HTTPX 不可用或未配置 API Key")
+        
+        endpoint, headers, payload = self._build_request(messages, temperature, max_tokens, **kwargs)
+        
+        response = await self.client.post(endpoint, headers=headers, json=payload)
+        response.raise_for_status()
+        
+        return self._parse_chat_result(response.json())
+    
+    async def _stream_chat(
+        self,
+        messages: List[ChatMessage],
+        temperature: float = 0.7,
+        max_tokens: int = 4000,
+        **kwargs
+    ) -> AsyncIterator[str]:
+        """使用 httpx.AsyncClient 进行流式聊天补全"""
+        if not self.is_available():
+            raise RuntimeError("HTTPX 不可用或未配置 API Key")
+        
+        endpoint, headers, payload = self._build_request(messages, temperature, max_tokens, **kwargs)
+        payload["stream"] = True
+        headers["Accept"] = "text/event-stream"
+        
+        async with self.client.stream("POST", endpoint, headers=headers, json=payload) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                delta = self._parse_stream_line(line)
+                if delta is None:
+                    break
+                if delta:
+                    yield delta
+    
+    async def aclose(self):
+        """关闭 httpx.AsyncClient"""
+        if self.client:
+            try:
+                await self.client.aclose()
+            except Exception:
+                pass
+
+
+class AsyncAnthropicClient(AnthropicMessagesMixin, AsyncHTTPXClient):
+    """
+    Anthropic Claude 异步客户端
+    使用原生 Messages API，支持流式输出与提示词缓存
+    """
+    pass
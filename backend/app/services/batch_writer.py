@@ -0,0 +1,186 @@
+"""
+后台批量写入器
+
+调用方只把行数据放入内存队列，由后台线程攒批后一次 executemany 写入：
+- 不占用请求线程，也不与请求共享数据库会话和事务
+- 每 flush_interval 秒写入一次队列中的数据；积压达到 batch_size 行时提前写入
+- 队列满时最多等待 block_timeout 秒（背压），仍满则丢弃新数据并计数，数据库故障不会拖慢业务请求
+- on_batch 钩子在写入同一事务内执行，可补全行数据或同步更新关联的统计
+- 进程退出时写入队列中剩余的数据
+"""
+import queue
+import atexit
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy import insert
+
+
+class BatchWriter:
+    """
+    后台批量写入器
+    
+    用法：
+        writer = BatchWriter('llm_call_log', lambda: LLMCallLog.__table__)
+        writer.init_app(app)
+        writer.write({...})
+    
+    同一写入器的所有行需包含相同的列，未绑定应用前 write() 直接丢弃
+    """
+    
+    def __init__(
+        self,
+        name: str,
+        table_loader: Callable[[], Any],
+        batch_size: int = 200,
+        flush_interval: float = 2.0,
+        max_queue: int = 10000,
+        block_timeout: float = 0,
+        on_batch: Callable[[Any, List[Dict[str, Any]]], None] = None
+    ):
+        """
+        Args:
+            name: 写入器名称，用于日志和线程名
+            table_loader: 返回目标 Table 的函数（延迟导入模型，避免循环依赖）
+            batch_size: 每批最多写入行数
+            flush_interval: 最长攒批时间（秒）
+            max_queue: 内存队列上限
+            block_timeout: 队列满时 write() 等待空位的最长时间（秒），0 表示直接丢弃
+            on_batch: 每批插入前在同一事务内调用 on_batch(conn, rows)，异常时整批回滚
+        """
+        self.name = name
+        self.table_loader = table_loader
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.block_timeout = block_timeout
+        self.on_batch = on_batch
+        self.app = None
+        self._queue: 'queue.Queue[Dict[str, Any]]' = queue.Queue(maxsize=max_queue)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._write_lock = threading.Lock()
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self._reported_dropped = 0
+    
+    def init_app(
+        self,
+        app,
+        batch_size: int = None,
+        flush_interval: float = None,
+        max_queue: int = None,
+        block_timeout: float = None
+    ):
+        """绑定应用（写入时需要应用上下文获取数据库引擎）"""
+        self.app = app
+        if batch_size:
+            self.batch_size = batch_size
+        if flush_interval:
+            self.flush_interval = flush_interval
+        if max_queue:
+            self._queue.maxsize = max_queue
+        if block_timeout is not None:
+            self.block_timeout = block_timeout
+        atexit.register(self.flush)
+    
+    def write(self, row: Dict[str, Any]) -> bool:
+        """
+        放入一行数据，立即返回
+        
+        Returns:
+            是否成功入队（未绑定应用或队列已满时返回 False）
+        """
+        if self.app is None:
+            return False
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            if not self._put_blocking(row):
+                self.dropped += 1
+                return False
+        self._ensure_thread()
+        if self._queue.qsize() >= self.batch_size:
+            self._wakeup.set()
+        return True
+    
+    def flush(self):
+        """同步写入队列中的全部数据（进程退出或需要立即落库时调用）"""
+        while True:
+            rows = self._take(self.batch_size)
+            if not rows:
+                return
+            self._write_batch(rows)
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'name': self.name,
+            'queued': self._queue.qsize(),
+            'written': self.written,
+            'dropped': self.dropped,
+            'failed': self.failed
+        }
+    
+    def _put_blocking(self, row: Dict[str, Any]) -> bool:
+        """背压：唤醒后台线程立即写入，并在 block_timeout 内等待队列空位"""
+        if self.block_timeout <= 0:
+            return False
+        self._ensure_thread()
+        self._wakeup.set()
+        try:
+            self._queue.put(row, timeout=self.block_timeout)
+        except queue.Full:
+            return False
+        return True
+    
+    def _ensure_thread(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run,
+                    name=f'batch-writer-{self.name}',
+                    daemon=True
+                )
+                self._thread.start()
+    
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+            self._report_dropped()
+    
+    def _report_dropped(self):
+        """丢弃数量有增长时记录一条告警（每个攒批周期最多一条）"""
+        dropped = self.dropped
+        if dropped > self._reported_dropped:
+            self.app.logger.warning(f'{self.name} 写入队列已满，丢弃 {dropped - self._reported_dropped} 行（累计 {dropped} 行）')
+            self._reported_dropped = dropped
+    
+    def _take(self, limit: int) -> List[Dict[str, Any]]:
+        """从队列取出最多 limit 行（数据在写入前一直留在队列中，flush() 可随时写出）"""
+        rows = []
+        while len(rows) < limit:
+            try:
+                rows.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return rows
+    
+    def _write_batch(self, rows: List[Dict[str, Any]]):
+        """使用独立连接一次 executemany 写入，失败时记录日志并丢弃该批"""
+        from app import db
+        
+        with self._write_lock, self.app.app_context():
+            try:
+                with db.engine.begin() as conn:
+                    if self.on_batch is not None:
+                        self.on_batch(conn, rows)
+                    conn.execute(insert(self.table_loader()), rows)
+                self.written += len(rows)
+            except Exception as e:
+                self.failed += len(rows)
+                self.app.logger.error(f'批量写入 {self.name} 失败（丢弃 {len(rows)} 行）: {str(e)}')
@@ -0,0 +1,119 @@
+"""
+AI助手会话记忆
+
+发送给模型的历史 = 滚动摘要 + 摘要之后的最近消息：
+- 最近消息通过 (session_id, created_at) 索引倒序 LIMIT 读取，不随会话变长而变慢
+- 摘要之后的消息超过 CHAT_HISTORY_WINDOW + CHAT_SUMMARY_BATCH 条时，
+  把除最近 CHAT_HISTORY_WINDOW 条以外的消息连同旧摘要压缩为新摘要（后台任务执行）
+"""
+from typing import List, Optional, Tuple
+
+from flask import current_app
+
+from app import db
+from app.models import ChatMessage, ChatSessionSummary
+from app.services.llm_clients import ChatMessage as LLMChatMessage
+
+# 摘要调用的输出上限
+SUMMARY_MAX_TOKENS = 1000
+
+SUMMARY_SYSTEM_PROMPT = """你负责压缩AI助手与用户的对话历史。
+请把【已有摘要】和【新增对话】合并为一份新的摘要，要求：
+- 保留用户的目标、偏好、已确认的事实和数据、得出的结论以及未解决的问题
+- 省略寒暄和重复内容，不要编造对话中没有的信息
+- 使用第三人称、条目式中文，不超过 800 字
+只输出摘要内容。"""
+
+
+def history_window() -> int:
+    return current_app.config.get('CHAT_HISTORY_WINDOW', 10)
+
+
+def summary_batch() -> int:
+    return current_app.config.get('CHAT_SUMMARY_BATCH', 10)
+
+
+def load_history(session) -> Tuple[Optional[ChatSessionSummary], List[ChatMessage], bool]:
+    """
+    读取发送给模型的会话历史
+    
+    Returns:
+        (摘要, 摘要之后的最近消息（按时间正序）, 是否需要压缩摘要)
+    """
+    summary = session.summary
+    last_message_id = summary.last_message_id if summary else 0
+    limit = history_window() + summary_batch() + 1
+    
+    recent = ChatMessage.query.filter(
+        ChatMessage.session_id == session.id,
+        ChatMessage.id > last_message_id
+    ).order_by(
+        ChatMessage.created_at.desc(),
+        ChatMessage.id.desc()
+    ).limit(limit).all()
+    recent.reverse()
+    
+    return summary, recent, len(recent) >= limit
+
+
+def build_history_messages(session) -> Tuple[List[LLMChatMessage], bool]:
+    """
+    构建历史消息列表：摘要作为 system 消息放在最近消息之前
+    
+    Returns:
+        (消息列表, 是否需要压缩摘要)
+    """
+    summary, recent, needs_summary = load_history(session)
+    messages = []
+    if summary and summary.content:
+        messages.append(LLMChatMessage(role="system", content=f"以下是本会话较早对话的摘要：\n{summary.content}"))
+    messages.extend(LLMChatMessage(role=m.role, content=m.content) for m in recent)
+    return messages, needs_summary
+
+
+def summarize_session(session, ai_service) -> Optional[ChatSessionSummary]:
+    """
+    把摘要之后、最近 CHAT_HISTORY_WINDOW 条以前的消息压缩进滚动摘要
+    
+    Returns:
+        更新后的摘要；没有需要压缩的消息时返回 None
+    """
+    summary = session.summary
+    last_message_id = summary.last_message_id if summary else 0
+    
+    # 积压较多时分多次压缩，单次提示词有上限
+    pending = ChatMessage.query.filter(
+        ChatMessage.session_id == session.id,
+        ChatMessage.id > last_message_id
+    ).order_by(
+        ChatMessage.created_at.asc(),
+        ChatMessage.id.asc()
+    ).limit(history_window() + summary_batch() * 3).all()
+    to_summarize = pending[:-history_window()] if len(pending) > history_window() else []
+    if not to_summarize:
+        return None
+    
+    dialogue = '\n'.join(
+        f"{'用户' if m.role == 'user' else 'AI助手'}: {m.content}" for m in to_summarize
+    )
+    response = ai_service.chat(
+        [
+            LLMChatMessage(role="system", content=SUMMARY_SYSTEM_PROMPT),
+            LLMChatMessage(
+                role="user",
+                content=f"【已有摘要】\n{summary.content if summary else '无'}\n\n【新增对话】\n{dialogue}"
+            )
+        ],
+        feature='summary',
+        temperature=0.3,
+        max_tokens=SUMMARY_MAX_TOKENS
+    )
+    
+    if summary is None:
+        summary = ChatSessionSummary(session_id=session.id, message_count=0)
+        db.session.add(summary)
+    summary.content = response.content
+    summary.last_message_id = to_summarize[-1].id
+    summary.message_count = (summary.message_count or 0) + len(to_summarize)
+    db.session.commit()
+    return summary
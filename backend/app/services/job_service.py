@@ -0,0 +1,267 @@
+"""
+后台任务服务
+
+基于数据库任务表 + 进程内线程池：
+- 提交任务时先写入 jobs 表（queued），再投递到线程池执行
+- 工作线程通过条件更新 queued -> running 抢占任务，多进程部署时同一任务只会执行一次
+- 任务执行与 HTTP 请求生命周期无关，请求结束后继续运行
+- 服务进程启动时（python run.py，或 flask resume-jobs 单独执行）恢复未完成的任务，
+  其他 WSGI 服务器下在首个请求到达时恢复
+- 运行中的任务每 JOB_HEARTBEAT_INTERVAL 秒刷新一次 updated_at，
+  超过 JOB_STALE_SECONDS 未刷新才视为所在进程已退出，避免其他进程中仍在运行的任务被重复执行
+- 中断的任务累计执行 JOB_MAX_ATTEMPTS 次后不再恢复，直接标记为失败，避免导致进程退出的任务无限重试
+"""
+import json
+import asyncio
+import inspect
+import threading
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from sqlalchemy import update
+from flask import current_app
+
+from app import db
+from app.models import Job
+
+
+class JobContext:
+    """传递给任务处理函数的上下文，用于上报进度"""
+    
+    def __init__(self, job_id: int, user_id: Optional[int] = None):
+        self.job_id = job_id
+        self.user_id = user_id
+    
+    def set_progress(self, progress: int):
+        """
+        更新任务进度（0-100）
+        使用独立连接提交，不影响处理函数自身的数据库事务
+        """
+        progress = max(0, min(100, int(progress)))
+        with db.engine.begin() as conn:
+            conn.execute(
+                update(Job.__table__)
+                .where(Job.__table__.c.id == self.job_id)
+                .values(progress=progress, updated_at=datetime.utcnow())
+            )
+
+
+class JobManager:
+    """
+    后台任务管理器
+    
+    处理函数通过 @job_manager.handler('类型') 注册，签名为 fn(params, ctx)，
+    可以是普通函数或协程函数，返回值需可 JSON 序列化，作为任务结果保存。
+    """
+    
+    def __init__(self):
+        self.app = None
+        self._handlers: Dict[str, Callable] = {}
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._resumed = False
+        # 本进程正在执行的任务，由心跳线程定期刷新 updated_at
+        self._running = set()
+        self._heartbeat: Optional[threading.Thread] = None
+    
+    def init_app(self, app):
+        """绑定应用；未在启动时调用 start() 的部署方式下，首个请求到达时恢复未完成的任务"""
+        self.app = app
+        app.extensions['job_manager'] = self
+        
+        @app.before_request
+        def _resume_jobs_once():
+            if not self._resumed:
+                self.resume_pending()
+    
+    def start(self):
+        """服务进程启动时调用：立即恢复未完成的任务，不必等待首个请求"""
+        with self.app.app_context():
+            self.resume_pending()
+    
+    def wait(self):
+        """等待本进程已投递的任务全部执行完毕（flask resume-jobs 使用）"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+    
+    def handler(self, job_type: str):
+        """注册任务处理函数的装饰器"""
+        def decorator(fn):
+            self._handlers[job_type] = fn
+            return fn
+        return decorator
+    
+    def submit(self, job_type: str, params: Dict[str, Any], user_id: Optional[int] = None) -> Job:
+        """
+        提交后台任务
+        
+        Args:
+            job_type: 任务类型，需已注册处理函数
+            params: 任务参数，需可 JSON 序列化
+            user_id: 提交用户ID
+        
+        Returns:
+            已入库的 Job 对象
+        """
+        if job_type not in self._handlers:
+            raise ValueError(f'未注册的任务类型: {job_type}')
+        
+        job = Job(
+            job_type=job_type,
+            status='queued',
+            progress=0,
+            params=json.dumps(params, ensure_ascii=False),
+            user_id=user_id
+        )
+        db.session.add(job)
+        db.session.commit()
+        self._enqueue(job.id)
+        return job
+    
+    def resume_pending(self) -> int:
+        """
+        恢复未完成的任务（每个进程只执行一次）
+        - queued: 重新投递
+        - running 且超过 JOB_STALE_SECONDS 没有心跳: 视为所在进程已退出，重置为 queued 后投递；
+          已执行 JOB_MAX_ATTEMPTS 次的直接标记为 failed
+        
+        Returns:
+            投递的任务数
+        """
+        with self._lock:
+            if self._resumed:
+                return 0
+            self._resumed = True
+        
+        now = datetime.utcnow()
+        stale_before = now - timedelta(seconds=self.app.config.get('JOB_STALE_SECONDS', 600))
+        max_attempts = self.app.config.get('JOB_MAX_ATTEMPTS', 3)
+        try:
+            stale = Job.query.filter(Job.status == 'running', Job.updated_at < stale_before)
+            exhausted = stale.filter(Job.attempts >= max_attempts).update({
+                'status': 'failed',
+                'error': f'任务执行中断 {max_attempts} 次，不再重试',
+                'finished_at': now,
+                'updated_at': now
+            }, synchronize_session=False)
+            stale.update({'status': 'queued'}, synchronize_session=False)
+            db.session.commit()
+            if exhausted:
+                current_app.logger.warning(f'{exhausted} 个后台任务中断次数达到上限，已标记为失败')
+            
+            pending_ids = [
+                job_id for (job_id,) in db.session.query(Job.id)
+                .filter(Job.status == 'queued')
+                .order_by(Job.created_at)
+                .all()
+            ]
+        except Exception as e:
+            db.session.rollback()
+            current_app.logger.error(f'恢复后台任务失败: {str(e)}')
+            return 0
+        
+        for job_id in pending_ids:
+            self._enqueue(job_id)
+        if pending_ids:
+            current_app.logger.info(f'已恢复 {len(pending_ids)} 个后台任务')
+        return len(pending_ids)
+    
+    def _enqueue(self, job_id: int):
+        self._get_executor().submit(self._execute, job_id)
+    
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.app.config.get('JOB_WORKERS', 4),
+                    thread_name_prefix='job-worker'
+                )
+            if self._heartbeat is None or not self._heartbeat.is_alive():
+                self._heartbeat = threading.Thread(target=self._run_heartbeat, name='job-heartbeat', daemon=True)
+                self._heartbeat.start()
+            return self._executor
+    
+    def _run_heartbeat(self):
+        """定期刷新本进程运行中任务的 updated_at"""
+        interval = self.app.config.get('JOB_HEARTBEAT_INTERVAL', 30)
+        stop = threading.Event()
+        while not stop.wait(interval):
+            with self._lock:
+                job_ids = list(self._running)
+            if not job_ids:
+                continue
+            try:
+                with self.app.app_context(), db.engine.begin() as conn:
+                    conn.execute(
+                        update(Job.__table__)
+                        .where(Job.__table__.c.id.in_(job_ids), Job.__table__.c.status == 'running')
+                        .values(updated_at=datetime.utcnow())
+                    )
+            except Exception as e:
+                self.app.logger.error(f'后台任务心跳更新失败: {str(e)}')
+    
+    def _execute(self, job_id: int):
+        """在工作线程中执行任务"""
+        with self.app.app_context():
+            try:
+                now = datetime.utcnow()
+                # 条件更新抢占任务，避免重复执行
+                claimed = Job.query.filter(
+                    Job.id == job_id,
+                    Job.status == 'queued'
+                ).update({
+                    'status': 'running',
+                    'started_at': now,
+                    'updated_at': now,
+                    'attempts': Job.attempts + 1
+                }, synchronize_session=False)
+                db.session.commit()
+                if not claimed:
+                    return
+                with self._lock:
+                    self._running.add(job_id)
+                
+                job = db.session.get(Job, job_id)
+                job_type = job.job_type
+                handler = self._handlers.get(job_type)
+                try:
+                    if handler is None:
+                        raise RuntimeError(f'未注册的任务类型: {job_type}')
+                    params = json.loads(job.params) if job.params else {}
+                    ctx = JobContext(job_id, job.user_id)
+                    if inspect.iscoroutinefunction(handler):
+                        result = asyncio.run(handler(params, ctx))
+                    else:
+                        result = handler(params, ctx)
+                except Exception as e:
+                    db.session.rollback()
+                    current_app.logger.error(f'后台任务执行失败 (job_id={job_id}, type={job_type}): {str(e)}')
+                    self._finish(job_id, 'failed', error=str(e))
+                else:
+                    self._finish(job_id, 'succeeded', result=result)
+            except Exception as e:
+                current_app.logger.error(f'后台任务调度异常 (job_id={job_id}): {str(e)}')
+            finally:
+                with self._lock:
+                    self._running.discard(job_id)
+                db.session.remove()
+    
+    def _finish(self, job_id: int, status: str, result: Any = None, error: str = None):
+        """记录任务结束状态"""
+        values = {
+            'status': status,
+            'error': error,
+            'finished_at': datetime.utcnow(),
+            'updated_at': datetime.utcnow()
+        }
+        if status == 'succeeded':
+            values['progress'] = 100
+            values['result'] = json.dumps(result, ensure_ascii=False, default=str)
+        Job.query.filter(Job.id == job_id).update(values, synchronize_session=False)
+        db.session.commit()
+
+
+job_manager = JobManager()
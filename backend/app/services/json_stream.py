@@ -0,0 +1,114 @@
+"""
+流式 JSON 数组解析
+
+大模型按片段返回 JSON 数组时，逐个产出已闭合的数组元素：
+- 忽略数组前的说明文字和 ``` 代码块标记
+- 每个元素闭合后立即解析产出，无需等待完整响应
+- 输出被截断时，已闭合的元素依然有效，只丢弃最后不完整的元素
+"""
+import json
+from typing import Any, List
+
+
+class JSONArrayStreamParser:
+    """
+    增量解析顶层 JSON 数组
+    
+    用法：
+        parser = JSONArrayStreamParser()
+        for delta in stream:
+            for item in parser.feed(delta):
+                ...
+        parser.closed  # 是否读到了数组结尾
+    """
+    
+    def __init__(self):
+        self.started = False     # 是否已读到顶层 '['
+        self.closed = False      # 是否已读到顶层 ']'
+        self.errors = 0          # 无法解析而被跳过的元素数
+        self._buffer: List[str] = []
+        self._depth = 0          # 当前元素内的嵌套深度
+        self._in_string = False
+        self._escape = False
+    
+    @property
+    def pending(self) -> bool:
+        """是否有未闭合的元素（流结束时为 True 说明输出被截断）"""
+        return bool(self._buffer)
+    
+    def feed(self, text: str) -> List[Any]:
+        """
+        输入一段文本，返回本段内闭合的元素列表
+        
+        Args:
+            text: 增量文本
+        
+        Returns:
+            已解析的元素（解析失败的元素被跳过并计入 errors）
+        """
+        items = []
+        for ch in text:
+            if self.closed:
+                break
+            if not self.started:
+                if ch == '[':
+                    self.started = True
+                continue
+            
+            if not self._buffer:
+                # 元素之间：跳过分隔符，遇到 ']' 表示数组结束
+                if ch == ']':
+                    self.closed = True
+                elif ch not in ', \t\r\n':
+                    self._start_element(ch)
+                continue
+            
+            if self._depth == 0 and not self._in_string and ch in ',]':
+                # 标量元素在分隔符处结束
+                self._emit(items)
+                if ch == ']':
+                    self.closed = True
+                continue
+            
+            self._buffer.append(ch)
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == '\\':
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                continue
+            
+            if ch == '"':
+                self._in_string = True
+            elif ch in '{[':
+                self._depth += 1
+            elif ch in '}]':
+                self._depth -= 1
+                if self._depth == 0:
+                    self._emit(items)
+        return items
+    
+    def _start_element(self, ch: str):
+        self._buffer = [ch]
+        self._depth = 1 if ch in '{[' else 0
+        self._in_string = ch == '"'
+        self._escape = False
+    
+    def _emit(self, items: List[Any]):
+        raw = ''.join(self._buffer).strip()
+        self._buffer = []
+        self._depth = 0
+        self._in_string = False
+        if not raw:
+            return
+        try:
+            items.append(json.loads(raw))
+        except json.JSONDecodeError:
+            self.errors += 1
+
+
+def parse_json_array_items(content: str) -> List[Any]:
+    """从可能被截断的 JSON 数组文本中取出所有完整的元素"""
+    return JSONArrayStreamParser().feed(content)
@@ -0,0 +1,228 @@
+"""
+知识库检索
+
+知识库内容在保存时切分为分块并记录词项频次（knowledge_chunks），
+生成、评审和对话时只注入与需求/问题最相关的 top-k 分块，提示词大小不随知识库增长：
+- 分词：英文数字按单词，中文按相邻两字（bigram），无需分词词典
+- 检索：BM25，倒排索引按知识库缓存在进程内，知识库更新后按 updated_at 自动失效
+"""
+import re
+import math
+import threading
+from collections import Counter, OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from flask import current_app
+
+from app import db
+from app.models import Knowledge, KnowledgeChunk
+from app.services.prompt_budget import count_tokens, token_prefix_length
+
+# BM25 参数
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+_WORD_RE = re.compile(r'[a-z0-9_]+|[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+')
+_PARAGRAPH_RE = re.compile(r'\n\s*\n')
+_SENTENCE_RE = re.compile(r'(?<=[。！？；!?;\n])')
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    """分词：英文数字按单词，连续中文切为相邻两字的 bigram（单个汉字保留为一个词项）"""
+    terms = []
+    for match in _WORD_RE.finditer((text or '').lower()):
+        word = match.group()
+        if word.isascii() or len(word) == 1:
+            terms.append(word)
+        else:
+            terms.extend(word[i:i + 2] for i in range(len(word) - 1))
+    return terms
+
+
+def split_chunks(text: str, max_tokens: int) -> List[str]:
+    """
+    按段落切分文本，相邻短段落合并，每块不超过 max_tokens
+    
+    超长段落按句子切分，超长句子按长度硬切
+    """
+    pieces = []
+    for paragraph in _PARAGRAPH_RE.split(text or ''):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if count_tokens(paragraph) <= max_tokens:
+            pieces.append(paragraph)
+            continue
+        for sentence in _SENTENCE_RE.split(paragraph):
+            sentence = sentence.strip()
+            while count_tokens(sentence) > max_tokens:
+                cut = max(token_prefix_length(sentence, max_tokens), 1)
+                pieces.append(sentence[:cut])
+                sentence = sentence[cut:].strip()
+            if sentence:
+                pieces.append(sentence)
+    
+    chunks, current, used = [], [], 0
+    for piece in pieces:
+        tokens = count_tokens(piece)
+        if current and used + tokens > max_tokens:
+            chunks.append('\n'.join(current))
+            current, used = [], 0
+        current.append(piece)
+        used += tokens
+    if current:
+        chunks.append('\n'.join(current))
+    return chunks
+
+
+def index_knowledge(knowledge: Knowledge):
+    """
+    重建知识库的分块（需在同一事务内提交）
+    
+    调用方在保存知识库内容后调用，新建的知识库需先 flush 获得 ID
+    """
+    KnowledgeChunk.query.filter_by(knowledge_id=knowledge.id).delete(synchronize_session=False)
+    max_tokens = current_app.config.get('KNOWLEDGE_CHUNK_TOKENS', 400)
+    for i, content in enumerate(split_chunks(knowledge.content, max_tokens)):
+        terms = Counter(tokenize(content))
+        db.session.add(KnowledgeChunk(
+            knowledge_id=knowledge.id,
+            chunk_index=i,
+            content=content,
+            term_count=sum(terms.values()),
+            terms=dict(terms)
+        ))
+    knowledge_index.invalidate(knowledge.id)
+
+
+class _DocumentIndex:
+    """单个知识库的倒排索引"""
+    
+    def __init__(self, version: str, chunks: List[KnowledgeChunk]):
+        self.version = version
+        self.contents = [chunk.content for chunk in chunks]
+        self.lengths = [chunk.term_count or 0 for chunk in chunks]
+        # 词项 -> [(分块序号, 词频)]
+        self.postings: Dict[str, List[Tuple[int, int]]] = {}
+        for position, chunk in enumerate(chunks):
+            for term, tf in (chunk.terms or {}).items():
+                self.postings.setdefault(term, []).append((position, tf))
+
+
+class KnowledgeIndex:
+    """
+    知识库 BM25 检索
+    
+    用法：
+        contents = knowledge_index.retrieve([1, 2], '用户登录需求……')
+    
+    IDF 与平均文档长度按本次选中的知识库合并计算，与单独建一个合并索引的结果一致
+    """
+    
+    def __init__(self, max_documents: int = 256):
+        self.max_documents = max_documents
+        self._documents: 'OrderedDict[int, _DocumentIndex]' = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def invalidate(self, knowledge_id: int):
+        with self._lock:
+            self._documents.pop(knowledge_id, None)
+    
+    def retrieve(self, knowledge_ids: List[int], query: str, top_k: int = None, max_tokens: int = None) -> List[str]:
+        """
+        检索与 query 最相关的分块
+        
+        Args:
+            knowledge_ids: 选中的知识库ID（只检索启用的知识库）
+            query: 需求内容或用户问题
+            top_k: 最多返回分块数，默认 KNOWLEDGE_TOP_K
+            max_tokens: 返回分块的 token 上限，默认 KNOWLEDGE_MAX_TOKENS
+        
+        Returns:
+            每个命中知识库一项，内容为按原文顺序拼接的命中分块；无命中时取各知识库开头的分块
+        """
+        top_k = top_k or current_app.config.get('KNOWLEDGE_TOP_K', 6)
+        max_tokens = max_tokens or current_app.config.get('KNOWLEDGE_MAX_TOKENS', 3000)
+        
+        knowledges = Knowledge.query.filter(
+            Knowledge.id.in_(knowledge_ids),
+            Knowledge.is_active == True
+        ).all()
+        documents = [(knowledge, self._document(knowledge)) for knowledge in knowledges]
+        documents = [(knowledge, document) for knowledge, document in documents if document.contents]
+        if not documents:
+            return []
+        
+        scored = self._score(documents, tokenize(query))
+        if not scored:
+            # 没有词项命中时退化为各知识库的开头部分
+            scored = [(0.0, d, 0) for d in range(len(documents))]
+        
+        selected: Dict[int, List[int]] = {}
+        used = 0
+        for _, d, position in scored[:top_k]:
+            tokens = count_tokens(documents[d][1].contents[position])
+            if used + tokens > max_tokens and used:
+                continue
+            selected.setdefault(d, []).append(position)
+            used += tokens
+        
+        results = []
+        for d in sorted(selected):
+            knowledge, document = documents[d]
+            positions = sorted(selected[d])
+            results.append(f"【{knowledge.name}】\n" + '\n……\n'.join(document.contents[p] for p in positions))
+        return results
+    
+    def _score(self, documents: List[Tuple[Knowledge, _DocumentIndex]], terms: List[str]) -> List[Tuple[float, int, int]]:
+        """计算 BM25 得分，返回按得分降序的 (得分, 知识库序号, 分块序号)"""
+        total = sum(len(document.lengths) for _, document in documents)
+        avg_length = (sum(sum(document.lengths) for _, document in documents) / total) or 1
+        
+        scores: Dict[Tuple[int, int], float] = {}
+        for term, query_tf in Counter(terms).items():
+            df = sum(len(document.postings.get(term, ())) for _, document in documents)
+            if not df:
+                continue
+            idf = math.log((total - df + 0.5) / (df + 0.5) + 1)
+            for d, (_, document) in enumerate(documents):
+                for position, tf in document.postings.get(term, ()):
+                    norm = tf + BM25_K1 * (1 - BM25_B + BM25_B * document.lengths[position] / avg_length)
+                    key = (d, position)
+                    scores[key] = scores.get(key, 0.0) + query_tf * idf * tf * (BM25_K1 + 1) / norm
+        
+        return sorted(((score, d, p) for (d, p), score in scores.items()), key=lambda item: (-item[0], item[1], item[2]))
+    
+    def _document(self, knowledge: Knowledge) -> _DocumentIndex:
+        """获取知识库的倒排索引，未缓存或已过期时从分块表加载"""
+        version = knowledge.updated_at.isoformat() if knowledge.updated_at else ''
+        with self._lock:
+            document = self._documents.get(knowledge.id)
+            if document is not None and document.version == version:
+                self._documents.move_to_end(knowledge.id)
+                return document
+        
+        chunks = knowledge.chunks.order_by(KnowledgeChunk.chunk_index).all()
+        if not chunks and knowledge.content:
+            # 历史数据没有分块时补建
+            index_knowledge(knowledge)
+            db.session.commit()
+            chunks = knowledge.chunks.order_by(KnowledgeChunk.chunk_index).all()
+        
+        document = _DocumentIndex(version, chunks)
+        with self._lock:
+            self._documents[knowledge.id] = document
+            while len(self._documents) > self.max_documents:
+                self._documents.popitem(last=False)
+        return document
+
+
+# 全局知识库检索实例
+knowledge_index = KnowledgeIndex()
+
+
+def retrieve_knowledge(knowledge_ids: List[int], query: str) -> Optional[List[str]]:
+    """检索选中知识库中与 query 相关的内容，未选择知识库或没有内容时返回 None"""
+    if not knowledge_ids:
+        return None
+    return knowledge_index.retrieve(knowledge_ids, query) or None
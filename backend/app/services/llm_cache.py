@@ -0,0 +1,201 @@
+"""
+LLM 响应缓存
+
+位于 BaseLLMClient.chat 之下：
+- 以 (provider, api_base, model, messages, temperature, max_tokens, 其他参数) 的哈希为键
+- TTL 过期 + LRU 容量上限
+- singleflight：相同请求并发到达时只发起一次上游调用，其余请求等待共享结果
+"""
+import os
+import json
+import time
+import asyncio
+import hashlib
+import threading
+import dataclasses
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Awaitable
+
+
+class _Flight:
+    """一次进行中的上游调用"""
+    
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
+
+
+class LLMResponseCache:
+    """
+    线程安全的 LLM 响应缓存
+    """
+    
+    def __init__(self, max_size: int = 256, ttl: float = 600.0):
+        """
+        Args:
+            max_size: 最多缓存的响应条数，超出后淘汰最久未使用的条目
+            ttl: 缓存有效期（秒），<= 0 时禁用缓存
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._inflight: Dict[str, _Flight] = {}
+        self._hits = 0
+        self._misses = 0
+        self._coalesced = 0
+        self._evictions = 0
+    
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0 and self.max_size > 0
+    
+    @staticmethod
+    def make_key(
+        provider: str,
+        api_base: str,
+        model: str,
+        messages: List[Any],
+        temperature: float,
+        max_tokens: int,
+        extra: Dict[str, Any] = None
+    ) -> str:
+        """计算缓存键"""
+        payload = {
+            'provider': provider,
+            'api_base': api_base,
+            'model': model,
+            'messages': [[m.role, m.content] for m in messages],
+            'temperature': temperature,
+            'max_tokens': max_tokens,
+            'extra': extra or {}
+        }
+        raw = json.dumps(payload, ensure_ascii=False, sort_keys=True, default=str)
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+    
+    def get_or_call(self, key: str, fn: Callable[[], Any]):
+        """
+        命中缓存直接返回，否则执行 fn 并缓存结果
+        相同键的并发调用只会执行一次 fn
+        """
+        if not self.enabled:
+            return fn()
+        
+        cached, flight, leader = self._begin(key)
+        if cached is not None:
+            return cached
+        if not leader:
+            flight.event.wait()
+            return self._flight_result(flight)
+        
+        try:
+            result = fn()
+            flight.result = result
+            self._store(key, result)
+            return result
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            self._finish(key, flight)
+    
+    async def aget_or_call(self, key: str, fn: Callable[[], Awaitable[Any]]):
+        """get_or_call 的异步版本，可与同步调用方共享同一次上游请求"""
+        if not self.enabled:
+            return await fn()
+        
+        cached, flight, leader = self._begin(key)
+        if cached is not None:
+            return cached
+        if not leader:
+            # 领头请求可能位于其他线程/事件循环，在线程池中等待以免阻塞当前事件循环
+            await asyncio.to_thread(flight.event.wait)
+            return self._flight_result(flight)
+        
+        try:
+            result = await fn()
+            flight.result = result
+            self._store(key, result)
+            return result
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            self._finish(key, flight)
+    
+    def stats(self) -> Dict[str, Any]:
+        """缓存命中统计"""
+        with self._lock:
+            lookups = self._hits + self._misses + self._coalesced
+            return {
+                'enabled': self.enabled,
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'ttl': self.ttl,
+                'hits': self._hits,
+                'misses': self._misses,
+                'coalesced': self._coalesced,
+                'evictions': self._evictions,
+                'inflight': len(self._inflight),
+                'hit_rate': round((self._hits + self._coalesced) / lookups * 100, 2) if lookups else 0
+            }
+    
+    def clear(self):
+        """清空缓存（保留统计计数）"""
+        with self._lock:
+            self._entries.clear()
+    
+    def _begin(self, key: str):
+        """查找缓存或登记进行中的调用，返回 (缓存结果, flight, 是否领头)"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self._hits += 1
+                    return self._mark_cached(value), None, False
+                del self._entries[key]
+            
+            flight = self._inflight.get(key)
+            if flight is not None:
+                self._coalesced += 1
+                return None, flight, False
+            
+            flight = _Flight()
+            self._inflight[key] = flight
+            self._misses += 1
+            return None, flight, True
+    
+    def _finish(self, key: str, flight: _Flight):
+        with self._lock:
+            self._inflight.pop(key, None)
+        flight.event.set()
+    
+    def _store(self, key: str, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+    
+    def _flight_result(self, flight: _Flight):
+        if flight.error is not None:
+            raise flight.error
+        return self._mark_cached(flight.result)
+    
+    @staticmethod
+    def _mark_cached(value):
+        """返回标记为缓存命中的副本（ChatResponse.cached = True）"""
+        if dataclasses.is_dataclass(value) and hasattr(value, 'cached'):
+            return dataclasses.replace(value, cached=True)
+        return value
+
+
+# 全局响应缓存，可通过环境变量调整容量与有效期
+response_cache = LLMResponseCache(
+    max_size=int(os.getenv('LLM_CACHE_MAX_SIZE', 256)),
+    ttl=float(os.getenv('LLM_CACHE_TTL', 600))
+)
@@ -4,18 +4,95 @@ LLM 客户端工厂模式实现
 采用工厂模式管理不同的 LLM 服务商：
 - OpenAI SDK: 用于 OpenAI 官方服务
 - HTTPX: 用于其他兼容 OpenAI API 的服务（如通义千问、智谱、Moonshot、DeepSeek 等）
+- Anthropic: 使用原生 Messages API，支持提示词缓存
+
+客户端通过进程级注册表 LLMClientRegistry 按 LLMConfig.id 复用，
+底层 HTTP 连接池开启 keep-alive（安装 h2 时启用 HTTP/2），避免每次请求重新握手。
 """
 import json
+import time
+import atexit
+import hashlib
+import threading
 from abc import ABC, abstractmethod
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Callable, Tuple, Iterator
 from dataclasses import dataclass
 
+from app.services.llm_cache import response_cache
+from app.services.llm_governor import llm_governor
+from app.services.llm_resilience import RetryPolicy, call_with_resilience, stream_with_resilience
+from app.services.llm_ledger import call_ledger, on_response_headers, aon_response_headers
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+# 默认超时时间（秒），LLM 响应可能较慢
+DEFAULT_TIMEOUT = 120.0
+DEFAULT_CONNECT_TIMEOUT = 10.0
+# 被淘汰的客户端在进行中请求的最长耗时之外再保留的时间（秒）
+RETIRE_GRACE_MARGIN = 30.0
+
+
+def _http_client_options(extra_params: Dict[str, Any] = None) -> Dict[str, Any]:
+    """根据 LLMConfig.extra_params 生成 httpx 客户端参数（超时、连接池、HTTP/2）"""
+    import httpx
+    
+    extra_params = extra_params or {}
+    limits = httpx.Limits(
+        max_connections=extra_params.get('max_connections', 100),
+        max_keepalive_connections=extra_params.get('max_keepalive_connections', 20),
+        keepalive_expiry=extra_params.get('keepalive_expiry', 60.0)
+    )
+    # 连接超时单独设置较短时间，服务不可达时尽快失败并触发重试/熔断
+    timeout = httpx.Timeout(
+        extra_params.get('timeout', DEFAULT_TIMEOUT),
+        connect=extra_params.get('connect_timeout', DEFAULT_CONNECT_TIMEOUT)
+    )
+    return {
+        'http2': HTTP2_AVAILABLE,
+        'timeout': timeout,
+        'limits': limits
+    }
+
+
+def build_http_client(extra_params: Dict[str, Any] = None):
+    """
+    创建带连接池的 httpx.Client
+    
+    Args:
+        extra_params: LLMConfig.extra_params，支持 timeout / max_connections /
+            max_keepalive_connections / keepalive_expiry
+    
+    Returns:
+        httpx.Client 实例，httpx 未安装时返回 None
+    """
+    try:
+        import httpx
+    except ImportError:
+        return None
+    # 收到响应头时记录首字节时间（llm_call_log.ttfb_ms）
+    return httpx.Client(event_hooks={'response': [on_response_headers]}, **_http_client_options(extra_params))
+
+
+def build_async_http_client(extra_params: Dict[str, Any] = None):
+    """创建带连接池的 httpx.AsyncClient，参数同 build_http_client"""
+    try:
+        import httpx
+    except ImportError:
+        return None
+    return httpx.AsyncClient(event_hooks={'response': [aon_response_headers]}, **_http_client_options(extra_params))
+
 
 @dataclass
 class ChatMessage:
     """聊天消息"""
     role: str  # system, user, assistant
     content: str
+    # 是否为跨调用不变的前缀（系统提示词、知识库），支持的服务商会缓存到此为止的提示词
+    cache: bool = False
 
 
 @dataclass
@@ -25,6 +102,7 @@ class ChatResponse:
     model: str
     usage: Optional[Dict[str, int]] = None
     raw_response: Optional[Any] = None
+    cached: bool = False  # 是否来自响应缓存
 
 
 class BaseLLMClient(ABC):
@@ -46,34 +124,129 @@ class BaseLLMClient(ABC):
         self.api_key = api_key
         self.api_base = api_base
         self.model = model
+        self.provider = kwargs.pop('provider', None)
+        self.config_id = kwargs.pop('config_id', None)
         self.extra_params = kwargs
     
-    @abstractmethod
     def chat(
         self,
         messages: List[ChatMessage],
         temperature: float = 0.7,
         max_tokens: int = 4000,
+        use_cache: bool = True,
         **kwargs
     ) -> ChatResponse:
         """
         聊天补全接口
         
+        相同参数的请求会命中响应缓存，并发的相同请求只调用一次上游；
+        每次调用（含缓存命中与失败）都会记录到 llm_call_log
+        
         Args:
             messages: 消息列表
             temperature: 温度参数
             max_tokens: 最大 token 数
+            use_cache: 是否使用响应缓存，传 False 强制请求上游
             **kwargs: 其他参数
         
         Returns:
             ChatResponse 对象
         """
+        with call_ledger.track(self, messages) as call:
+            if not use_cache:
+                call.response = self._upstream_chat(messages, temperature, max_tokens, **kwargs)
+            else:
+                key = self._cache_key(messages, temperature, max_tokens, kwargs)
+                call.response = response_cache.get_or_call(
+                    key,
+                    lambda: self._upstream_chat(messages, temperature, max_tokens, **kwargs)
+                )
+            return call.response
+    
+    def _upstream_chat(self, messages: List[ChatMessage], temperature: float, max_tokens: int, **kwargs) -> ChatResponse:
+        """经熔断检查、失败重试后调用上游"""
+        return call_with_resilience(
+            self,
+            lambda: self._governed_chat(messages, temperature, max_tokens, **kwargs)
+        )
+    
+    def _governed_chat(self, messages: List[ChatMessage], temperature: float, max_tokens: int, **kwargs) -> ChatResponse:
+        """经服务商/配置维度限流后调用上游（缓存命中的请求不占用限额）"""
+        with llm_governor.limit(self, messages, max_tokens) as permit:
+            response = self._chat(messages, temperature, max_tokens, **kwargs)
+            permit.record_usage(response.usage)
+            return response
+    
+    @abstractmethod
+    def _chat(
+        self,
+        messages: List[ChatMessage],
+        temperature: float,
+        max_tokens: int,
+        **kwargs
+    ) -> ChatResponse:
+        """实际调用上游服务的聊天补全，由子类实现"""
         pass
     
+    def _cache_key(self, messages: List[ChatMessage], temperature: float, max_tokens: int, extra: Dict[str, Any]) -> str:
+        """计算响应缓存键"""
+        return response_cache.make_key(
+            self.provider, self.api_base, self.model, messages, temperature, max_tokens, extra
+        )
+    
+    def stream_chat(
+        self,
+        messages: List[ChatMessage],
+        temperature: float = 0.7,
+        max_tokens: int = 4000,
+        **kwargs
+    ) -> Iterator[str]:
+        """
+        流式聊天补全接口，逐段产出增量文本
+        
+        整个流式响应期间占用一个并发名额，尚未产出内容前失败会重试
+        
+        Args:
+            messages: 消息列表
+            temperature: 温度参数
+            max_tokens: 最大 token 数
+            **kwargs: 其他参数
+        
+        Yields:
+            增量文本片段
+        """
+        with call_ledger.track(self, messages, stream=True) as call:
+            for delta in stream_with_resilience(
+                self,
+                lambda: self._governed_stream(messages, temperature, max_tokens, **kwargs)
+            ):
+                call.add_delta(delta)
+                yield delta
+    
+    def _governed_stream(self, messages: List[ChatMessage], temperature: float, max_tokens: int, **kwargs) -> Iterator[str]:
+        with llm_governor.limit(self, messages, max_tokens):
+            yield from self._stream_chat(messages, temperature, max_tokens, **kwargs)
+    
+    def _stream_chat(
+        self,
+        messages: List[ChatMessage],
+        temperature: float,
+        max_tokens: int,
+        **kwargs
+    ) -> Iterator[str]:
+        """实际的流式调用，默认退化为一次性返回完整内容，子类应覆盖为真正的流式调用"""
+        response = self._chat(messages, temperature, max_tokens, **kwargs)
+        if response.content:
+            yield response.content
+    
     @abstractmethod
     def is_available(self) -> bool:
         """检查客户端是否可用"""
         pass
+    
+    def close(self):
+        """释放底层连接，由 LLMClientRegistry 在淘汰客户端时显式调用"""
+        pass
 
 
 class OpenAIClient(BaseLLMClient):
@@ -88,12 +261,13 @@ class OpenAIClient(BaseLLMClient):
         self._init_client()
     
     def _init_client(self):
-        """初始化 OpenAI SDK 客户端"""
+        """初始化 OpenAI SDK 客户端（复用带连接池的 httpx.Client）"""
         try:
             from openai import OpenAI
             self.client = OpenAI(
                 api_key=self.api_key,
-                base_url=self.api_base
+                base_url=self.api_base,
+                http_client=build_http_client(self.extra_params)
             )
         except ImportError:
             self.client = None
@@ -102,7 +276,15 @@ class OpenAIClient(BaseLLMClient):
         """检查 OpenAI SDK 是否可用"""
         return self.client is not None and bool(self.api_key)
     
-    def chat(
+    def close(self):
+        """关闭 OpenAI SDK 客户端"""
+        if self.client:
+            try:
+                self.client.close()
+            except Exception:
+                pass
+    
+    def _chat(
         self,
         messages: List[ChatMessage],
         temperature: float = 0.7,
@@ -140,34 +322,45 @@ class OpenAIClient(BaseLLMClient):
             usage=usage,
             raw_response=response
         )
+    
+    def _stream_chat(
+        self,
+        messages: List[ChatMessage],
+        temperature: float = 0.7,
+        max_tokens: int = 4000,
+        **kwargs
+    ) -> Iterator[str]:
+        """使用 OpenAI SDK 进行流式聊天补全"""
+        if not self.is_available():
+            raise RuntimeError("OpenAI SDK 不可用或未配置 API Key")
+        
+        api_messages = [{"role": msg.role, "content": msg.content} for msg in messages]
+        
+        stream = self.client.chat.completions.create(
+            model=self.model,
+            messages=api_messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            stream=True,
+            **kwargs
+        )
+        try:
+            for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    yield delta
+        finally:
+            stream.close()
 
 
-class HTTPXClient(BaseLLMClient):
+class OpenAICompatibleMixin:
     """
-    HTTPX 客户端
-    用于其他兼容 OpenAI API 格式的服务
-    如：通义千问、智谱AI、Moonshot、DeepSeek、Ollama 等
+    OpenAI 兼容协议的请求构建与响应解析
+    供同步 HTTPXClient 与异步 AsyncHTTPXClient 共用
     """
     
-    def __init__(self, api_key: str, api_base: str, model: str, **kwargs):
-        super().__init__(api_key, api_base, model, **kwargs)
-        self.client = None
-        self._init_client()
-    
-    def _init_client(self):
-        """初始化 HTTPX 客户端"""
-        try:
-            import httpx
-            # 设置较长的超时时间，因为 LLM 响应可能较慢
-            timeout = self.extra_params.get('timeout', 120.0)
-            self.client = httpx.Client(timeout=timeout)
-        except ImportError:
-            self.client = None
-    
-    def is_available(self) -> bool:
-        """检查 HTTPX 是否可用"""
-        return self.client is not None and bool(self.api_key)
-    
     def _get_chat_endpoint(self) -> str:
         """获取聊天补全 API 端点"""
         base = self.api_base.rstrip('/')
@@ -179,21 +372,17 @@ class HTTPXClient(BaseLLMClient):
                 return f"{base}/v1/chat/completions"
         return base
     
-    def chat(
+    def _build_request(
         self,
         messages: List[ChatMessage],
-        temperature: float = 0.7,
-        max_tokens: int = 4000,
+        temperature: float,
+        max_tokens: int,
         **kwargs
-    ) -> ChatResponse:
-        """使用 HTTPX 进行聊天补全"""
-        if not self.is_available():
-            raise RuntimeError("HTTPX 不可用或未配置 API Key")
-        
+    ) -> Tuple[str, Dict[str, str], Dict[str, Any]]:
+        """构建请求端点、请求头和请求体"""
         # 转换消息格式
         api_messages = [{"role": msg.role, "content": msg.content} for msg in messages]
         
-        # 构建请求
         endpoint = self._get_chat_endpoint()
         headers = {
             "Content-Type": "application/json",
@@ -212,13 +401,10 @@ class HTTPXClient(BaseLLMClient):
             if key not in payload:
                 payload[key] = value
         
-        # 发送请求
-        response = self.client.post(endpoint, headers=headers, json=payload)
-        response.raise_for_status()
-        
-        # 解析响应
-        result = response.json()
-        
+        return endpoint, headers, payload
+    
+    def _parse_chat_result(self, result: Dict[str, Any]) -> ChatResponse:
+        """解析非流式响应"""
         content = result["choices"][0]["message"]["content"].strip()
         usage = result.get("usage")
         
@@ -229,8 +415,95 @@ class HTTPXClient(BaseLLMClient):
             raw_response=result
         )
     
-    def __del__(self):
-        """清理资源"""
+    @staticmethod
+    def _parse_stream_line(line: str) -> Optional[str]:
+        """
+        解析一行 SSE 数据，返回增量文本
+        
+        Returns:
+            增量文本；无内容时返回空字符串；遇到 [DONE] 时返回 None
+        """
+        if not line or not line.startswith("data:"):
+            return ""
+        data = line[5:].strip()
+        if data == "[DONE]":
+            return None
+        try:
+            chunk = json.loads(data)
+        except json.JSONDecodeError:
+            return ""
+        choices = chunk.get("choices") or []
+        if not choices:
+            return ""
+        return (choices[0].get("delta") or {}).get("content") or ""
+
+
+class HTTPXClient(OpenAICompatibleMixin, BaseLLMClient):
+    """
+    HTTPX 客户端
+    用于其他兼容 OpenAI API 格式的服务
+    如：通义千问、智谱AI、Moonshot、DeepSeek、Ollama 等
+    """
+    
+    def __init__(self, api_key: str, api_base: str, model: str, **kwargs):
+        super().__init__(api_key, api_base, model, **kwargs)
+        self.client = None
+        self._init_client()
+    
+    def _init_client(self):
+        """初始化 HTTPX 客户端（长连接 + 连接池）"""
+        self.client = build_http_client(self.extra_params)
+    
+    def is_available(self) -> bool:
+        """检查 HTTPX 是否可用"""
+        return self.client is not None and bool(self.api_key)
+    
+    def _chat(
+        self,
+        messages: List[ChatMessage],
+        temperature: float = 0.7,
+        max_tokens: int = 4000,
+        **kwargs
+    ) -> ChatResponse:
+        """使用 HTTPX 进行聊天补全"""
+        if not self.is_available():
+            raise RuntimeError("HTTPX 不可用或未配置 API Key")
+        
+        endpoint, headers, payload = self._build_request(messages, temperature, max_tokens, **kwargs)
+        
+        # 发送请求
+        response = self.client.post(endpoint, headers=headers, json=payload)
+        response.raise_for_status()
+        
+        # 解析响应
+        return self._parse_chat_result(response.json())
+    
+    def _stream_chat(
+        self,
+        messages: List[ChatMessage],
+        temperature: float = 0.7,
+        max_tokens: int = 4000,
+        **kwargs
+    ) -> Iterator[str]:
+        """使用 HTTPX 进行流式聊天补全（解析 SSE 数据行）"""
+        if not self.is_available():
+            raise RuntimeError("HTTPX 不可用或未配置 API Key")
+        
+        endpoint, headers, payload = self._build_request(messages, temperature, max_tokens, **kwargs)
+        payload["stream"] = True
+        headers["Accept"] = "text/event-stream"
+        
+        with self.client.stream("POST", endpoint, headers=headers, json=payload) as response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                delta = self._parse_stream_line(line)
+                if delta is None:
+                    break
+                if delta:
+                    yield delta
+    
+    def close(self):
+        """关闭 HTTPX 客户端"""
         if self.client:
             try:
                 self.client.close()
@@ -238,6 +511,141 @@ class HTTPXClient(BaseLLMClient):
                 pass
 
 
+class AnthropicMessagesMixin:
+    """
+    Anthropic Messages API（/v1/messages）的请求构建与响应解析
+    供同步 AnthropicClient 与异步 AsyncAnthropicClient 共用
+    
+    system 消息放入顶层 system 字段；最后一条标记 cache 的消息加上 cache_control，
+    服务端缓存到此为止的前缀，后续相同前缀的调用直接复用，降低首字节耗时和输入费用。
+    可通过 LLMConfig.extra_params.prompt_caching=false 关闭。
+    """
+    
+    ANTHROPIC_VERSION = '2023-06-01'
+    
+    def _get_chat_endpoint(self) -> str:
+        """获取 Messages API 端点"""
+        base = self.api_base.rstrip('/')
+        if base.endswith('/messages'):
+            return base
+        if base.endswith('/v1'):
+            return f"{base}/messages"
+        return f"{base}/v1/messages"
+    
+    def _build_request(
+        self,
+        messages: List[ChatMessage],
+        temperature: float,
+        max_tokens: int,
+        **kwargs
+    ) -> Tuple[str, Dict[str, str], Dict[str, Any]]:
+        """构建请求端点、请求头和请求体"""
+        cache_index = -1
+        if self.extra_params.get('prompt_caching', True):
+            cache_index = max((i for i, msg in enumerate(messages) if msg.cache), default=-1)
+        
+        system = []
+        api_messages = []
+        for i, msg in enumerate(messages):
+            block = {"type": "text", "text": msg.content}
+            if i == cache_index:
+                block["cache_control"] = {"type": "ephemeral"}
+            if msg.role == "system":
+                system.append(block)
+            elif api_messages and api_messages[-1]["role"] == msg.role:
+                # 连续的同角色消息合并为一轮
+                api_messages[-1]["content"].append(block)
+            else:
+                api_messages.append({"role": msg.role, "content": [block]})
+        
+        headers = {
+            "Content-Type": "application/json",
+            "x-api-key": self.api_key,
+            "anthropic-version": self.ANTHROPIC_VERSION
+        }
+        
+        payload = {
+            "model": self.model,
+            "messages": api_messages,
+            "temperature": temperature,
+            "max_tokens": max_tokens
+        }
+        if system:
+            payload["system"] = system
+        
+        # 合并额外参数
+        for key, value in kwargs.items():
+            if key not in payload:
+                payload[key] = value
+        
+        return self._get_chat_endpoint(), headers, payload
+    
+    @staticmethod
+    def _normalize_usage(usage: Optional[Dict[str, int]]) -> Optional[Dict[str, int]]:
+        """转换为 OpenAI 格式的 usage，提示词 token 包含缓存写入与缓存命中部分"""
+        if not usage:
+            return None
+        cache_creation = usage.get("cache_creation_input_tokens") or 0
+        cache_read = usage.get("cache_read_input_tokens") or 0
+        prompt_tokens = (usage.get("input_tokens") or 0) + cache_creation + cache_read
+        completion_tokens = usage.get("output_tokens") or 0
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "cache_creation_input_tokens": cache_creation,
+            "cache_read_input_tokens": cache_read
+        }
+    
+    def _parse_chat_result(self, result: Dict[str, Any]) -> ChatResponse:
+        """解析非流式响应"""
+        content = "".join(
+            block.get("text", "") for block in result.get("content") or []
+            if block.get("type") == "text"
+        ).strip()
+        
+        return ChatResponse(
+            content=content,
+            model=result.get("model", self.model),
+            usage=self._normalize_usage(result.get("usage")),
+            raw_response=result
+        )
+    
+    @staticmethod
+    def _parse_stream_line(line: str) -> Optional[str]:
+        """
+        解析一行 SSE 数据，返回增量文本（event: 行忽略，事件类型以 data 中的 type 为准）
+        
+        Returns:
+            增量文本；无内容时返回空字符串；遇到 message_stop 时返回 None
+        """
+        if not line or not line.startswith("data:"):
+            return ""
+        try:
+            event = json.loads(line[5:].strip())
+        except json.JSONDecodeError:
+            return ""
+        event_type = event.get("type")
+        if event_type == "message_stop":
+            return None
+        if event_type == "error":
+            error = event.get("error") or {}
+            raise RuntimeError(f"Anthropic 流式响应错误: {error.get('type')}: {error.get('message')}")
+        if event_type == "content_block_delta":
+            delta = event.get("delta") or {}
+            if delta.get("type") == "text_delta":
+                return delta.get("text") or ""
+        return ""
+
+
+class AnthropicClient(AnthropicMessagesMixin, HTTPXClient):
+    """
+    Anthropic Claude 客户端
+    使用原生 Messages API，支持流式输出与提示词缓存
+    """
+    pass
+
+
 class LLMClientFactory:
     """
     LLM 客户端工厂
@@ -247,10 +655,12 @@ class LLMClientFactory:
     # OpenAI 官方服务标识
     OPENAI_PROVIDERS = {'openai'}
     
+    # 使用原生 Messages API 的服务商
+    ANTHROPIC_PROVIDERS = {'anthropic'}
+    
     # 使用 HTTPX 的服务商（兼容 OpenAI API 格式）
     HTTPX_PROVIDERS = {
         'azure',      # Azure OpenAI
-        'anthropic',  # Anthropic Claude
         'qwen',       # 通义千问
         'zhipu',      # 智谱 AI
         'moonshot',   # Moonshot AI
@@ -285,10 +695,12 @@ class LLMClientFactory:
         
         if provider_lower in cls.OPENAI_PROVIDERS:
             # 使用 OpenAI SDK
-            return OpenAIClient(api_key, api_base, model, **kwargs)
+            return OpenAIClient(api_key, api_base, model, provider=provider_lower, **kwargs)
+        elif provider_lower in cls.ANTHROPIC_PROVIDERS:
+            return AnthropicClient(api_key, api_base, model, provider=provider_lower, **kwargs)
         else:
             # 使用 HTTPX 客户端
-            return HTTPXClient(api_key, api_base, model, **kwargs)
+            return HTTPXClient(api_key, api_base, model, provider=provider_lower, **kwargs)
     
     @classmethod
     def create_from_config(cls, llm_config) -> BaseLLMClient:
@@ -301,21 +713,67 @@ class LLMClientFactory:
         Returns:
             BaseLLMClient 实例
         """
-        extra_params = {}
-        if llm_config.extra_params:
-            try:
-                extra_params = json.loads(llm_config.extra_params)
-            except (json.JSONDecodeError, TypeError):
-                pass
-        
         return cls.create(
             provider=llm_config.provider,
             api_key=llm_config.api_key,
             api_base=llm_config.api_base,
             model=llm_config.model or 'gpt-3.5-turbo',
-            **extra_params
+            config_id=llm_config.id,
+            **cls.parse_extra_params(llm_config)
         )
     
+    @classmethod
+    def create_async(
+        cls,
+        provider: str,
+        api_key: str,
+        api_base: str,
+        model: str,
+        **kwargs
+    ):
+        """
+        创建异步 LLM 客户端实例
+        
+        异步客户端绑定创建时所在的事件循环，应在单个请求内使用并通过
+        `async with` 关闭，不放入 LLMClientRegistry
+        
+        Returns:
+            AsyncBaseLLMClient 实例
+        """
+        from app.services.async_llm_clients import AsyncOpenAIClient, AsyncHTTPXClient, AsyncAnthropicClient
+        
+        provider_lower = provider.lower() if provider else 'openai'
+        
+        if provider_lower in cls.OPENAI_PROVIDERS:
+            return AsyncOpenAIClient(api_key, api_base, model, provider=provider_lower, **kwargs)
+        elif provider_lower in cls.ANTHROPIC_PROVIDERS:
+            return AsyncAnthropicClient(api_key, api_base, model, provider=provider_lower, **kwargs)
+        else:
+            return AsyncHTTPXClient(api_key, api_base, model, provider=provider_lower, **kwargs)
+    
+    @classmethod
+    def create_async_from_config(cls, llm_config):
+        """从 LLMConfig 对象创建异步客户端"""
+        return cls.create_async(
+            provider=llm_config.provider,
+            api_key=llm_config.api_key,
+            api_base=llm_config.api_base,
+            model=llm_config.model or 'gpt-3.5-turbo',
+            config_id=llm_config.id,
+            **cls.parse_extra_params(llm_config)
+        )
+    
+    @staticmethod
+    def parse_extra_params(llm_config) -> Dict[str, Any]:
+        """解析 LLMConfig.extra_params JSON，解析失败时返回空字典"""
+        extra_params = {}
+        if llm_config.extra_params:
+            try:
+                extra_params = json.loads(llm_config.extra_params)
+            except (json.JSONDecodeError, TypeError):
+                pass
+        return extra_params if isinstance(extra_params, dict) else {}
+    
     @classmethod
     def get_supported_providers(cls) -> Dict[str, str]:
         """获取支持的服务商列表"""
@@ -330,3 +788,142 @@ class LLMClientFactory:
             'anthropic': 'Anthropic (Claude)',
             'custom': '自定义兼容服务'
         }
+
+
+class LLMClientRegistry:
+    """
+    进程级 LLM 客户端注册表
+    
+    按 LLMConfig.id 复用线程安全的长连接客户端：
+    - 配置的 updated_at 或连接相关字段变化时自动重建
+    - 配置被编辑/删除时由路由显式调用 evict()
+    - 被淘汰的客户端延迟关闭，避免中断仍在进行中的请求；
+      宽限期按该客户端自己的 timeout 和重试次数计算，见 _retire_grace()
+    """
+    
+    def __init__(self, retire_margin: float = RETIRE_GRACE_MARGIN):
+        self._lock = threading.Lock()
+        self._clients: Dict[Any, Tuple[str, BaseLLMClient]] = {}
+        # (关闭时间, 客户端)
+        self._retired: List[Tuple[float, BaseLLMClient]] = []
+        self._retire_margin = retire_margin
+    
+    @staticmethod
+    def _config_version(llm_config) -> str:
+        """计算配置版本，updated_at 精度不足时仍能感知字段变化"""
+        parts = [
+            llm_config.updated_at.isoformat() if llm_config.updated_at else '',
+            llm_config.provider or '',
+            llm_config.api_base or '',
+            llm_config.api_key or '',
+            llm_config.model or '',
+            llm_config.extra_params or ''
+        ]
+        return hashlib.sha1('\x1f'.join(parts).encode('utf-8')).hexdigest()
+    
+    def get(self, llm_config) -> BaseLLMClient:
+        """
+        获取配置对应的客户端，不存在或已过期时创建
+        
+        Args:
+            llm_config: LLMConfig 数据库模型对象
+        
+        Returns:
+            BaseLLMClient 实例
+        """
+        return self._get_or_create(
+            llm_config.id,
+            self._config_version(llm_config),
+            lambda: LLMClientFactory.create_from_config(llm_config)
+        )
+    
+    def get_for_env(self, provider: str, api_key: str, api_base: str, model: str) -> BaseLLMClient:
+        """获取基于环境变量配置的客户端"""
+        key = f'env:{provider}:{api_base}:{model}'
+        version = hashlib.sha1(api_key.encode('utf-8')).hexdigest()
+        return self._get_or_create(
+            key,
+            version,
+            lambda: LLMClientFactory.create(
+                provider=provider,
+                api_key=api_key,
+                api_base=api_base,
+                model=model
+            )
+        )
+    
+    def _get_or_create(self, key, version: str, builder: Callable[[], BaseLLMClient]) -> BaseLLMClient:
+        with self._lock:
+            entry = self._clients.get(key)
+            if entry and entry[0] == version:
+                return entry[1]
+            
+            client = builder()
+            self._clients[key] = (version, client)
+            if entry:
+                self._retire(entry[1])
+            self._close_expired()
+            return client
+    
+    def evict(self, config_id) -> bool:
+        """
+        淘汰指定配置的客户端
+        
+        Args:
+            config_id: LLMConfig.id
+        
+        Returns:
+            是否存在并已淘汰
+        """
+        with self._lock:
+            entry = self._clients.pop(config_id, None)
+            if entry:
+                self._retire(entry[1])
+            self._close_expired()
+            return entry is not None
+    
+    def close_all(self):
+        """关闭所有客户端（进程退出时调用）"""
+        with self._lock:
+            clients = [client for _, client in self._clients.values()]
+            clients.extend(client for _, client in self._retired)
+            self._clients.clear()
+            self._retired.clear()
+        for client in clients:
+            client.close()
+    
+    def _retire(self, client: BaseLLMClient):
+        self._retired.append((time.monotonic() + self._retire_grace(client), client))
+    
+    def _retire_grace(self, client: BaseLLMClient) -> float:
+        """
+        淘汰客户端的宽限期：进行中的请求按该客户端的 timeout 可能持续的最长时间（含重试与退避）
+        
+        timeout 配置为 None（不超时）时不按时间关闭，只在进程退出时关闭
+        """
+        extra_params = client.extra_params or {}
+        timeout = extra_params.get('timeout', DEFAULT_TIMEOUT)
+        if timeout is None:
+            return float('inf')
+        try:
+            timeout = float(timeout)
+        except (TypeError, ValueError):
+            timeout = DEFAULT_TIMEOUT
+        policy = RetryPolicy.from_params(extra_params)
+        return policy.max_attempts * (timeout + policy.max_delay) + self._retire_margin
+    
+    def _close_expired(self):
+        """关闭已过宽限期的淘汰客户端（调用方需持有锁）"""
+        now = time.monotonic()
+        remaining = []
+        for close_at, client in self._retired:
+            if now >= close_at:
+                client.close()
+            else:
+                remaining.append((close_at, client))
+        self._retired = remaining
+
+
+# 全局客户端注册表
+client_registry = LLMClientRegistry()
+atexit.register(client_registry.close_all)
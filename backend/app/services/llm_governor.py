@@ -0,0 +1,446 @@
+"""
+LLM 调用限流与并发控制
+
+对每次上游调用按两个维度限流：
+- 服务商维度（provider:deepseek）：同一服务商的所有配置共享，限额来自环境变量 LLM_PROVIDER_LIMITS
+- 配置维度（config:<id>）：单个 LLMConfig 独享，限额来自 LLMConfig.extra_params
+
+每个维度支持：
+- rpm: 每分钟请求数（令牌桶）
+- tpm: 每分钟 token 数（令牌桶，按 提示词估算 + max_tokens 预占，响应后按实际用量校正）
+- max_in_flight: 最大并发请求数
+
+超出限额的调用排队等待，等待时间超过 max_queue_wait 秒时抛出 LLMRateLimitError。
+"""
+import os
+import json
+import time
+import asyncio
+import threading
+from collections import deque
+from contextlib import contextmanager, asynccontextmanager
+from typing import Any, Dict, List, Optional
+
+from app.services.prompt_budget import count_tokens
+
+
+class LLMRateLimitError(RuntimeError):
+    """排队等待超时"""
+    pass
+
+
+class TokenBucket:
+    """
+    线程安全的令牌桶
+    允许预占未来的令牌（余额为负），使排队的调用按到达顺序依次放行
+    """
+    
+    def __init__(self, per_minute: float):
+        self.configure(per_minute)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def configure(self, per_minute: float):
+        """调整速率（配置变更时原地更新，保留当前余额）"""
+        self.per_minute = per_minute
+        self.rate = per_minute / 60.0
+        self.capacity = per_minute
+    
+    def reserve(self, amount: float, max_wait: float) -> Optional[float]:
+        """
+        预占令牌
+        
+        Returns:
+            需要等待的秒数；等待时间超过 max_wait 时不预占并返回 None
+        """
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+            
+            # 单次请求不会超过桶容量，避免永远无法放行
+            amount = min(amount, self.capacity)
+            wait = max(0.0, (amount - self.tokens) / self.rate)
+            if wait > max_wait:
+                return None
+            self.tokens -= amount
+            return wait
+    
+    def refund(self, amount: float):
+        """归还多预占的令牌（amount 为负时补扣）"""
+        with self._lock:
+            self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class _AsyncWaiter:
+    """异步调用方的等待句柄，由释放名额的线程通过所属事件循环唤醒"""
+    
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self.future = loop.create_future()
+    
+    def wake(self):
+        if not self.future.done():
+            self.future.set_result(None)
+
+
+class InFlightLimiter:
+    """
+    可在运行时调整上限的并发计数器
+    
+    同步调用方在线程条件变量上等待，异步调用方在各自事件循环的 Future 上等待（不占用线程）。
+    释放名额只唤醒等待者，由等待者醒来后自己占用名额，被取消的调用方不会占用名额；
+    已被唤醒却放弃等待（取消，或超时且名额已被他人占用）的异步调用方把唤醒转交给下一个等待者。
+    """
+    
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.in_flight = 0
+        self._cond = threading.Condition()
+        self._async_waiters: 'deque[_AsyncWaiter]' = deque()
+    
+    def acquire(self, timeout: float) -> bool:
+        with self._cond:
+            acquired = self._cond.wait_for(lambda: self.in_flight < self.limit, timeout)
+            if acquired:
+                self.in_flight += 1
+            return acquired
+    
+    async def aacquire(self, timeout: float) -> bool:
+        """异步等待名额，超时返回 False；等待期间被取消时不占用名额"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        # 上一轮等待是否收到了释放名额的唤醒
+        notified = False
+        while True:
+            with self._cond:
+                if self.in_flight < self.limit:
+                    self.in_flight += 1
+                    return True
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    if notified:
+                        # 超时与释放同时发生且名额已被他人占用：本等待者消耗的唤醒转交给下一个等待者
+                        self._wake_one()
+                    return False
+                waiter = _AsyncWaiter(loop)
+                self._async_waiters.append(waiter)
+            
+            # 不使用 asyncio.wait_for：唤醒与取消同时发生时它会吞掉取消，使已取消的调用方继续占用名额
+            timer = loop.call_later(remaining, waiter.wake)
+            try:
+                await waiter.future
+            except BaseException:
+                self._abandon(waiter, handoff=True)
+                raise
+            finally:
+                timer.cancel()
+            # 超时唤醒时等待者仍在队列中；已不在队列中说明被释放名额唤醒过（可能与超时同时发生）
+            notified = self._abandon(waiter, handoff=False)
+    
+    def release(self):
+        with self._cond:
+            self.in_flight -= 1
+            self._wake_one()
+    
+    def _wake_one(self):
+        """唤醒一个同步等待者和一个异步等待者（需持有锁），未抢到名额的一方继续等待"""
+        self._cond.notify()
+        while self._async_waiters:
+            waiter = self._async_waiters.popleft()
+            try:
+                waiter.loop.call_soon_threadsafe(waiter.wake)
+                return
+            except RuntimeError:
+                # 等待者的事件循环已关闭
+                continue
+    
+    def _abandon(self, waiter: _AsyncWaiter, handoff: bool) -> bool:
+        """
+        移出等待队列；handoff 为 True 且已被释放名额唤醒时，把唤醒转交给下一个等待者
+        
+        Returns:
+            是否已被释放名额唤醒（已不在队列中）
+        """
+        with self._cond:
+            try:
+                self._async_waiters.remove(waiter)
+            except ValueError:
+                if handoff:
+                    self._wake_one()
+                return True
+            return False
+
+
+class _Scope:
+    """单个限流维度（服务商或配置）的限流器与指标"""
+    
+    def __init__(self, name: str):
+        self.name = name
+        self.rpm: Optional[TokenBucket] = None
+        self.tpm: Optional[TokenBucket] = None
+        self.in_flight: Optional[InFlightLimiter] = None
+        self.lock = threading.Lock()
+        
+        # 指标
+        self.requests = 0
+        self.waited = 0
+        self.rejected = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.queue_depth = 0
+        self.max_queue_depth = 0
+    
+    def apply_limits(self, limits: Dict[str, Any]):
+        """按最新配置创建或调整限流器"""
+        with self.lock:
+            self.rpm = self._bucket(self.rpm, limits.get('rpm'))
+            self.tpm = self._bucket(self.tpm, limits.get('tpm'))
+            max_in_flight = _positive(limits.get('max_in_flight'))
+            if not max_in_flight:
+                self.in_flight = None
+            elif self.in_flight is None:
+                self.in_flight = InFlightLimiter(int(max_in_flight))
+            else:
+                self.in_flight.limit = int(max_in_flight)
+    
+    @staticmethod
+    def _bucket(bucket: Optional[TokenBucket], per_minute) -> Optional[TokenBucket]:
+        per_minute = _positive(per_minute)
+        if not per_minute:
+            return None
+        if bucket is None:
+            return TokenBucket(per_minute)
+        if bucket.per_minute != per_minute:
+            bucket.configure(per_minute)
+        return bucket
+    
+    def enter_queue(self):
+        with self.lock:
+            self.requests += 1
+            self.queue_depth += 1
+            self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+    
+    def leave_queue(self, waited: Optional[float]):
+        """离开队列；waited 为 None 表示被拒绝"""
+        with self.lock:
+            self.queue_depth -= 1
+            if waited is None:
+                self.rejected += 1
+                return
+            if waited > 0.001:
+                self.waited += 1
+                self.total_wait += waited
+                self.max_wait = max(self.max_wait, waited)
+    
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                'scope': self.name,
+                'limits': {
+                    'rpm': self.rpm.per_minute if self.rpm else None,
+                    'tpm': self.tpm.per_minute if self.tpm else None,
+                    'max_in_flight': self.in_flight.limit if self.in_flight else None
+                },
+                'in_flight': self.in_flight.in_flight if self.in_flight else None,
+                'queue_depth': self.queue_depth,
+                'max_queue_depth': self.max_queue_depth,
+                'requests': self.requests,
+                'waited': self.waited,
+                'rejected': self.rejected,
+                'avg_wait': round(self.total_wait / self.waited, 3) if self.waited else 0,
+                'max_wait': round(self.max_wait, 3)
+            }
+
+
+def _positive(value) -> Optional[float]:
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return value if value > 0 else None
+
+
+def estimate_tokens(messages: List[Any], max_tokens: int) -> int:
+    """粗略估算一次调用的 token 用量（提示词 + 最大输出）"""
+    return sum(count_tokens(m.content) for m in messages) + (max_tokens or 0)
+
+
+class Permit:
+    """一次获准的调用，调用结束后通过 record_usage 校正 tpm 预占量"""
+    
+    def __init__(self, scopes: List[_Scope], reserved_tokens: int):
+        self.scopes = scopes
+        self.reserved_tokens = reserved_tokens
+    
+    def record_usage(self, usage: Optional[Dict[str, int]]):
+        """按实际用量归还或补扣 tpm 令牌"""
+        if not usage or not usage.get('total_tokens'):
+            return
+        diff = self.reserved_tokens - usage['total_tokens']
+        for scope in self.scopes:
+            if scope.tpm:
+                scope.tpm.refund(diff)
+
+
+class LLMGovernor:
+    """
+    LLM 调用限流器
+    """
+    
+    def __init__(self, provider_limits: Dict[str, Dict[str, Any]] = None, max_queue_wait: float = 30.0):
+        """
+        Args:
+            provider_limits: 服务商维度限额，如 {"deepseek": {"rpm": 60, "tpm": 100000}}
+            max_queue_wait: 默认最长排队等待秒数，可被 extra_params.max_queue_wait 覆盖
+        """
+        self.provider_limits = provider_limits or {}
+        self.max_queue_wait = max_queue_wait
+        self._scopes: Dict[str, _Scope] = {}
+        self._lock = threading.Lock()
+    
+    def _scope(self, name: str, limits: Dict[str, Any]) -> _Scope:
+        with self._lock:
+            scope = self._scopes.get(name)
+            if scope is None:
+                scope = self._scopes[name] = _Scope(name)
+        scope.apply_limits(limits)
+        return scope
+    
+    def _scopes_for(self, client) -> List[_Scope]:
+        scopes = []
+        if client.provider:
+            scopes.append(self._scope(f'provider:{client.provider}', self.provider_limits.get(client.provider, {})))
+        if getattr(client, 'config_id', None):
+            scopes.append(self._scope(f'config:{client.config_id}', client.extra_params))
+        return scopes
+    
+    def _max_wait(self, client) -> float:
+        return _positive(client.extra_params.get('max_queue_wait')) or self.max_queue_wait
+    
+    def _reserve(self, scopes: List[_Scope], tokens: int, budget: float) -> Optional[float]:
+        """在所有维度上预占 rpm/tpm 令牌，返回需等待的秒数；任一维度超出等待预算时全部回滚"""
+        reserved = []
+        wait = 0.0
+        for scope in scopes:
+            for bucket, amount in ((scope.rpm, 1), (scope.tpm, tokens)):
+                if bucket is None:
+                    continue
+                bucket_wait = bucket.reserve(amount, budget)
+                if bucket_wait is None:
+                    for b, a in reserved:
+                        b.refund(a)
+                    return None
+                reserved.append((bucket, amount))
+                wait = max(wait, bucket_wait)
+        return wait
+    
+    @contextmanager
+    def limit(self, client, messages: List[Any], max_tokens: int):
+        """
+        同步调用的限流上下文
+        
+        用法:
+            with llm_governor.limit(client, messages, max_tokens) as permit:
+                response = ...
+                permit.record_usage(response.usage)
+        """
+        scopes = self._scopes_for(client)
+        max_wait = self._max_wait(client)
+        tokens = estimate_tokens(messages, max_tokens)
+        started = time.monotonic()
+        acquired = []
+        for scope in scopes:
+            scope.enter_queue()
+        
+        try:
+            for scope in scopes:
+                if scope.in_flight:
+                    remaining = max_wait - (time.monotonic() - started)
+                    if not scope.in_flight.acquire(max(0.0, remaining)):
+                        raise LLMRateLimitError(f'{scope.name} 并发请求已满，排队超过 {max_wait:.0f} 秒')
+                    acquired.append(scope.in_flight)
+            
+            wait = self._reserve(scopes, tokens, max_wait - (time.monotonic() - started))
+            if wait is None:
+                raise LLMRateLimitError(f'请求频率超出限额，排队超过 {max_wait:.0f} 秒')
+            if wait > 0:
+                time.sleep(wait)
+        except BaseException:
+            for limiter in acquired:
+                limiter.release()
+            for scope in scopes:
+                scope.leave_queue(None)
+            raise
+        
+        waited = time.monotonic() - started
+        for scope in scopes:
+            scope.leave_queue(waited)
+        try:
+            yield Permit(scopes, tokens)
+        finally:
+            for limiter in acquired:
+                limiter.release()
+    
+    @asynccontextmanager
+    async def alimit(self, client, messages: List[Any], max_tokens: int):
+        """异步调用的限流上下文，排队期间不阻塞事件循环"""
+        scopes = self._scopes_for(client)
+        max_wait = self._max_wait(client)
+        tokens = estimate_tokens(messages, max_tokens)
+        started = time.monotonic()
+        acquired = []
+        for scope in scopes:
+            scope.enter_queue()
+        
+        try:
+            for scope in scopes:
+                if scope.in_flight:
+                    remaining = max_wait - (time.monotonic() - started)
+                    if not await scope.in_flight.aacquire(max(0.0, remaining)):
+                        raise LLMRateLimitError(f'{scope.name} 并发请求已满，排队超过 {max_wait:.0f} 秒')
+                    acquired.append(scope.in_flight)
+            
+            wait = self._reserve(scopes, tokens, max_wait - (time.monotonic() - started))
+            if wait is None:
+                raise LLMRateLimitError(f'请求频率超出限额，排队超过 {max_wait:.0f} 秒')
+            if wait > 0:
+                await asyncio.sleep(wait)
+        except BaseException:
+            for limiter in acquired:
+                limiter.release()
+            for scope in scopes:
+                scope.leave_queue(None)
+            raise
+        
+        waited = time.monotonic() - started
+        for scope in scopes:
+            scope.leave_queue(waited)
+        try:
+            yield Permit(scopes, tokens)
+        finally:
+            for limiter in acquired:
+                limiter.release()
+    
+    def stats(self) -> List[Dict[str, Any]]:
+        """各限流维度的排队与等待指标"""
+        with self._lock:
+            scopes = list(self._scopes.values())
+        return [scope.stats() for scope in scopes]
+
+
+def _load_provider_limits() -> Dict[str, Dict[str, Any]]:
+    """从环境变量 LLM_PROVIDER_LIMITS（JSON）读取服务商维度限额"""
+    try:
+        limits = json.loads(os.getenv('LLM_PROVIDER_LIMITS', '') or '{}')
+    except json.JSONDecodeError:
+        return {}
+    return limits if isinstance(limits, dict) else {}
+
+
+# 全局限流器
+llm_governor = LLMGovernor(
+    provider_limits=_load_provider_limits(),
+    max_queue_wait=float(os.getenv('LLM_MAX_QUEUE_WAIT', 30))
+)
@@ -0,0 +1,194 @@
+"""
+LLM 调用流水
+
+每次 chat / stream_chat 调用结束后记录一行到 llm_call_log：
+配置、模型、调用场景、token 用量、首字节耗时、总耗时与结果。
+写入由 BatchWriter 在后台线程批量完成，不增加调用耗时。
+
+调用场景通过 llm_feature('generate') 上下文设置（AIService 按服务类型自动设置），
+非流式调用的首字节时间由 httpx 响应事件钩子在收到响应头时记录。
+"""
+import time
+from contextvars import ContextVar
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from app.services.batch_writer import BatchWriter
+from app.services.llm_governor import LLMRateLimitError, estimate_tokens
+from app.services.prompt_budget import count_tokens
+
+# 当前调用场景
+_current_feature: ContextVar[Optional[str]] = ContextVar('llm_feature', default=None)
+# 当前进行中的非流式调用（供 httpx 事件钩子记录首字节时间）
+_current_call: ContextVar[Optional['CallRecord']] = ContextVar('llm_call', default=None)
+
+
+@contextmanager
+def llm_feature(name: str):
+    """设置上下文内 LLM 调用的场景标识（generate/review/chat 等）"""
+    token = _current_feature.set(name)
+    try:
+        yield
+    finally:
+        _current_feature.reset(token)
+
+
+def on_response_headers(response):
+    """httpx 同步客户端 response 事件钩子：收到响应头时记录首字节时间"""
+    call = _current_call.get()
+    if call is not None:
+        call.mark_first_byte()
+
+
+async def aon_response_headers(response):
+    """httpx 异步客户端 response 事件钩子"""
+    on_response_headers(response)
+
+
+def classify_outcome(exc: BaseException) -> str:
+    """将调用异常归类为流水中的 outcome"""
+    import httpx
+    from app.services.llm_resilience import CircuitOpenError
+    
+    if isinstance(exc, GeneratorExit):
+        return 'cancelled'
+    if isinstance(exc, CircuitOpenError):
+        return 'circuit_open'
+    if isinstance(exc, LLMRateLimitError):
+        return 'rate_limited'
+    if isinstance(exc, httpx.TimeoutException):
+        return 'timeout'
+    try:
+        import openai
+        if isinstance(exc, openai.APITimeoutError):
+            return 'timeout'
+    except ImportError:
+        pass
+    return 'error'
+
+
+class CallRecord:
+    """一次调用的计时与结果"""
+    
+    def __init__(self, client, messages: List[Any], stream: bool = False):
+        self.client = client
+        self.messages = messages
+        self.stream = stream
+        self.feature = _current_feature.get() or 'other'
+        self.created_at = datetime.utcnow()
+        self.started = time.monotonic()
+        self.first_byte: Optional[float] = None
+        self.response = None
+        self.chunks: List[str] = []
+    
+    def mark_first_byte(self):
+        """记录首字节时间；重试时以最后一次收到响应头的时间为准"""
+        self.first_byte = time.monotonic()
+    
+    def add_delta(self, delta: str):
+        """流式调用产出增量文本"""
+        if self.first_byte is None:
+            self.first_byte = time.monotonic()
+        self.chunks.append(delta)
+    
+    def to_row(self, exc: Optional[BaseException] = None) -> Dict[str, Any]:
+        """生成 llm_call_log 行数据"""
+        now = time.monotonic()
+        usage = (self.response.usage if self.response is not None else None) or {}
+        cached = bool(self.response is not None and self.response.cached)
+        estimated = False
+        prompt_tokens = usage.get('prompt_tokens') or 0
+        completion_tokens = usage.get('completion_tokens') or 0
+        
+        if cached:
+            # 缓存命中不消耗上游 token
+            prompt_tokens = completion_tokens = 0
+        elif self.stream and self.chunks and not usage:
+            # 流式响应不返回 usage，按文本估算
+            prompt_tokens = estimate_tokens(self.messages, 0)
+            completion_tokens = count_tokens(''.join(self.chunks))
+            estimated = True
+        
+        if exc is not None:
+            outcome = classify_outcome(exc)
+        else:
+            outcome = 'cached' if cached else 'success'
+        
+        return {
+            'config_id': self.client.config_id,
+            'provider': self.client.provider,
+            'model': (self.response.model if self.response is not None else None) or self.client.model,
+            'feature': self.feature,
+            'stream': self.stream,
+            'outcome': outcome,
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': completion_tokens,
+            'total_tokens': prompt_tokens + completion_tokens,
+            'usage_estimated': estimated,
+            'ttfb_ms': round((self.first_byte - self.started) * 1000, 2) if self.first_byte else None,
+            'latency_ms': round((now - self.started) * 1000, 2),
+            'error': str(exc)[:500] if exc is not None and str(exc) else None,
+            'created_at': self.created_at
+        }
+
+
+class LLMCallLedger:
+    """
+    LLM 调用流水记录器
+    
+    非流式调用：
+        with call_ledger.track(client, messages) as call:
+            call.response = client._upstream_chat(...)
+    
+    流式调用：
+        with call_ledger.track(client, messages, stream=True) as call:
+            for delta in ...:
+                call.add_delta(delta)
+    """
+    
+    def __init__(self):
+        self.writer = BatchWriter('llm_call_log', self._table)
+    
+    @staticmethod
+    def _table():
+        from app.models import LLMCallLog
+        return LLMCallLog.__table__
+    
+    def init_app(self, app):
+        self.writer.init_app(
+            app,
+            batch_size=app.config.get('LLM_CALL_LOG_BATCH_SIZE'),
+            flush_interval=app.config.get('LLM_CALL_LOG_FLUSH_INTERVAL')
+        )
+    
+    @contextmanager
+    def track(self, client, messages: List[Any], stream: bool = False):
+        """记录一次调用，异常原样抛出"""
+        call = CallRecord(client, messages, stream)
+        # 流式调用跨多次迭代，可能不在同一上下文中结束，不登记到上下文变量
+        token = None if stream else _current_call.set(call)
+        try:
+            yield call
+        except BaseException as e:
+            self._record(call.to_row(e))
+            raise
+        else:
+            self._record(call.to_row())
+        finally:
+            if token is not None:
+                _current_call.reset(token)
+    
+    def _record(self, row: Dict[str, Any]):
+        try:
+            self.writer.write(row)
+        except Exception:
+            # 流水记录失败不影响调用本身
+            pass
+    
+    def stats(self) -> Dict[str, Any]:
+        return self.writer.stats()
+
+
+# 全局调用流水记录器
+call_ledger = LLMCallLedger()
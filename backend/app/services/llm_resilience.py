@@ -0,0 +1,338 @@
+"""
+LLM 调用容错：重试、熔断与故障切换判定
+
+- 重试：对超时、连接错误、429/5xx 等可重试错误按带抖动的指数退避重试
+- 熔断：每个 LLMConfig 一个熔断器，连续失败达到阈值后熔断，熔断期间直接失败，
+  冷却结束后放行一次探测请求，成功则恢复。除可重试错误外，鉴权失败、模型不存在、
+  响应无法解析等不可重试的上游/配置错误同样计为失败；只有请求本身有误（400/413/422）不计入
+- 故障切换：由 AIService 在熔断、重试耗尽或上游/配置错误时切换到下一个启用的配置
+
+重试与熔断参数可在 LLMConfig.extra_params 中覆盖：
+    retry_max_attempts / retry_base_delay / retry_max_delay
+    breaker_failure_threshold / breaker_recovery_timeout
+"""
+import time
+import random
+import asyncio
+import threading
+from typing import Any, Callable, Dict, Iterator, AsyncIterator, Optional
+
+from app.services.llm_governor import LLMRateLimitError
+
+# 可重试的 HTTP 状态码
+RETRYABLE_STATUS = {408, 409, 425, 429, 500, 502, 503, 504}
+
+# 请求本身有误（参数错误、内容过长等）的 HTTP 状态码，换配置重试也无济于事，不计入熔断
+CALLER_ERROR_STATUS = {400, 413, 422}
+
+
+class CircuitOpenError(RuntimeError):
+    """熔断器处于打开状态，调用被直接拒绝"""
+    pass
+
+
+def _status_code(exc: Exception) -> Optional[int]:
+    """从 httpx / openai 异常中提取 HTTP 状态码"""
+    response = getattr(exc, 'response', None)
+    status = getattr(exc, 'status_code', None) or getattr(response, 'status_code', None)
+    return status if isinstance(status, int) else None
+
+
+def is_retryable(exc: Exception) -> bool:
+    """判断异常是否为可重试的上游故障"""
+    import httpx
+    
+    if isinstance(exc, (httpx.TimeoutException, httpx.TransportError)):
+        return True
+    try:
+        import openai
+        if isinstance(exc, (openai.APITimeoutError, openai.APIConnectionError)):
+            return True
+    except ImportError:
+        pass
+    status = _status_code(exc)
+    return status in RETRYABLE_STATUS
+
+
+def is_caller_error(exc: Exception) -> bool:
+    """判断异常是否由请求本身引起（上游已正常处理并拒绝了该请求）"""
+    return _status_code(exc) in CALLER_ERROR_STATUS
+
+
+def is_upstream_failure(exc: Exception) -> bool:
+    """判断异常是否为上游或配置故障：可重试错误，以及 401/403/404、响应无法解析等不可重试错误"""
+    return not isinstance(exc, (CircuitOpenError, LLMRateLimitError)) and not is_caller_error(exc)
+
+
+def should_failover(exc: Exception) -> bool:
+    """判断异常是否应切换到备用配置"""
+    return isinstance(exc, (CircuitOpenError, LLMRateLimitError)) or is_upstream_failure(exc)
+
+
+def _retry_after(exc: Exception) -> Optional[float]:
+    """读取 Retry-After 响应头（秒）"""
+    response = getattr(exc, 'response', None)
+    headers = getattr(response, 'headers', None)
+    if not headers:
+        return None
+    try:
+        return float(headers.get('retry-after'))
+    except (TypeError, ValueError):
+        return None
+
+
+def _param(extra_params: Dict[str, Any], key: str, default: float) -> float:
+    try:
+        value = float(extra_params.get(key, default))
+    except (TypeError, ValueError):
+        return default
+    return value if value >= 0 else default
+
+
+class RetryPolicy:
+    """带抖动的指数退避重试策略"""
+    
+    def __init__(self, max_attempts: int = 3, base_delay: float = 0.5, max_delay: float = 8.0):
+        self.max_attempts = max(1, int(max_attempts))
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+    
+    @classmethod
+    def from_params(cls, extra_params: Dict[str, Any]) -> 'RetryPolicy':
+        return cls(
+            max_attempts=_param(extra_params, 'retry_max_attempts', 3),
+            base_delay=_param(extra_params, 'retry_base_delay', 0.5),
+            max_delay=_param(extra_params, 'retry_max_delay', 8.0)
+        )
+    
+    def delay(self, attempt: int, exc: Exception) -> float:
+        """第 attempt 次失败后的等待时间（full jitter），服务端给出 Retry-After 时优先遵循"""
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+        retry_after = _retry_after(exc)
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return min(delay, self.max_delay)
+
+
+class CircuitBreaker:
+    """
+    熔断器
+    closed: 正常放行；open: 直接拒绝；half_open: 冷却结束后只放行一次探测请求
+    """
+    
+    def __init__(self, name: str, failure_threshold: int = 5, recovery_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+        self.total_failures = 0
+        self.total_rejected = 0
+        self.times_opened = 0
+        self._lock = threading.Lock()
+    
+    def allow(self) -> bool:
+        """是否允许发起调用"""
+        with self._lock:
+            if self.state == 'open' and time.monotonic() - self.opened_at >= self.recovery_timeout:
+                self.state = 'half_open'
+                self.probing = False
+            if self.state == 'closed':
+                return True
+            if self.state == 'half_open' and not self.probing:
+                self.probing = True
+                return True
+            self.total_rejected += 1
+            return False
+    
+    def record_success(self):
+        with self._lock:
+            self.state = 'closed'
+            self.failures = 0
+            self.probing = False
+    
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self.total_failures += 1
+            if self.state == 'half_open' or self.failures >= self.failure_threshold:
+                if self.state != 'open':
+                    self.times_opened += 1
+                self.state = 'open'
+                self.opened_at = time.monotonic()
+            self.probing = False
+    
+    def release(self):
+        """调用结果与上游健康无关（如本地排队超时），仅释放探测名额"""
+        with self._lock:
+            self.probing = False
+    
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'name': self.name,
+                'state': self.state,
+                'consecutive_failures': self.failures,
+                'failure_threshold': self.failure_threshold,
+                'recovery_timeout': self.recovery_timeout,
+                'total_failures': self.total_failures,
+                'total_rejected': self.total_rejected,
+                'times_opened': self.times_opened
+            }
+
+
+class CircuitBreakerRegistry:
+    """按 LLMConfig（或 服务商+地址）维护熔断器，同步与异步客户端共享"""
+    
+    def __init__(self):
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+    
+    def for_client(self, client) -> CircuitBreaker:
+        if getattr(client, 'config_id', None):
+            name = f'config:{client.config_id}'
+        else:
+            name = f'provider:{client.provider}:{client.api_base}'
+        
+        params = client.extra_params
+        with self._lock:
+            breaker = self._breakers.get(name)
+            if breaker is None:
+                breaker = self._breakers[name] = CircuitBreaker(name)
+        breaker.failure_threshold = max(1, int(_param(params, 'breaker_failure_threshold', 5)))
+        breaker.recovery_timeout = _param(params, 'breaker_recovery_timeout', 30.0)
+        return breaker
+    
+    def is_open(self, config_id: int) -> bool:
+        """配置的熔断器是否处于打开状态（冷却中）"""
+        breaker = self._breakers.get(f'config:{config_id}')
+        if breaker is None or breaker.state != 'open':
+            return False
+        return time.monotonic() - breaker.opened_at < breaker.recovery_timeout
+    
+    def stats(self):
+        with self._lock:
+            breakers = list(self._breakers.values())
+        return [b.stats() for b in breakers]
+
+
+circuit_breakers = CircuitBreakerRegistry()
+
+
+def _record(breaker: CircuitBreaker, exc: Exception):
+    """按异常类型更新熔断器状态"""
+    if isinstance(exc, LLMRateLimitError):
+        breaker.release()
+    elif is_caller_error(exc):
+        # 上游已正常响应，只是拒绝了这次请求（如参数错误），不计入故障
+        breaker.record_success()
+    else:
+        breaker.record_failure()
+
+
+def _open_error(breaker: CircuitBreaker) -> CircuitOpenError:
+    return CircuitOpenError(f'{breaker.name} 已熔断，{breaker.recovery_timeout:.0f} 秒内暂停调用')
+
+
+def call_with_resilience(client, fn: Callable[[], Any]):
+    """带熔断与重试地执行一次上游调用"""
+    breaker = circuit_breakers.for_client(client)
+    policy = RetryPolicy.from_params(client.extra_params)
+    
+    for attempt in range(policy.max_attempts):
+        if not breaker.allow():
+            raise _open_error(breaker)
+        try:
+            result = fn()
+        except Exception as e:
+            _record(breaker, e)
+            if not is_retryable(e) or attempt + 1 >= policy.max_attempts:
+                raise
+            time.sleep(policy.delay(attempt, e))
+        except BaseException:
+            # 调用被取消或中断（如 asyncio.CancelledError），不计入结果，只释放探测名额
+            breaker.release()
+            raise
+        else:
+            breaker.record_success()
+            return result
+
+
+async def acall_with_resilience(client, fn: Callable[[], Any]):
+    """call_with_resilience 的异步版本，fn 返回可等待对象"""
+    breaker = circuit_breakers.for_client(client)
+    policy = RetryPolicy.from_params(client.extra_params)
+    
+    for attempt in range(policy.max_attempts):
+        if not breaker.allow():
+            raise _open_error(breaker)
+        try:
+            result = await fn()
+        except Exception as e:
+            _record(breaker, e)
+            if not is_retryable(e) or attempt + 1 >= policy.max_attempts:
+                raise
+            await asyncio.sleep(policy.delay(attempt, e))
+        except BaseException:
+            # 调用被取消或中断（如 asyncio.CancelledError），不计入结果，只释放探测名额
+            breaker.release()
+            raise
+        else:
+            breaker.record_success()
+            return result
+
+
+def stream_with_resilience(client, fn: Callable[[], Iterator[str]]) -> Iterator[str]:
+    """带熔断与重试的流式调用，已产出内容后不再重试"""
+    breaker = circuit_breakers.for_client(client)
+    policy = RetryPolicy.from_params(client.extra_params)
+    
+    for attempt in range(policy.max_attempts):
+        if not breaker.allow():
+            raise _open_error(breaker)
+        started = False
+        try:
+            for delta in fn():
+                started = True
+                yield delta
+        except Exception as e:
+            _record(breaker, e)
+            if started or not is_retryable(e) or attempt + 1 >= policy.max_attempts:
+                raise
+            time.sleep(policy.delay(attempt, e))
+        except BaseException:
+            # 调用方提前结束读取（GeneratorExit）或调用被取消，只释放探测名额
+            breaker.release()
+            raise
+        else:
+            breaker.record_success()
+            return
+
+
+async def astream_with_resilience(client, fn: Callable[[], AsyncIterator[str]]) -> AsyncIterator[str]:
+    """stream_with_resilience 的异步版本"""
+    breaker = circuit_breakers.for_client(client)
+    policy = RetryPolicy.from_params(client.extra_params)
+    
+    for attempt in range(policy.max_attempts):
+        if not breaker.allow():
+            raise _open_error(breaker)
+        started = False
+        try:
+            async for delta in fn():
+                started = True
+                yield delta
+        except Exception as e:
+            _record(breaker, e)
+            if started or not is_retryable(e) or attempt + 1 >= policy.max_attempts:
+                raise
+            await asyncio.sleep(policy.delay(attempt, e))
+        except BaseException:
+            # 调用方提前结束读取（GeneratorExit）或调用被取消，只释放探测名额
+            breaker.release()
+            raise
+        else:
+            breaker.record_success()
+            return
@@ -0,0 +1,78 @@
+"""
+操作日志异步写入
+
+log_operation 装饰器只把日志行放入内存队列，请求耗时不再包含写日志，也不与请求共享数据库会话：
+- BatchWriter 后台线程攒够 OPERATION_LOG_BATCH_SIZE 行或每 OPERATION_LOG_FLUSH_INTERVAL 秒多行插入一次
+- 队列满时请求线程最多等待 OPERATION_LOG_BLOCK_TIMEOUT 秒（背压），仍满则丢弃并计数
+- 每批在插入的同一事务内按 user_id 查询一次用户名（用户已删除时清空 user_id），
+  并同步统计计数和时间序列汇总（Core 插入不会触发 ORM 事件）
+- 进程退出时写入队列中剩余的日志
+"""
+from datetime import datetime
+from typing import Any, Dict, List
+
+from sqlalchemy import select
+
+from app.services.batch_writer import BatchWriter
+from app.services.stat_counters import count_rows
+
+
+class OperationLogWriter:
+    """操作日志批量写入器"""
+    
+    def __init__(self):
+        self.writer = BatchWriter('operation_logs', self._table, on_batch=self._prepare)
+    
+    @staticmethod
+    def _table():
+        from app.models import OperationLog
+        return OperationLog.__table__
+    
+    def init_app(self, app):
+        self.writer.init_app(
+            app,
+            batch_size=app.config.get('OPERATION_LOG_BATCH_SIZE'),
+            flush_interval=app.config.get('OPERATION_LOG_FLUSH_INTERVAL'),
+            max_queue=app.config.get('OPERATION_LOG_MAX_QUEUE'),
+            block_timeout=app.config.get('OPERATION_LOG_BLOCK_TIMEOUT')
+        )
+    
+    def write(self, log_data: Dict[str, Any]) -> bool:
+        """
+        放入一条日志，立即返回
+        
+        创建时间取入队时间；同一批各行需包含相同的列，缺省的列补为 None
+        
+        Returns:
+            是否成功入队
+        """
+        row = {column.name: log_data.get(column.name) for column in self._table().columns if not column.primary_key}
+        row['created_at'] = row['created_at'] or datetime.utcnow()
+        row['status'] = row['status'] or 'success'
+        return self.writer.write(row)
+    
+    def flush(self):
+        """同步写入队列中的全部日志"""
+        self.writer.flush()
+    
+    def stats(self) -> Dict[str, Any]:
+        return self.writer.stats()
+    
+    @staticmethod
+    def _prepare(conn, rows: List[Dict[str, Any]]):
+        from app.models import User, OperationLog
+        
+        user_ids = {row['user_id'] for row in rows if row['user_id']}
+        usernames = dict(conn.execute(
+            select(User.id, User.username).where(User.id.in_(user_ids))
+        ).all()) if user_ids else {}
+        for row in rows:
+            row['username'] = usernames.get(row['user_id'])
+            if row['username'] is None:
+                row['user_id'] = None
+        
+        count_rows(conn, OperationLog, rows)
+
+
+# 全局操作日志写入器
+operation_log_writer = OperationLogWriter()
@@ -0,0 +1,99 @@
+"""
+游标（keyset）分页
+
+大表列表的 OFFSET 分页需要先扫描并丢弃前面的行，每页还要执行一次全量 COUNT(*)，越往后翻越慢。
+游标分页按 (created_at, id) 倒序，下一页从上一页最后一行之后继续读取：
+- 条件写成 created_at < 游标时间 OR (created_at = 游标时间 AND id < 游标ID)，MySQL 可据此在 created_at 复合索引上
+  做范围定位（行构造器比较 (created_at, id) < (...) 在 MySQL 上不会转成范围扫描），任意深度的页与第一页代价相同
+- created_at 为空的行排在最后（MySQL 和 SQLite 倒序时 NULL 都在末尾），游标时间为空时只在这部分行中按 id 继续
+- 总数默认不返回，需要时传 with_total=true 单独执行一次 COUNT
+
+用法（请求带 cursor 参数时启用，第一页传空字符串）：
+    GET /api/logs?cursor=&per_page=50
+    GET /api/logs?cursor=<上一页返回的 next_cursor>&per_page=50
+"""
+import json
+import base64
+from datetime import datetime
+from dataclasses import dataclass
+from typing import Any, List, Optional
+
+from flask import request
+from sqlalchemy import or_, and_
+
+# 游标分页单页上限
+MAX_PER_PAGE = 500
+
+
+@dataclass
+class CursorPage:
+    """一页游标分页结果"""
+    items: List[Any]
+    next_cursor: Optional[str]
+    has_more: bool
+    total: Optional[int] = None
+
+
+def cursor_requested() -> bool:
+    """请求是否使用游标分页（带 cursor 参数，第一页可为空字符串）"""
+    return 'cursor' in request.args
+
+
+def total_requested() -> bool:
+    return request.args.get('with_total', '').lower() in ('1', 'true')
+
+
+def encode_cursor(created_at: datetime, row_id: int) -> str:
+    raw = json.dumps([created_at.isoformat() if created_at else None, row_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str):
+    """
+    解析游标
+    
+    Raises:
+        ValueError: 游标格式无效
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('utf-8')
+        created_at, row_id = json.loads(raw)
+        return (datetime.fromisoformat(created_at) if created_at is not None else None), int(row_id)
+    except (ValueError, TypeError, UnicodeDecodeError):
+        raise ValueError('无效的分页游标')
+
+
+def cursor_paginate(query, model, cursor: str, per_page: int, with_total: bool = False) -> CursorPage:
+    """
+    按 (created_at, id) 倒序读取一页
+    
+    Args:
+        query: 已加好筛选条件的查询，不要带排序
+        model: 查询的模型，需有 created_at 和 id 列
+        cursor: 上一页返回的 next_cursor，空字符串表示第一页
+        per_page: 每页条数
+        with_total: 是否额外统计符合条件的总数
+    
+    Raises:
+        ValueError: 游标格式无效
+    """
+    per_page = min(max(per_page or 1, 1), MAX_PER_PAGE)
+    total = query.order_by(None).count() if with_total else None
+    
+    if cursor:
+        created_at, row_id = decode_cursor(cursor)
+        if created_at is None:
+            query = query.filter(model.created_at.is_(None), model.id < row_id)
+        else:
+            query = query.filter(or_(
+                model.created_at < created_at,
+                and_(model.created_at == created_at, model.id < row_id),
+                model.created_at.is_(None)
+            ))
+    
+    # 多取一行判断是否还有下一页
+    items = query.order_by(model.created_at.desc(), model.id.desc()).limit(per_page + 1).all()
+    has_more = len(items) > per_page
+    items = items[:per_page]
+    next_cursor = encode_cursor(items[-1].created_at, items[-1].id) if has_more else None
+    return CursorPage(items, next_cursor, has_more, total)
@@ -0,0 +1,196 @@
+"""
+提示词 token 预算
+
+在调用前按模型上下文窗口裁剪提示词，避免知识库过大时超出上下文、拖慢调用并增加费用：
+- count_tokens: 离线估算中英文混合文本的 token 数，不依赖分词器
+- PromptBudget: 按 LLMConfig.extra_params 中的 context_window / max_output_tokens
+  计算输出上限，并把需求内容与知识库装入剩余的提示词预算
+
+extra_params 示例: {"context_window": 32768, "max_output_tokens": 8192}
+"""
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+# 未配置时的默认上下文窗口与输出上限
+DEFAULT_CONTEXT_WINDOW = 32768
+DEFAULT_MAX_OUTPUT_TOKENS = 8192
+# 输出中 JSON 结构、代码块标记等固定开销
+OUTPUT_BASE_TOKENS = 300
+# 为消息格式开销和估算误差预留的 token 数
+SAFETY_MARGIN_TOKENS = 256
+# 知识库剩余预算不足该值时直接丢弃，不再截取过短的片段
+MIN_KNOWLEDGE_TOKENS = 128
+
+TRUNCATED_MARK = '\n……（内容过长，已截断）'
+
+
+def count_tokens(text: Optional[str]) -> int:
+    """
+    估算文本的 token 数
+    
+    中文等 UTF-8 三字节字符按约 1 token/字，ASCII 按约 4 字符/token。
+    用 UTF-8 编码长度区分两类字符，全部在 C 层完成，适合在每次调用前估算大段文本。
+    """
+    if not text:
+        return 0
+    chars = len(text)
+    wide = (len(text.encode('utf-8')) - chars) // 2
+    return wide + (chars - wide + 3) // 4
+
+
+def token_prefix_length(text: str, limit: int) -> int:
+    """返回不超过 limit 个 token 的最长前缀的字符数（二分查找）"""
+    low, high = 0, len(text)
+    while low < high:
+        mid = (low + high + 1) // 2
+        if count_tokens(text[:mid]) <= limit:
+            low = mid
+        else:
+            high = mid - 1
+    return low
+
+
+def truncate_tokens(text: str, limit: int) -> str:
+    """截取文本开头不超过 limit 个 token 的部分"""
+    if count_tokens(text) <= limit:
+        return text
+    limit = max(limit - count_tokens(TRUNCATED_MARK), 0)
+    return text[:token_prefix_length(text, limit)] + TRUNCATED_MARK
+
+
+def _positive_int(value: Any, default: int) -> int:
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        return default
+    return value if value > 0 else default
+
+
+@dataclass
+class FittedPrompt:
+    """裁剪后的提示词输入"""
+    content: str
+    knowledge_contents: List[str]
+    prompt_budget: int
+    trimmed: List[str] = field(default_factory=list)  # 裁剪说明，供日志输出
+
+
+class PromptBudget:
+    """
+    单个模型的 token 预算
+    
+    用法：
+        budget = PromptBudget.from_extra_params(extra_params)
+        max_tokens = budget.output_tokens(count, tokens_per_item=400)
+        fitted = budget.fit(max_tokens, fixed=[system_prompt, template], content=..., knowledge_contents=[...])
+    """
+    
+    def __init__(self, context_window: int = DEFAULT_CONTEXT_WINDOW, max_output_tokens: int = DEFAULT_MAX_OUTPUT_TOKENS):
+        self.context_window = context_window
+        self.max_output_tokens = min(max_output_tokens, context_window // 2)
+    
+    @classmethod
+    def from_extra_params(cls, extra_params: Dict[str, Any] = None) -> 'PromptBudget':
+        extra_params = extra_params or {}
+        return cls(
+            context_window=_positive_int(extra_params.get('context_window'), DEFAULT_CONTEXT_WINDOW),
+            max_output_tokens=_positive_int(extra_params.get('max_output_tokens'), DEFAULT_MAX_OUTPUT_TOKENS)
+        )
+    
+    def output_tokens(self, items: Any, tokens_per_item: int, base_tokens: int = OUTPUT_BASE_TOKENS) -> int:
+        """
+        根据期望输出条数计算 max_tokens
+        
+        Args:
+            items: 期望输出的条数（如生成用例数、评审用例数）
+            tokens_per_item: 每条输出的 token 估算
+            base_tokens: 固定开销（JSON 结构、代码块标记等）
+        """
+        items = _positive_int(items, 1)
+        return min(base_tokens + items * tokens_per_item, self.max_output_tokens)
+    
+    def fit(
+        self,
+        max_tokens: int,
+        fixed: List[str],
+        content: str = '',
+        knowledge_contents: List[str] = None,
+        content_label: str = '需求内容'
+    ) -> FittedPrompt:
+        """
+        把主体内容和知识库装入提示词预算
+        
+        优先级：fixed（系统提示词、指令模板，不裁剪）> content（超出时截断）>
+        knowledge_contents（按顺序装入，放不下的截断或丢弃）
+        
+        Args:
+            max_tokens: 本次调用的输出上限
+            fixed: 不可裁剪的文本
+            content: 主体内容，如需求正文
+            knowledge_contents: 知识库内容列表
+            content_label: 主体内容在裁剪说明中的名称
+        """
+        budget = self.context_window - max_tokens - SAFETY_MARGIN_TOKENS
+        remaining = budget - sum(count_tokens(text) for text in fixed)
+        trimmed = []
+        
+        content = content or ''
+        content_tokens = count_tokens(content)
+        if content_tokens > remaining:
+            content = truncate_tokens(content, max(remaining, 0))
+            trimmed.append(f'{content_label}截断 {content_tokens} → {count_tokens(content)} tokens')
+        remaining -= count_tokens(content)
+        
+        fitted_knowledge = []
+        for i, text in enumerate(knowledge_contents or [], 1):
+            tokens = count_tokens(text)
+            if tokens <= remaining:
+                fitted_knowledge.append(text)
+                remaining -= tokens
+            elif remaining >= MIN_KNOWLEDGE_TOKENS:
+                text = truncate_tokens(text, remaining)
+                fitted_knowledge.append(text)
+                trimmed.append(f'知识库 {i} 截断 {tokens} → {count_tokens(text)} tokens')
+                remaining -= count_tokens(text)
+            else:
+                trimmed.append(f'知识库 {i} 丢弃（{tokens} tokens）')
+        
+        return FittedPrompt(content, fitted_knowledge, budget, trimmed)
+    
+    def chunk(
+        self,
+        items: List[Any],
+        item_tokens: List[int],
+        tokens_per_item: int,
+        fixed_tokens: int = 0,
+        reserve_tokens: int = 0,
+        max_items: int = None
+    ) -> List[List[Any]]:
+        """
+        把条目按预算顺序分组，使每组的输入和输出都不超出上下文窗口
+        
+        Args:
+            items: 待分组的条目
+            item_tokens: 每个条目写入提示词后的 token 数
+            tokens_per_item: 每个条目的输出 token 估算
+            fixed_tokens: 每组共用的固定提示词 token 数
+            reserve_tokens: 为其他可裁剪内容（如知识库）预留的 token 数
+            max_items: 每组最多条目数
+        
+        Returns:
+            分组列表；单个条目超出预算时独占一组
+        """
+        max_items = min(max_items or len(items) or 1, max((self.max_output_tokens - OUTPUT_BASE_TOKENS) // tokens_per_item, 1))
+        max_tokens = self.output_tokens(max_items, tokens_per_item)
+        available = self.context_window - max_tokens - SAFETY_MARGIN_TOKENS - fixed_tokens - reserve_tokens
+        
+        chunks, current, used = [], [], 0
+        for item, tokens in zip(items, item_tokens):
+            if current and (len(current) >= max_items or used + tokens > available):
+                chunks.append(current)
+                current, used = [], 0
+            current.append(item)
+            used += tokens
+        if current:
+            chunks.append(current)
+        return chunks
@@ -0,0 +1,341 @@
+"""
+统计计数器
+
+仪表盘统计不再逐项 COUNT 全表，而是按统计对象一次读取 stat_counters 中的计数，耗时与数据量无关：
+- 增量：通过 ORM 插入、修改、删除用例/评审/操作日志/数据工厂记录时，在同一次 flush 内按变化量增减计数，
+  随业务事务一起提交或回滚；Core 批量插入需调用 apply_rows 同步计数
+- 对账：每个统计对象用一次分组查询重算计数，后台每 STAT_COUNTER_RECONCILE_INTERVAL 秒执行一次，
+  纠正绕过 ORM 的写入造成的偏差；初始计数由 0004 迁移或 reconcile-stats 生成，读取计数不会触发写入
+- 同一套事件也维护仪表盘时间序列的小时/天汇总（见 timeseries.py）
+"""
+import threading
+from collections import Counter
+from datetime import datetime, time, timedelta
+from typing import Any, Callable, Dict, Iterable, List
+
+from sqlalchemy import event, func, inspect, select
+from sqlalchemy.dialects import mysql, sqlite
+from sqlalchemy.orm import Session, object_session
+
+from app import db
+from app.models import (
+    TestCase, TestcaseReview, OperationLog, DataFactoryHistory, StatCounter, StatRollupHourly, StatRollupDaily
+)
+from app.services.timeseries import ROLLUP_MODELS, rollup_keys, rebuild_all_rollups
+
+# 对账时写入的标记，没有该标记说明计数还没有基准（需执行 migrate-db 或 reconcile-stats）
+RECONCILED_DIMENSION = '_reconciled'
+# 按日计数只用于“今日”统计，对账时只保留最近几天
+DAY_COUNTER_DAYS = 2
+
+_DELTAS_KEY = 'stat_counter_deltas'
+# 增量写入的表，变化量的键为 (表名, 主键列取值...)
+_DELTA_TABLES = {table.name: table for table in (
+    StatCounter.__table__, StatRollupHourly.__table__, StatRollupDaily.__table__
+)}
+
+
+def _text(value) -> str:
+    return '' if value is None else str(value)[:100]
+
+
+def _int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _testcase_keys(get):
+    yield ('total', ''), 1
+    yield ('status', _text(get('status'))), 1
+    if get('is_ai_generated'):
+        yield ('ai_generated', ''), 1
+
+
+def _review_keys(get):
+    yield ('total', ''), 1
+    yield ('status', _text(get('status'))), 1
+    rating = _int(get('overall_rating'))
+    if rating is not None:
+        yield ('rating_count', ''), 1
+        yield ('rating_sum', ''), rating
+
+
+def _log_keys(get):
+    yield ('total', ''), 1
+    yield ('action', _text(get('action'))), 1
+    yield ('module', _text(get('module'))), 1
+    yield ('status', _text(get('status'))), 1
+    created_at = get('created_at')
+    if created_at:
+        yield ('day', created_at.date().isoformat()), 1
+
+
+def _data_factory_keys(get):
+    yield ('total', ''), 1
+    yield ('tool_category', _text(get('tool_category'))), 1
+    yield ('tool_scenario', _text(get('tool_scenario'))), 1
+
+
+# 模型 -> (计数项函数, 参与计数的属性)；计数项函数按属性取值函数返回 ((维度, 取值), 增量)
+COUNTED_MODELS = {
+    TestCase: (_testcase_keys, ('status', 'is_ai_generated')),
+    TestcaseReview: (_review_keys, ('status', 'overall_rating')),
+    OperationLog: (_log_keys, ('action', 'module', 'status', 'created_at')),
+    DataFactoryHistory: (_data_factory_keys, ('tool_category', 'tool_scenario')),
+}
+
+
+def _tracked_attributes(model):
+    """修改后会影响计数或汇总的属性"""
+    attrs = COUNTED_MODELS[model][1]
+    if model in ROLLUP_MODELS:
+        attrs = tuple(dict.fromkeys(attrs + ('status', 'created_at')))
+    return attrs
+
+
+def _row_getter(model, row: Dict[str, Any]) -> Callable[[str], Any]:
+    """批量插入的行数据取值，缺省的列按模型默认值计算"""
+    columns = model.__table__.c
+    
+    def get(name):
+        if name in row:
+            return row[name]
+        default = columns[name].default
+        if default is None:
+            return None
+        return default.arg(None) if default.is_callable else default.arg
+    return get
+
+
+def _previous_getter(target) -> Callable[[str], Any]:
+    """修改或删除前的属性值"""
+    state = inspect(target)
+    
+    def get(name):
+        history = state.attrs[name].history
+        return history.deleted[0] if history.deleted else getattr(target, name)
+    return get
+
+
+def _accumulate(deltas: Counter, model, get: Callable[[str], Any], sign: int, times: int = 1):
+    keys_fn = COUNTED_MODELS[model][0]
+    scope = model.__tablename__
+    for (dimension, value), amount in keys_fn(get):
+        deltas[(StatCounter.__tablename__, scope, dimension, value)] += sign * amount * times
+    for key, amount in rollup_keys(model, get):
+        deltas[key] += sign * amount * times
+
+
+def _session_deltas(target) -> Counter:
+    session = object_session(target)
+    return session.info.setdefault(_DELTAS_KEY, Counter()) if session is not None else Counter()
+
+
+def _after_insert(mapper, connection, target):
+    # 插入后再计算，列默认值已填充到对象上
+    _accumulate(_session_deltas(target), type(target), lambda name: getattr(target, name), 1)
+
+
+def _before_update(mapper, connection, target):
+    state = inspect(target)
+    if not any(state.attrs[name].history.has_changes() for name in _tracked_attributes(type(target))):
+        return
+    deltas = _session_deltas(target)
+    _accumulate(deltas, type(target), _previous_getter(target), -1)
+    _accumulate(deltas, type(target), lambda name: getattr(target, name), 1)
+
+
+def _before_delete(mapper, connection, target):
+    # 删除语句执行前计算，此时仍可加载已过期的属性
+    _accumulate(_session_deltas(target), type(target), _previous_getter(target), -1)
+
+
+def _keep_old_value(target, value, oldvalue, initiator):
+    return value
+
+
+for _model in COUNTED_MODELS:
+    event.listen(_model, 'after_insert', _after_insert)
+    event.listen(_model, 'before_update', _before_update)
+    event.listen(_model, 'before_delete', _before_delete)
+    for _name in _tracked_attributes(_model):
+        # 修改已过期的属性时先加载旧值，否则无法得知需要减去的计数
+        event.listen(getattr(_model, _name), 'set', _keep_old_value, active_history=True, retval=True)
+
+
+@event.listens_for(Session, 'after_flush')
+def _apply_flush_deltas(session, flush_context):
+    """flush 中累计的变化量随同一事务写入计数表"""
+    deltas = session.info.pop(_DELTAS_KEY, None)
+    if deltas:
+        apply_deltas(session.connection(), deltas)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_deltas(session, previous_transaction):
+    session.info.pop(_DELTAS_KEY, None)
+
+
+def apply_deltas(connection, deltas: Dict[tuple, int]):
+    """按 {(表名, 主键列取值...): 增量} 增减计数和汇总，不存在的行自动创建"""
+    now = datetime.utcnow()
+    by_table = {}
+    for (table_name, *key), amount in sorted(deltas.items(), key=lambda item: tuple(map(str, item[0]))):
+        if amount:
+            table = _DELTA_TABLES[table_name]
+            row = dict(zip((column.name for column in table.primary_key.columns), key))
+            row.update(count=amount, updated_at=now)
+            by_table.setdefault(table_name, []).append(row)
+    
+    for table_name, rows in by_table.items():
+        _upsert(connection, _DELTA_TABLES[table_name], rows, now)
+
+
+def _upsert(connection, table, rows: List[Dict[str, Any]], now: datetime):
+    """多行插入，主键已存在时累加 count"""
+    if connection.dialect.name == 'mysql':
+        stmt = mysql.insert(table).values(rows)
+        connection.execute(stmt.on_duplicate_key_update(
+            count=table.c.count + stmt.inserted['count'],
+            updated_at=stmt.inserted.updated_at
+        ))
+    elif connection.dialect.name == 'sqlite':
+        stmt = sqlite.insert(table).values(rows)
+        connection.execute(stmt.on_conflict_do_update(
+            index_elements=list(table.primary_key.columns),
+            set_={'count': table.c.count + stmt.excluded['count'], 'updated_at': stmt.excluded.updated_at}
+        ))
+    else:
+        for row in rows:
+            updated = connection.execute(table.update().where(
+                *(column == row[column.name] for column in table.primary_key.columns)
+            ).values(count=table.c.count + row['count'], updated_at=now))
+            if not updated.rowcount:
+                connection.execute(table.insert().values(row))
+
+
+def count_rows(connection, model, rows: Iterable[Dict[str, Any]]):
+    """Core 批量插入（不触发 ORM 事件）的行同步计数，随 connection 的事务提交"""
+    deltas = Counter()
+    for row in rows:
+        _accumulate(deltas, model, _row_getter(model, row), 1)
+    apply_deltas(connection, deltas)
+
+
+def apply_rows(model, rows: Iterable[Dict[str, Any]]):
+    """Core 批量插入后同步计数，随当前会话的事务提交"""
+    count_rows(db.session.connection(), model, rows)
+
+
+def get_counters(model) -> Dict[str, Dict[str, int]]:
+    """
+    读取统计对象的全部计数（只读）
+    
+    计数的初始值由 0004 迁移或 reconcile-stats 按实际数据生成，之后由定期对账校正
+    
+    Returns:
+        {维度: {取值: 计数}}，如 {'total': {'': 120}, 'status': {'passed': 80, ...}}
+    """
+    rows = db.session.query(StatCounter.dimension, StatCounter.value, StatCounter.count).filter(
+        StatCounter.scope == model.__tablename__
+    ).all()
+    
+    counters = {}
+    for dimension, value, count in rows:
+        counters.setdefault(dimension, {})[value] = int(count)
+    return counters
+
+
+def _recount(conn, model) -> Counter:
+    """用一次分组查询重算统计对象的计数（按日计数另用一次查询，只统计最近几天）"""
+    keys_fn, attrs = COUNTED_MODELS[model]
+    scope = model.__tablename__
+    names = [name for name in attrs if name != 'created_at']
+    columns = [getattr(model, name) for name in names]
+    
+    counts = Counter()
+    counts[(StatCounter.__tablename__, scope, 'total', '')] += 0
+    for row in conn.execute(select(*columns, func.count()).group_by(*columns)):
+        _accumulate(counts, model, dict(zip(names, row[:-1])).get, 1, row[-1])
+    
+    if 'created_at' in attrs:
+        since = datetime.combine(datetime.utcnow().date() - timedelta(days=DAY_COUNTER_DAYS - 1), time.min)
+        day = func.date(model.created_at)
+        for value, count in conn.execute(
+            select(day, func.count()).where(model.created_at >= since).group_by(day)
+        ):
+            counts[(StatCounter.__tablename__, scope, 'day', str(value))] += count
+    
+    counts[(StatCounter.__tablename__, scope, RECONCILED_DIMENSION, '')] = 1
+    return counts
+
+
+def reconcile(models: List[Any] = None) -> Dict[str, int]:
+    """
+    按实际数据重算计数
+    
+    对账期间锁住该统计对象的计数行，并发写入的增量等待对账提交后再累加，
+    对账读取的快照不含这些未提交的数据，因此不会重复或遗漏计数
+    
+    Returns:
+        {统计对象: 重算后的总数}
+    """
+    totals = {}
+    for model in models or COUNTED_MODELS:
+        with db.engine.begin() as conn:
+            totals[model.__tablename__] = reconcile_scope(conn, model)
+    return totals
+
+
+def reconcile_scope(conn, model) -> int:
+    """重算一个统计对象的计数（在调用方的事务内执行），返回重算后的总数"""
+    table = StatCounter.__table__
+    scope = model.__tablename__
+    conn.execute(select(table.c.dimension).where(table.c.scope == scope).with_for_update()).all()
+    counts = _recount(conn, model)
+    conn.execute(table.delete().where(table.c.scope == scope))
+    now = datetime.utcnow()
+    conn.execute(table.insert(), [
+        {'scope': scope, 'dimension': dimension, 'value': value, 'count': count, 'updated_at': now}
+        for (_, _, dimension, value), count in counts.items()
+    ])
+    return counts[(StatCounter.__tablename__, scope, 'total', '')]
+
+
+class CounterReconciler:
+    """后台定期对账"""
+    
+    def __init__(self):
+        self.app = None
+        self.interval = 0
+        self._thread = None
+        self._lock = threading.Lock()
+    
+    def init_app(self, app):
+        self.app = app
+        self.interval = app.config.get('STAT_COUNTER_RECONCILE_INTERVAL', 3600)
+        if self.interval <= 0:
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='stat-counter-reconciler', daemon=True)
+                self._thread.start()
+    
+    def _run(self):
+        stop = threading.Event()
+        while not stop.wait(self.interval):
+            with self.app.app_context():
+                try:
+                    reconcile()
+                    # 时间序列汇总只重算最近两天，更早的由增量维护
+                    rebuild_all_rollups(since=datetime.utcnow() - timedelta(days=1))
+                except Exception as e:
+                    self.app.logger.error(f'统计计数对账失败: {str(e)}')
+                finally:
+                    db.session.remove()
+
+
+# 全局对账器
+counter_reconciler = CounterReconciler()
@@ -0,0 +1,248 @@
+"""
+测试用例近似重复检测
+
+对同一需求反复生成会产生大量几乎相同的用例，入库前按 MinHash + LSH 过滤：
+- 签名：标题 + 步骤 + 预期结果分词（中文 bigram）后的 MinHash，保存在 testcase_signatures
+- 索引：按需求加载已有签名建立 LSH 分桶，只与同桶候选比较，不需要两两比较
+- 历史用例和批量插入的用例没有签名时，在首次检测时补算
+"""
+import random
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+from flask import current_app
+
+from app import db
+from app.models import TestCase, TestCaseSignature
+from app.services.knowledge_index import tokenize
+
+# 签名长度 = 分桶数 × 每桶行数；16×4 时相似度 0.8 的用例几乎必定落入同一桶
+NUM_PERM = 64
+LSH_BANDS = 16
+LSH_ROWS = NUM_PERM // LSH_BANDS
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+# 固定种子，保证已保存的签名与新计算的签名可比较
+_rng = random.Random(20240601)
+_PERMUTATIONS = [(_rng.randrange(1, _MERSENNE_PRIME), _rng.randrange(0, _MERSENNE_PRIME)) for _ in range(NUM_PERM)]
+
+# 重复处理方式：skip 跳过不入库，flag 入库但在结果中标记，off 不检测
+DEDUP_MODES = ('skip', 'flag', 'off')
+
+
+def testcase_text(testcase) -> str:
+    return '\n'.join(str(value or '') for value in (testcase.title, testcase.steps, testcase.expected_result))
+
+
+def minhash(text: str) -> List[int]:
+    """计算文本的 MinHash 签名"""
+    hashes = [zlib.crc32(term.encode('utf-8')) for term in set(tokenize(text))]
+    if not hashes:
+        return [_MAX_HASH] * NUM_PERM
+    return [min(((a * h + b) % _MERSENNE_PRIME) & _MAX_HASH for h in hashes) for a, b in _PERMUTATIONS]
+
+
+def similarity(a: List[int], b: List[int]) -> float:
+    """按签名估算 Jaccard 相似度"""
+    return sum(1 for x, y in zip(a, b) if x == y) / NUM_PERM
+
+
+def dedup_threshold() -> float:
+    return current_app.config.get('TESTCASE_DEDUP_THRESHOLD', 0.8)
+
+
+class LSHIndex:
+    """MinHash LSH 索引：签名按分桶哈希，只有至少一个分桶完全相同的条目才作为候选"""
+    
+    def __init__(self, threshold: float):
+        self.threshold = threshold
+        self.entries: List[Tuple[object, List[int]]] = []
+        self._buckets: Dict[Tuple[int, tuple], List[int]] = {}
+    
+    def add(self, item, signature: List[int]) -> int:
+        position = len(self.entries)
+        self.entries.append((item, signature))
+        for band in self._bands(signature):
+            self._buckets.setdefault(band, []).append(position)
+        return position
+    
+    def candidates(self, signature: List[int]) -> set:
+        found = set()
+        for band in self._bands(signature):
+            found.update(self._buckets.get(band, ()))
+        return found
+    
+    def query(self, signature: List[int]) -> Optional[Tuple[object, float]]:
+        """返回相似度不低于阈值的最相似条目 (条目, 相似度)"""
+        best = None
+        for position in self.candidates(signature):
+            item, other = self.entries[position]
+            score = similarity(signature, other)
+            if score >= self.threshold and (best is None or score > best[1]):
+                best = (item, score)
+        return best
+    
+    def clusters(self) -> List[Tuple[List[object], float]]:
+        """把相似度不低于阈值的条目合并为重复簇（并查集），返回 [(条目列表, 最高相似度)]"""
+        parent = list(range(len(self.entries)))
+        best: Dict[int, float] = {}
+        
+        def find(x):
+            while parent[x] != x:
+                parent[x] = parent[parent[x]]
+                x = parent[x]
+            return x
+        
+        for position, (_, signature) in enumerate(self.entries):
+            for other in self.candidates(signature):
+                if other <= position:
+                    continue
+                score = similarity(signature, self.entries[other][1])
+                if score < self.threshold:
+                    continue
+                a, b = find(position), find(other)
+                if a != b:
+                    parent[b] = a
+                    best[a] = max(best.get(a, 0), best.pop(b, 0), score)
+                else:
+                    best[a] = max(best.get(a, 0), score)
+        
+        groups: Dict[int, List[object]] = {}
+        for position in range(len(self.entries)):
+            groups.setdefault(find(position), []).append(self.entries[position][0])
+        return [(items, round(best[root], 2)) for root, items in groups.items() if len(items) > 1]
+    
+    @staticmethod
+    def _bands(signature: List[int]):
+        for band in range(LSH_BANDS):
+            yield band, tuple(signature[band * LSH_ROWS:(band + 1) * LSH_ROWS])
+
+
+def load_signatures(requirement_id: int) -> List[Tuple[object, List[int]]]:
+    """
+    读取需求下所有用例的签名，缺失的补算并写入（随调用方的事务提交）
+    
+    Returns:
+        [(用例行（含 id、title、created_at）, 签名)]
+    """
+    rows = db.session.query(
+        TestCase.id, TestCase.title, TestCase.created_at, TestCaseSignature.signature
+    ).outerjoin(
+        TestCaseSignature, TestCaseSignature.testcase_id == TestCase.id
+    ).filter(
+        TestCase.requirement_id == requirement_id
+    ).order_by(TestCase.id).all()
+    
+    missing = [row.id for row in rows if row.signature is None]
+    computed = {}
+    if missing:
+        for testcase in TestCase.query.filter(TestCase.id.in_(missing)):
+            computed[testcase.id] = minhash(testcase_text(testcase))
+            db.session.add(TestCaseSignature(testcase_id=testcase.id, signature=computed[testcase.id]))
+    
+    return [(row, row.signature if row.signature is not None else computed[row.id]) for row in rows]
+
+
+def refresh_signature(testcase: TestCase):
+    """用例标题、步骤或预期结果修改后重算签名"""
+    signature = minhash(testcase_text(testcase))
+    if testcase.signature is None:
+        testcase.signature = TestCaseSignature(signature=signature)
+    else:
+        testcase.signature.signature = signature
+
+
+class DuplicateFilter:
+    """
+    入库前的近似重复过滤
+    
+    用法：
+        dedup = DuplicateFilter(data.get('dedup', 'skip'))
+        for testcase in testcases:
+            if dedup.check(testcase):
+                db.session.add(testcase)
+        db.session.commit()
+        dedup.report()  # 重复用例列表
+    
+    同一批次内的用例之间也会互相比较
+    """
+    
+    def __init__(self, mode: str = 'skip', threshold: float = None):
+        self.mode = mode if mode in DEDUP_MODES else 'skip'
+        self.threshold = threshold or dedup_threshold()
+        self._indexes: Dict[Optional[int], LSHIndex] = {}
+        self._duplicates: List[Tuple[TestCase, object, float]] = []
+    
+    @property
+    def skipped(self) -> int:
+        return len(self._duplicates) if self.mode == 'skip' else 0
+    
+    def check(self, testcase: TestCase) -> bool:
+        """
+        检测用例是否与已有用例或本批次用例近似重复
+        
+        Returns:
+            是否应当入库；入库的用例会附带签名
+        """
+        if self.mode == 'off':
+            return True
+        
+        signature = minhash(testcase_text(testcase))
+        index = self._index(testcase.requirement_id)
+        match = index.query(signature)
+        if match:
+            self._duplicates.append((testcase, match[0], match[1]))
+            if self.mode == 'skip':
+                return False
+        
+        testcase.signature = TestCaseSignature(signature=signature)
+        index.add(testcase, signature)
+        return True
+    
+    def filter(self, testcases: List[TestCase]) -> List[TestCase]:
+        return [testcase for testcase in testcases if self.check(testcase)]
+    
+    def report(self) -> List[dict]:
+        """重复用例列表（提交后调用，以便带上新入库用例的ID）"""
+        return [{
+            'title': testcase.title,
+            'skipped': self.mode == 'skip',
+            'id': testcase.id if self.mode == 'flag' else None,
+            'duplicate_of': {'id': match.id, 'title': match.title},
+            'similarity': round(score, 2)
+        } for testcase, match, score in self._duplicates]
+    
+    def _index(self, requirement_id: Optional[int]) -> LSHIndex:
+        index = self._indexes.get(requirement_id)
+        if index is None:
+            index = LSHIndex(self.threshold)
+            # 直接输入的临时需求没有已入库的用例，只在本批次内比较
+            if requirement_id is not None:
+                for row, signature in load_signatures(requirement_id):
+                    index.add(row, signature)
+            self._indexes[requirement_id] = index
+        return index
+
+
+def find_duplicate_clusters(requirement_id: int, threshold: float = None) -> List[dict]:
+    """
+    统计需求下已有用例的重复簇
+    
+    Returns:
+        [{'similarity': 簇内最高相似度, 'testcases': [{'id', 'title', 'created_at'}]}]，按簇大小降序
+    """
+    index = LSHIndex(threshold or dedup_threshold())
+    for row, signature in load_signatures(requirement_id):
+        index.add(row, signature)
+    
+    clusters = [{
+        'similarity': score,
+        'testcases': [{
+            'id': row.id,
+            'title': row.title,
+            'created_at': row.created_at.isoformat() if row.created_at else None
+        } for row in rows]
+    } for rows, score in index.clusters()]
+    clusters.sort(key=lambda cluster: -len(cluster['testcases']))
+    return clusters
@@ -0,0 +1,162 @@
+"""
+仪表盘时间序列
+
+图表按时间桶统计新增数量，不再把成千上万行明细拉到浏览器里分桶：
+- stat_rollup_hourly / stat_rollup_daily 按 (统计对象, 时间桶, 状态) 保存数量，
+  由 stat_counters 的 ORM 事件在写入明细的同一事务内增量维护
+- 接口按 range 读取汇总行，合并为小时/天/季度/年的时间桶后返回，结果只有几 KB
+- 小时汇总只保留最近 ROLLUP_HOURLY_DAYS 天；定期对账重算最近两天的汇总，
+  0003 迁移和 reconcile-stats --full 按明细全量重建
+"""
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta
+from typing import Any, Dict
+
+from sqlalchemy import func, select
+
+from app import db
+from app.models import TestCase, OperationLog, StatRollupHourly, StatRollupDaily
+
+# 维护汇总的明细表
+ROLLUP_MODELS = (OperationLog, TestCase)
+# 小时汇总保留天数（只用于最近 24 小时的图表）
+ROLLUP_HOURLY_DAYS = 3
+# 时间范围：最近24小时（按小时）、最近7天、本月（按天）、今年（按季度）、历年（按年）
+RANGES = ('day', 'week', 'month', 'quarter', 'year')
+
+
+def _hour(value: datetime) -> datetime:
+    return value.replace(minute=0, second=0, microsecond=0)
+
+
+def rollup_keys(model, get):
+    """明细行对应的汇总键 ((表名, 统计对象, 时间桶, 状态), 增量)，供 stat_counters 增量维护"""
+    created_at = get('created_at')
+    if model not in ROLLUP_MODELS or not created_at:
+        return
+    scope = model.__tablename__
+    status = '' if get('status') is None else str(get('status'))[:50]
+    yield (StatRollupHourly.__tablename__, scope, _hour(created_at), status), 1
+    yield (StatRollupDaily.__tablename__, scope, created_at.date(), status), 1
+
+
+def _buckets(range_name: str, now: datetime, first_year: int):
+    """
+    返回 (汇总表, 起点, 终点, 时间桶标签列表, 汇总行时间桶 -> 标签的函数)
+    
+    标签：小时为 'YYYY-MM-DD HH:00'，天为 'YYYY-MM-DD'，季度为 'YYYY-Qn'，年为 'YYYY'
+    """
+    today = now.date()
+    if range_name == 'day':
+        start = _hour(now) - timedelta(hours=23)
+        labels = [(start + timedelta(hours=i)).strftime('%Y-%m-%d %H:00') for i in range(24)]
+        return StatRollupHourly, start, _hour(now), labels, lambda bucket: bucket.strftime('%Y-%m-%d %H:00')
+    
+    if range_name == 'week':
+        start, end = today - timedelta(days=6), today
+    elif range_name == 'month':
+        start = today.replace(day=1)
+        end = (start + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+    elif range_name == 'quarter':
+        labels = [f'{today.year}-Q{quarter}' for quarter in range(1, 5)]
+        return (StatRollupDaily, date(today.year, 1, 1), date(today.year, 12, 31), labels,
+                lambda bucket: f'{bucket.year}-Q{(bucket.month - 1) // 3 + 1}')
+    else:
+        labels = [str(year) for year in range(min(first_year, today.year), today.year + 1)]
+        return (StatRollupDaily, date(int(labels[0]), 1, 1), date(today.year, 12, 31), labels,
+                lambda bucket: str(bucket.year))
+    
+    labels = [(start + timedelta(days=i)).isoformat() for i in range((end - start).days + 1)]
+    return StatRollupDaily, start, end, labels, lambda bucket: bucket.isoformat()
+
+
+def get_timeseries(model, range_name: str, now: datetime = None) -> Dict[str, Any]:
+    """
+    按时间桶统计新增数量
+    
+    Args:
+        model: OperationLog 或 TestCase
+        range_name: RANGES 之一
+        now: 当前时间（UTC），默认 datetime.utcnow()
+    
+    Returns:
+        {'range', 'labels': [时间桶], 'total': [数量], 'by_status': {状态: [数量]}}
+    """
+    now = now or datetime.utcnow()
+    scope = model.__tablename__
+    first_year = now.year
+    if range_name == 'year':
+        first_day = db.session.query(func.min(StatRollupDaily.bucket)).filter(StatRollupDaily.scope == scope).scalar()
+        first_year = first_day.year if first_day else now.year
+    
+    table, start, end, labels, label_of = _buckets(range_name, now, first_year)
+    rows = db.session.query(table.bucket, table.status, table.count).filter(
+        table.scope == scope,
+        table.bucket >= start,
+        table.bucket <= end
+    ).all()
+    
+    positions = {label: i for i, label in enumerate(labels)}
+    total = [0] * len(labels)
+    by_status = defaultdict(lambda: [0] * len(labels))
+    for bucket, status, count in rows:
+        position = positions.get(label_of(bucket))
+        if position is None or not count:
+            continue
+        total[position] += int(count)
+        by_status[status][position] += int(count)
+    
+    return {'range': range_name, 'labels': labels, 'total': total, 'by_status': dict(by_status)}
+
+
+def _hour_expression(conn, column):
+    if conn.dialect.name == 'mysql':
+        return func.date_format(column, '%Y-%m-%d %H:00:00')
+    return func.strftime('%Y-%m-%d %H:00:00', column)
+
+
+def rebuild_rollups(conn, model, since: datetime = None):
+    """
+    按明细重算 since 当天起（None 为全部）的汇总，并清理过期的小时汇总（在调用方的事务内执行）
+    
+    先锁住要重算范围内的汇总行，并发写入的增量等待重算提交后再累加，不会重复或遗漏
+    """
+    scope = model.__tablename__
+    now = datetime.utcnow()
+    hourly_since = datetime.combine(now.date() - timedelta(days=ROLLUP_HOURLY_DAYS - 1), time.min)
+    day_since = datetime.combine(since.date(), time.min) if since else None
+    status = func.coalesce(model.status, '')
+    
+    hourly_start = max(day_since, hourly_since) if day_since else hourly_since
+    # (汇总表, 时间桶表达式, 明细起点, 汇总行起点, 时间桶取值解析)
+    for table, bucket_expression, start, bucket_start, parse in (
+        (StatRollupHourly.__table__, _hour_expression(conn, model.created_at), hourly_start, hourly_start,
+         lambda value: datetime.fromisoformat(str(value))),
+        (StatRollupDaily.__table__, func.date(model.created_at), day_since, day_since.date() if day_since else None,
+         lambda value: date.fromisoformat(str(value)[:10])),
+    ):
+        in_range = [table.c.scope == scope]
+        if bucket_start is not None:
+            in_range.append(table.c.bucket >= bucket_start)
+        conn.execute(select(table.c.bucket).where(*in_range).with_for_update()).all()
+        conn.execute(table.delete().where(*in_range))
+        
+        query = select(bucket_expression, status, func.count()).where(model.created_at.isnot(None))
+        if start is not None:
+            query = query.where(model.created_at >= start)
+        rows = [
+            {'scope': scope, 'bucket': parse(bucket), 'status': value[:50], 'count': count, 'updated_at': now}
+            for bucket, value, count in conn.execute(query.group_by(bucket_expression, status))
+        ]
+        if rows:
+            conn.execute(table.insert(), rows)
+    
+    hourly = StatRollupHourly.__table__
+    conn.execute(hourly.delete().where(hourly.c.scope == scope, hourly.c.bucket < hourly_since))
+
+
+def rebuild_all_rollups(since: datetime = None):
+    """重算全部明细表的汇总，每张表一个事务"""
+    for model in ROLLUP_MODELS:
+        with db.engine.begin() as conn:
+            rebuild_rollups(conn, model, since)
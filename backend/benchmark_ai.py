@@ -0,0 +1,374 @@
+"""
+AI 接口吞吐量压测
+
+配合 mock_llm_server.py 使用，在逐级提高的并发下压测：
+- generate: POST /api/ai/generate
+- preview: POST /api/ai/preview
+- review: POST /api/reviews/ai-review
+- chat: POST /api/ai-assistant/sessions/<id>/messages
+- chat_stream: POST /api/ai-assistant/sessions/<id>/messages/stream（额外统计首个增量耗时）
+
+输出每个场景、每级并发的吞吐量、p50/p95/p99 延迟、错误率和解析失败率。
+解析失败指接口成功返回但结果不是模型输出（模型返回内容无法解析时服务会降级为模板结果），
+通过模拟服务在用例标题和评审意见中加入的 [mock] 标记判断。
+
+用法:
+    python mock_llm_server.py --port 8001 &
+    python benchmark_ai.py --mock-url http://127.0.0.1:8001/v1 --levels 1,4,8,16 --requests 40
+    
+    --max-error-rate / --max-parse-failure-rate / --max-p95 超出阈值时以非 0 状态码退出，可用于发布前检查
+"""
+import os
+import sys
+import json
+import math
+import time
+import uuid
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from dotenv import load_dotenv
+
+# 设置控制台编码为UTF-8
+if sys.platform == 'win32':
+    sys.stdout.reconfigure(encoding='utf-8')
+
+# 加载环境变量
+load_dotenv()
+
+MOCK_MARKER = '[mock]'
+SCENARIOS = ['generate', 'preview', 'review', 'chat', 'chat_stream']
+
+
+def percentile(values, p):
+    """最近秩法百分位数"""
+    if not values:
+        return None
+    values = sorted(values)
+    return values[max(0, math.ceil(p / 100.0 * len(values)) - 1)]
+
+
+class BenchmarkClient:
+    """封装登录、准备数据和各场景请求"""
+    
+    def __init__(self, base_url, username, password, timeout):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.local = threading.local()
+        self.headers = {'Content-Type': 'application/json'}
+        self.llm_config_id = None
+        self.created_config = False
+        self.testcase_ids = []
+        self.created_testcase_ids = []
+        self.session_ids = []
+        self.lock = threading.Lock()
+        
+        resp = requests.post(f'{self.base_url}/auth/login', json={
+            'account': username,
+            'password': password
+        }, timeout=timeout)
+        resp.raise_for_status()
+        body = resp.json()
+        if body.get('code') != 0:
+            raise RuntimeError(f"登录失败: {body.get('message')}")
+        token = body['data']['accessToken']
+        self.headers['Authorization'] = f'Bearer {token}'
+    
+    @property
+    def http(self):
+        """每个工作线程一个 Session，复用连接"""
+        session = getattr(self.local, 'session', None)
+        if session is None:
+            session = self.local.session = requests.Session()
+            session.headers.update(self.headers)
+        return session
+    
+    def api(self, method, path, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        return self.http.request(method, f'{self.base_url}{path}', **kwargs)
+    
+    # ---------- 准备与清理 ----------
+    
+    def setup(self, mock_url, llm_config_id, review_cases):
+        """准备模拟服务配置与评审用的测试用例"""
+        if llm_config_id:
+            self.llm_config_id = llm_config_id
+        else:
+            resp = self.api('POST', '/llm-configs', json={
+                'name': f'benchmark-mock-{uuid.uuid4().hex[:6]}',
+                'provider': 'custom',
+                'api_base': mock_url,
+                'api_key': 'mock-key',
+                'model': 'mock-gpt',
+                'is_default': False,
+                'is_active': True,
+                # 压测时不重试、不限流，直接暴露上游表现；不参与其他配置的故障切换
+                'extra_params': json.dumps({
+                    'retry_max_attempts': 1,
+                    'failover': False,
+                    'max_connections': 200
+                })
+            })
+            resp.raise_for_status()
+            self.llm_config_id = resp.json()['data']['id']
+            self.created_config = True
+        
+        # 生成一批用例供评审场景使用
+        resp = self.api('POST', '/ai/generate', json=self.generate_payload(review_cases))
+        resp.raise_for_status()
+        self.testcase_ids = [tc['id'] for tc in resp.json()['data']]
+        self.created_testcase_ids.extend(self.testcase_ids)
+    
+    def cleanup(self):
+        """删除压测产生的测试用例、会话和临时配置"""
+        for testcase_id in self.created_testcase_ids:
+            self.api('DELETE', f'/testcases/{testcase_id}')
+        for session_id in self.session_ids:
+            self.api('DELETE', f'/ai-assistant/sessions/{session_id}')
+        if self.created_config:
+            self.api('DELETE', f'/llm-configs/{self.llm_config_id}')
+    
+    def generate_payload(self, count=5):
+        # 每次请求内容不同，避免命中 LLM 响应缓存
+        return {
+            'requirement_title': '压测需求',
+            'requirement_content': f'用户可以通过手机号和验证码登录系统（压测请求 {uuid.uuid4().hex}）',
+            'llm_config_id': self.llm_config_id,
+            'count': count,
+            'use_cache': False
+        }
+    
+    # ---------- 场景 ----------
+    
+    def run_generate(self):
+        resp = self.api('POST', '/ai/generate', json=self.generate_payload())
+        resp.raise_for_status()
+        testcases = resp.json()['data']
+        with self.lock:
+            self.created_testcase_ids.extend(tc['id'] for tc in testcases)
+        return {'parsed': any(MOCK_MARKER in (tc.get('title') or '') for tc in testcases)}
+    
+    def run_preview(self):
+        resp = self.api('POST', '/ai/preview', json=self.generate_payload())
+        resp.raise_for_status()
+        testcases = resp.json()['data']
+        return {'parsed': any(MOCK_MARKER in (tc.get('title') or '') for tc in testcases)}
+    
+    def run_review(self):
+        resp = self.api('POST', '/reviews/ai-review', json={
+            'testcase_ids': self.testcase_ids,
+            'llm_config_id': self.llm_config_id,
+            'use_cache': False
+        })
+        resp.raise_for_status()
+        body = resp.json()
+        if body.get('code') != 0:
+            raise RuntimeError(body.get('message'))
+        reviews = body['data']['reviews']
+        return {'parsed': any(MOCK_MARKER in (r.get('comments') or '') for r in reviews)}
+    
+    def new_session(self):
+        resp = self.api('POST', '/ai-assistant/sessions', json={
+            'session_name': '压测会话',
+            'model_id': self.llm_config_id
+        })
+        resp.raise_for_status()
+        session_id = resp.json()['data']['id']
+        with self.lock:
+            self.session_ids.append(session_id)
+        return session_id
+    
+    def chat_session(self):
+        """每个工作线程复用一个会话，避免把建会话的耗时计入聊天延迟"""
+        session_id = getattr(self.local, 'chat_session_id', None)
+        if session_id is None:
+            session_id = self.local.chat_session_id = self.new_session()
+        return session_id
+    
+    def run_chat(self):
+        session_id = self.chat_session()
+        resp = self.api('POST', f'/ai-assistant/sessions/{session_id}/messages', json={
+            'content': f'如何设计登录功能的测试用例？({uuid.uuid4().hex[:8]})'
+        })
+        resp.raise_for_status()
+        body = resp.json()
+        if body.get('code') != 0:
+            raise RuntimeError(body.get('message'))
+        content = body['data'].get('content') or ''
+        if content.startswith('AI助手调用出错'):
+            raise RuntimeError(content)
+        return {'parsed': MOCK_MARKER in content}
+    
+    def run_chat_stream(self):
+        session_id = self.chat_session()
+        started = time.perf_counter()
+        ttfb = None
+        parsed = False
+        with self.api('POST', f'/ai-assistant/sessions/{session_id}/messages/stream', json={
+            'content': f'如何设计登录功能的测试用例？({uuid.uuid4().hex[:8]})'
+        }, stream=True) as resp:
+            resp.raise_for_status()
+            for line in resp.iter_lines(decode_unicode=True):
+                if not line or not line.startswith('data:'):
+                    continue
+                event = json.loads(line[5:])
+                if event['type'] == 'delta' and ttfb is None:
+                    ttfb = time.perf_counter() - started
+                elif event['type'] == 'error':
+                    raise RuntimeError(event.get('message'))
+                elif event['type'] == 'done':
+                    parsed = MOCK_MARKER in (event['data'].get('content') or '')
+        return {'parsed': parsed, 'ttfb': ttfb}
+
+
+def run_level(client, scenario, concurrency, total):
+    """以指定并发执行 total 次请求，返回统计结果"""
+    fn = getattr(client, f'run_{scenario}')
+    latencies, ttfbs, errors = [], [], []
+    parse_failures = 0
+    lock = threading.Lock()
+    
+    def one(_):
+        nonlocal parse_failures
+        started = time.perf_counter()
+        try:
+            result = fn()
+        except Exception as e:
+            with lock:
+                errors.append(str(e)[:200])
+            return
+        elapsed = time.perf_counter() - started
+        with lock:
+            latencies.append(elapsed)
+            if result.get('ttfb') is not None:
+                ttfbs.append(result['ttfb'])
+            if not result.get('parsed'):
+                parse_failures += 1
+    
+    wall_started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(total)))
+    wall = time.perf_counter() - wall_started
+    
+    def ms(value):
+        return round(value * 1000, 1) if value is not None else None
+    
+    ok = len(latencies)
+    return {
+        'scenario': scenario,
+        'concurrency': concurrency,
+        'requests': total,
+        'ok': ok,
+        'errors': len(errors),
+        'error_rate': round(len(errors) / total, 4) if total else 0.0,
+        'parse_failures': parse_failures,
+        'parse_failure_rate': round(parse_failures / ok, 4) if ok else 0.0,
+        'throughput_rps': round(ok / wall, 2) if wall else 0.0,
+        'p50_ms': ms(percentile(latencies, 50)),
+        'p95_ms': ms(percentile(latencies, 95)),
+        'p99_ms': ms(percentile(latencies, 99)),
+        'ttfb_p50_ms': ms(percentile(ttfbs, 50)),
+        'ttfb_p95_ms': ms(percentile(ttfbs, 95)),
+        'sample_errors': errors[:3]
+    }
+
+
+def print_table(results):
+    columns = [
+        ('scenario', 12), ('concurrency', 11), ('requests', 8), ('errors', 6),
+        ('parse_failure_rate', 10), ('throughput_rps', 10),
+        ('p50_ms', 9), ('p95_ms', 9), ('p99_ms', 9), ('ttfb_p50_ms', 11)
+    ]
+    headers = {
+        'scenario': '场景', 'concurrency': '并发', 'requests': '请求数', 'errors': '错误',
+        'parse_failure_rate': '解析失败率', 'throughput_rps': '吞吐(rps)',
+        'p50_ms': 'p50(ms)', 'p95_ms': 'p95(ms)', 'p99_ms': 'p99(ms)', 'ttfb_p50_ms': '首字p50(ms)'
+    }
+    print('  '.join(headers[key].ljust(width) for key, width in columns))
+    print('-' * 110)
+    for row in results:
+        print('  '.join(str(row[key] if row[key] is not None else '-').ljust(width) for key, width in columns))
+
+
+def check_thresholds(results, args):
+    """检查阈值，返回超出阈值的描述列表"""
+    violations = []
+    for row in results:
+        name = f"{row['scenario']}@{row['concurrency']}"
+        if args.max_error_rate is not None and row['error_rate'] > args.max_error_rate:
+            violations.append(f"{name} 错误率 {row['error_rate']} > {args.max_error_rate}")
+        if args.max_parse_failure_rate is not None and row['parse_failure_rate'] > args.max_parse_failure_rate:
+            violations.append(f"{name} 解析失败率 {row['parse_failure_rate']} > {args.max_parse_failure_rate}")
+        if args.max_p95 is not None and row['p95_ms'] is not None and row['p95_ms'] > args.max_p95:
+            violations.append(f"{name} p95 {row['p95_ms']}ms > {args.max_p95}ms")
+    return violations
+
+
+def main():
+    parser = argparse.ArgumentParser(description='AI 接口吞吐量压测')
+    parser.add_argument('--base-url', default=os.getenv('BENCHMARK_BASE_URL', 'http://localhost:5000/api'))
+    parser.add_argument('--username', default=os.getenv('BENCHMARK_USERNAME', 'admin'))
+    parser.add_argument('--password', default=os.getenv('BENCHMARK_PASSWORD', 'admin123'))
+    parser.add_argument('--mock-url', default='http://127.0.0.1:8001/v1', help='模拟大模型服务地址')
+    parser.add_argument('--llm-config-id', type=int, help='使用已有的大模型配置，不指定时自动创建指向模拟服务的临时配置')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help=f'压测场景，逗号分隔: {",".join(SCENARIOS)}')
+    parser.add_argument('--levels', default='1,4,8,16', help='并发级别，逗号分隔')
+    parser.add_argument('--requests', type=int, default=20, help='每级并发的请求数（不少于并发数）')
+    parser.add_argument('--review-cases', type=int, default=5, help='评审场景每次评审的用例数')
+    parser.add_argument('--timeout', type=float, default=300, help='单次请求超时（秒）')
+    parser.add_argument('--output', help='将结果写入 JSON 文件')
+    parser.add_argument('--keep-data', action='store_true', help='保留压测产生的用例、会话和临时配置')
+    parser.add_argument('--max-error-rate', type=float, help='错误率阈值')
+    parser.add_argument('--max-parse-failure-rate', type=float, help='解析失败率阈值')
+    parser.add_argument('--max-p95', type=float, help='p95 延迟阈值（毫秒）')
+    args = parser.parse_args()
+    
+    scenarios = [s.strip() for s in args.scenarios.split(',') if s.strip()]
+    unknown = [s for s in scenarios if s not in SCENARIOS]
+    if unknown:
+        parser.error(f'未知场景: {", ".join(unknown)}')
+    levels = [int(level) for level in args.levels.split(',') if level.strip()]
+    
+    print("=" * 60)
+    print("AI 接口吞吐量压测")
+    print("=" * 60)
+    
+    client = BenchmarkClient(args.base_url, args.username, args.password, args.timeout)
+    client.setup(args.mock_url, args.llm_config_id, args.review_cases)
+    print(f"  大模型配置: {client.llm_config_id}，评审用例: {client.testcase_ids}")
+    
+    results = []
+    try:
+        for scenario in scenarios:
+            for concurrency in levels:
+                total = max(args.requests, concurrency)
+                row = run_level(client, scenario, concurrency, total)
+                results.append(row)
+                print(f"  ✓ {scenario} 并发 {concurrency}: {row['throughput_rps']} rps, "
+                      f"p95 {row['p95_ms']}ms, 错误 {row['errors']}, 解析失败 {row['parse_failures']}")
+                for error in row['sample_errors']:
+                    print(f"      ✗ {error}")
+    finally:
+        if not args.keep_data:
+            client.cleanup()
+    
+    print()
+    print_table(results)
+    
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"\n结果已写入 {args.output}")
+    
+    violations = check_thresholds(results, args)
+    if violations:
+        print("\n✗ 超出阈值:")
+        for violation in violations:
+            print(f"  - {violation}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
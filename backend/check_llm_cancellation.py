@@ -0,0 +1,242 @@
+"""
+LLM 调用取消检查
+
+异步调用在排队或调用中途被取消（如 AIReviewService.aiter_reviews 提前结束时取消未完成的分块）时：
+- 限流器不能遗留已占用的并发名额或排队计数
+- 等待名额超时与名额释放同时发生时，后面的等待者不能被卡住
+- 熔断器半开状态的探测请求被取消后要释放探测名额，后续调用仍可探测恢复
+
+用法:
+    python check_llm_cancellation.py
+    
+    任一检查未通过时以非 0 状态码退出
+"""
+import sys
+import time
+import asyncio
+from types import SimpleNamespace
+
+from app.services.llm_governor import LLMGovernor, InFlightLimiter
+from app.services.llm_resilience import (
+    circuit_breakers, call_with_resilience, acall_with_resilience, astream_with_resilience
+)
+
+# 设置控制台编码为UTF-8
+if sys.platform == 'win32':
+    sys.stdout.reconfigure(encoding='utf-8')
+
+MESSAGES = [SimpleNamespace(content='你好')]
+
+
+def make_client(config_id: int = 1, **extra_params):
+    return SimpleNamespace(provider=None, config_id=config_id, api_base=None, extra_params=extra_params)
+
+
+async def _hold(governor, client, entered: asyncio.Event, release: asyncio.Event):
+    async with governor.alimit(client, MESSAGES, 10):
+        entered.set()
+        await release.wait()
+
+
+def _scope_stats(governor):
+    return governor.stats()[0]
+
+
+async def check_cancelled_waiter():
+    """排队等待并发名额时被取消，名额和排队数都应归还"""
+    governor = LLMGovernor(max_queue_wait=5)
+    client = make_client(max_in_flight=1)
+    entered, release = asyncio.Event(), asyncio.Event()
+    holder = asyncio.create_task(_hold(governor, client, entered, release))
+    await entered.wait()
+    
+    waiter = asyncio.create_task(_hold(governor, client, asyncio.Event(), asyncio.Event()))
+    await asyncio.sleep(0.05)
+    waiter.cancel()
+    await asyncio.gather(waiter, return_exceptions=True)
+    release.set()
+    await holder
+    
+    stats = _scope_stats(governor)
+    assert stats['in_flight'] == 0, f"in_flight={stats['in_flight']}"
+    assert stats['queue_depth'] == 0, f"queue_depth={stats['queue_depth']}"
+    
+    # 名额已归还，新的调用无需等待
+    await asyncio.wait_for(_hold(governor, client, asyncio.Event(), _set(asyncio.Event())), 1)
+
+
+async def check_cancelled_after_wakeup():
+    """名额释放与等待者被取消同时发生时，唤醒转交给下一个等待者"""
+    governor = LLMGovernor(max_queue_wait=5)
+    client = make_client(max_in_flight=1)
+    entered, release = asyncio.Event(), asyncio.Event()
+    holder = asyncio.create_task(_hold(governor, client, entered, release))
+    await entered.wait()
+    
+    first = asyncio.create_task(_hold(governor, client, asyncio.Event(), asyncio.Event()))
+    await asyncio.sleep(0.01)
+    second_entered = asyncio.Event()
+    second = asyncio.create_task(_hold(governor, client, second_entered, _set(asyncio.Event())))
+    await asyncio.sleep(0.01)
+    
+    # 释放名额（唤醒 first）后、first 醒来前将其取消
+    release.set()
+    await holder
+    first.cancel()
+    await asyncio.gather(first, return_exceptions=True)
+    await asyncio.wait_for(second, 1)
+    
+    stats = _scope_stats(governor)
+    assert stats['in_flight'] == 0, f"in_flight={stats['in_flight']}"
+    assert stats['queue_depth'] == 0, f"queue_depth={stats['queue_depth']}"
+
+
+async def check_timeout_with_release():
+    """等待者超时的同时名额被释放并被其他调用方占用，后面的等待者仍能在名额再次释放后拿到名额"""
+    limiter = InFlightLimiter(1)
+    limiter.in_flight = 1
+    first = asyncio.create_task(limiter.aacquire(0.05))
+    second = asyncio.create_task(limiter.aacquire(5))
+    await asyncio.sleep(0.01)
+    
+    # 阻塞事件循环越过 first 的超时时间，再释放名额（唤醒 first），随即由同步调用方抢占
+    time.sleep(0.06)
+    limiter.release()
+    assert limiter.acquire(0), '同步调用方未拿到名额'
+    assert await first is False, 'first 应超时'
+    
+    limiter.release()
+    assert await asyncio.wait_for(second, 1), 'second 未拿到名额'
+    limiter.release()
+    assert limiter.in_flight == 0, f'in_flight={limiter.in_flight}'
+    assert not limiter._async_waiters, f'仍有 {len(limiter._async_waiters)} 个等待者'
+
+
+async def check_reserve_error():
+    """预占令牌时出现异常，排队数和并发名额都应回滚"""
+    governor = LLMGovernor(max_queue_wait=5)
+    client = make_client(max_in_flight=1, rpm=60)
+    
+    def broken_reserve(*args, **kwargs):
+        raise ValueError('reserve failed')
+    governor._reserve = broken_reserve
+    
+    try:
+        async with governor.alimit(client, MESSAGES, 10):
+            pass
+    except ValueError:
+        pass
+    else:
+        raise AssertionError('预占异常未抛出')
+    
+    stats = _scope_stats(governor)
+    assert stats['in_flight'] == 0, f"in_flight={stats['in_flight']}"
+    assert stats['queue_depth'] == 0, f"queue_depth={stats['queue_depth']}"
+
+
+def _half_open_client(config_id: int):
+    """熔断后冷却结束、下一次调用即为探测请求的客户端"""
+    client = make_client(config_id, breaker_failure_threshold=1, breaker_recovery_timeout=0.01, retry_max_attempts=1)
+    circuit_breakers.for_client(client).record_failure()
+    return client
+
+
+async def _recovers(client):
+    """后续调用可以作为探测请求放行，成功后熔断器恢复关闭"""
+    await asyncio.sleep(0.02)
+    
+    async def ok():
+        return 'ok'
+    assert await acall_with_resilience(client, ok) == 'ok', '探测调用失败'
+    state = circuit_breakers.for_client(client).state
+    assert state == 'closed', f'state={state}'
+
+
+async def check_cancelled_probe():
+    """半开状态的探测调用被取消"""
+    client = _half_open_client(101)
+    await asyncio.sleep(0.02)
+    probe = asyncio.create_task(acall_with_resilience(client, lambda: asyncio.sleep(10)))
+    await asyncio.sleep(0.01)
+    probe.cancel()
+    await asyncio.gather(probe, return_exceptions=True)
+    await _recovers(client)
+
+
+async def check_cancelled_stream_probe():
+    """半开状态的流式探测调用在读取中途被取消"""
+    client = _half_open_client(102)
+    await asyncio.sleep(0.02)
+    
+    async def slow_stream():
+        yield '第一段'
+        await asyncio.sleep(10)
+        yield '第二段'
+    
+    async def consume():
+        async for _ in astream_with_resilience(client, slow_stream):
+            pass
+    
+    probe = asyncio.create_task(consume())
+    await asyncio.sleep(0.01)
+    probe.cancel()
+    await asyncio.gather(probe, return_exceptions=True)
+    await _recovers(client)
+
+
+async def check_interrupted_sync_probe():
+    """同步探测调用被非 Exception 的异常（如 KeyboardInterrupt）中断"""
+    client = _half_open_client(103)
+    await asyncio.sleep(0.02)
+    
+    def interrupted():
+        raise KeyboardInterrupt
+    try:
+        call_with_resilience(client, interrupted)
+    except KeyboardInterrupt:
+        pass
+    await _recovers(client)
+
+
+def _set(event: asyncio.Event) -> asyncio.Event:
+    event.set()
+    return event
+
+
+CHECKS = [
+    ('排队时取消', check_cancelled_waiter),
+    ('唤醒后取消', check_cancelled_after_wakeup),
+    ('超时与释放同时发生', check_timeout_with_release),
+    ('预占异常回滚', check_reserve_error),
+    ('熔断探测被取消', check_cancelled_probe),
+    ('熔断流式探测被取消', check_cancelled_stream_probe),
+    ('熔断同步探测被中断', check_interrupted_sync_probe),
+]
+
+
+def main():
+    failures = []
+    print("=" * 60)
+    print("LLM 调用取消检查")
+    print("=" * 60)
+    
+    for name, check in CHECKS:
+        try:
+            asyncio.run(check())
+        except Exception as e:
+            failures.append(f'{name}: {type(e).__name__} {e}')
+            print(f"  ✗ {name}: {type(e).__name__} {e}")
+        else:
+            print(f"  ✓ {name}")
+    
+    print("=" * 60)
+    if failures:
+        print(f"检查未通过（{len(failures)} 项）:")
+        for failure in failures:
+            print(f"  - {failure}")
+        sys.exit(1)
+    print("检查通过")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,195 @@
+"""
+列表接口 SQL 查询数检查
+
+在临时数据库（默认 SQLite 内存库）中准备数据，统计每个列表接口单次请求执行的 SQL 语句数：
+- 分别用小分页和大分页请求，查询数不能随返回行数增长（防止 N+1 查询回归）
+- 查询数不能超过为每个接口设定的上限
+
+用法:
+    python check_query_counts.py
+    python check_query_counts.py --rows 200 --verbose
+    
+    QUERY_COUNT_DATABASE_URL 可指定其他空数据库，脚本会在其中建表并写入数据
+    任一接口超出上限或随行数增长时以非 0 状态码退出，可用于发布前检查
+"""
+import os
+import sys
+import argparse
+from datetime import datetime, timedelta
+
+from sqlalchemy import event
+from flask_jwt_extended import create_access_token
+
+import config as app_config
+
+# 设置控制台编码为UTF-8
+if sys.platform == 'win32':
+    sys.stdout.reconfigure(encoding='utf-8')
+
+
+class QueryCountConfig(app_config.TestingConfig):
+    """查询数检查使用的临时数据库"""
+    SQLALCHEMY_DATABASE_URI = os.getenv('QUERY_COUNT_DATABASE_URL', 'sqlite:///:memory:')
+    # 操作日志由后台线程批量写入，检查期间不触发写入，只统计接口本身的查询
+    OPERATION_LOG_FLUSH_INTERVAL = 3600
+
+
+app_config.config['query_count'] = QueryCountConfig
+
+from app import create_app, db
+from app.models import (
+    User, Role, Permission, Menu, Requirement, TestCase, TestcaseReview, ReviewComment
+)
+
+# (名称, 路径模板, 分页参数名, 查询数上限)
+# 上限只含接口本身的查询（操作日志、统计计数和时间序列汇总由后台线程批量写入）
+ENDPOINTS = [
+    ('需求列表', '/api/requirements', 'per_page', 4),
+    ('用例列表', '/api/testcases', 'per_page', 3),
+    ('用例导出', '/api/testcases/export', None, 2),
+    ('评审列表', '/api/reviews/list', 'per_page', 3),
+    ('用例评审', '/api/reviews/testcase/{testcase_id}', None, 2),
+    ('评审评论', '/api/reviews/{review_id}/comments', None, 3),
+    ('角色列表', '/api/permission/roles', 'pageSize', 5),
+    ('全部角色', '/api/permission/roles/all', None, 4),
+    ('用户列表', '/api/users', 'pageSize', 6),
+]
+
+
+class QueryCounter:
+    """统计数据库连接上执行的 SQL 语句"""
+    
+    def __init__(self, engine):
+        self.statements = []
+        event.listen(engine, 'before_cursor_execute', self._record)
+    
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+    
+    def reset(self):
+        self.statements = []
+
+
+def seed(rows):
+    """准备数据：每类列表各 rows 行"""
+    permissions = [Permission(name=f'权限{i}', code=f'perm:{i}') for i in range(5)]
+    menus = [Menu(name=f'menu{i}', title=f'菜单{i}') for i in range(5)]
+    db.session.add_all(permissions + menus)
+    
+    roles = []
+    for i in range(rows):
+        role = Role(name=f'角色{i}', code='admin' if i == 0 else f'role{i}', sort=i)
+        role.permissions = permissions[:1 + i % 5]
+        role.menus = menus[:1 + i % 5]
+        roles.append(role)
+    db.session.add_all(roles)
+    
+    users = []
+    for i in range(rows):
+        user = User(username=f'user{i}', email=f'user{i}@example.com')
+        user.set_password('password')
+        user.roles = [roles[0], roles[1 + i % (rows - 1)]] if i == 0 else [roles[1 + i % (rows - 1)], roles[(2 + i) % rows]]
+        users.append(user)
+    db.session.add_all(users)
+    
+    now = datetime.utcnow()
+    requirements = [Requirement(title=f'需求{i}', content=f'需求内容{i}') for i in range(rows)]
+    db.session.add_all(requirements)
+    db.session.flush()
+    
+    testcases = [
+        TestCase(
+            requirement_id=requirements[i].id,
+            title=f'用例{i}',
+            steps='步骤',
+            expected_result='预期结果',
+            created_at=now - timedelta(minutes=i)
+        )
+        for i in range(rows)
+    ]
+    db.session.add_all(testcases)
+    db.session.flush()
+    
+    reviews = [
+        TestcaseReview(
+            testcase_id=testcases[0].id if i < rows // 2 else testcases[i].id,
+            reviewer_id=users[i].id,
+            created_at=now - timedelta(minutes=i)
+        )
+        for i in range(rows)
+    ]
+    db.session.add_all(reviews)
+    db.session.flush()
+    
+    db.session.add_all([
+        ReviewComment(review_id=reviews[0].id, user_id=users[i].id, content=f'评论{i}', created_at=now + timedelta(seconds=i))
+        for i in range(rows)
+    ])
+    db.session.commit()
+    return {'testcase_id': testcases[0].id, 'review_id': reviews[0].id, 'admin_id': users[0].id}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='列表接口 SQL 查询数检查')
+    parser.add_argument('--rows', type=int, default=50, help='每类列表准备的数据行数')
+    parser.add_argument('--small-page', type=int, default=5, help='小分页大小')
+    parser.add_argument('--verbose', action='store_true', help='输出每个接口执行的 SQL')
+    args = parser.parse_args()
+    if args.rows < 10:
+        parser.error('--rows 不能小于 10')
+    
+    app = create_app('query_count')
+    failures = []
+    
+    with app.app_context():
+        db.create_all()
+        ids = seed(args.rows)
+        headers = {'Authorization': f"Bearer {create_access_token(identity=str(ids['admin_id']))}"}
+        client = app.test_client()
+        # 预热：首个请求会触发后台任务恢复等一次性查询
+        client.get('/api/health')
+        counter = QueryCounter(db.engine)
+        
+        print("=" * 60)
+        print(f"列表接口 SQL 查询数检查（每类 {args.rows} 行）")
+        print("=" * 60)
+        
+        for name, path, page_param, limit in ENDPOINTS:
+            path = path.format(**ids)
+            counts = []
+            sizes = [args.small_page, args.rows] if page_param else [None]
+            for size in sizes:
+                # 每次请求前清空会话，避免已加载的对象掩盖查询
+                db.session.remove()
+                counter.reset()
+                response = client.get(path, query_string={page_param: size} if page_param else None, headers=headers)
+                if response.status_code != 200:
+                    failures.append(f'{name}: HTTP {response.status_code}')
+                counts.append(len(counter.statements))
+                if args.verbose:
+                    for statement in counter.statements:
+                        print(f"      {' '.join(statement.split())[:160]}")
+            
+            problems = []
+            if max(counts) > limit:
+                problems.append(f'超出上限 {limit}')
+            if len(set(counts)) > 1:
+                problems.append('随返回行数增长')
+            detail = ' / '.join(str(c) for c in counts)
+            if problems:
+                failures.append(f"{name}: {detail} 条查询，{'，'.join(problems)}")
+                print(f"  ✗ {name} {path}: {detail} 条查询（上限 {limit}）{'，'.join(problems)}")
+            else:
+                print(f"  ✓ {name} {path}: {detail} 条查询（上限 {limit}）")
+    
+    print("=" * 60)
+    if failures:
+        print(f"检查未通过（{len(failures)} 项）:")
+        for failure in failures:
+            print(f"  - {failure}")
+        sys.exit(1)
+    print("检查通过")
+
+
+if __name__ == '__main__':
+    main()
@@ -32,6 +32,43 @@ class Config:
     AI_API_KEY = os.getenv('AI_API_KEY', '')
     AI_API_BASE = os.getenv('AI_API_BASE', 'https://api.openai.com/v1')
     AI_MODEL = os.getenv('AI_MODEL', 'gpt-3.5-turbo')
+    
+    # AI 预览结果保留时长（秒），过期后需重新生成
+    AI_PREVIEW_TTL = int(os.getenv('AI_PREVIEW_TTL', 1800))
+    
+    # 后台任务配置
+    JOB_WORKERS = int(os.getenv('JOB_WORKERS', 4))  # 每个进程的任务工作线程数
+    JOB_STALE_SECONDS = int(os.getenv('JOB_STALE_SECONDS', 600))  # 运行中任务超过该时长没有心跳，视为所在进程已退出
+    JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', 3))  # 中断的任务最多执行次数，达到后标记为失败不再恢复
+    JOB_HEARTBEAT_INTERVAL = int(os.getenv('JOB_HEARTBEAT_INTERVAL', 30))  # 运行中任务刷新 updated_at 的间隔（秒），需远小于 JOB_STALE_SECONDS
+
+    # LLM 调用流水（llm_call_log）批量写入
+    LLM_CALL_LOG_BATCH_SIZE = int(os.getenv('LLM_CALL_LOG_BATCH_SIZE', 200))  # 每批最多写入行数
+    LLM_CALL_LOG_FLUSH_INTERVAL = float(os.getenv('LLM_CALL_LOG_FLUSH_INTERVAL', 2))  # 最长攒批时间（秒）
+    
+    # 操作日志（operation_logs）异步批量写入
+    OPERATION_LOG_BATCH_SIZE = int(os.getenv('OPERATION_LOG_BATCH_SIZE', 200))  # 每批最多写入行数
+    OPERATION_LOG_FLUSH_INTERVAL = float(os.getenv('OPERATION_LOG_FLUSH_INTERVAL', 1))  # 最长攒批时间（秒）
+    OPERATION_LOG_MAX_QUEUE = int(os.getenv('OPERATION_LOG_MAX_QUEUE', 10000))  # 内存队列上限
+    OPERATION_LOG_BLOCK_TIMEOUT = float(os.getenv('OPERATION_LOG_BLOCK_TIMEOUT', 0.1))  # 队列满时请求最多等待秒数，超时丢弃
+    
+    # AI助手对话历史：原文发送的最近消息数；摘要之后的消息再多出该批次数时压缩进滚动摘要
+    CHAT_HISTORY_WINDOW = int(os.getenv('CHAT_HISTORY_WINDOW', 10))
+    CHAT_SUMMARY_BATCH = int(os.getenv('CHAT_SUMMARY_BATCH', 10))
+    
+    # 知识库检索：分块大小（token）、每次注入的最多分块数与 token 上限
+    KNOWLEDGE_CHUNK_TOKENS = int(os.getenv('KNOWLEDGE_CHUNK_TOKENS', 400))
+    KNOWLEDGE_TOP_K = int(os.getenv('KNOWLEDGE_TOP_K', 6))
+    KNOWLEDGE_MAX_TOKENS = int(os.getenv('KNOWLEDGE_MAX_TOKENS', 3000))
+    
+    # 测试用例近似重复判定阈值（MinHash 估算的 Jaccard 相似度）
+    TESTCASE_DEDUP_THRESHOLD = float(os.getenv('TESTCASE_DEDUP_THRESHOLD', 0.8))
+    
+    # 数据库迁移等待元数据锁的超时时间（秒），超时则放弃本次 DDL，避免阻塞线上查询
+    MIGRATION_LOCK_WAIT_TIMEOUT = int(os.getenv('MIGRATION_LOCK_WAIT_TIMEOUT', 10))
+    
+    # 统计计数器按实际数据对账的间隔（秒），0 表示不定期对账
+    STAT_COUNTER_RECONCILE_INTERVAL = int(os.getenv('STAT_COUNTER_RECONCILE_INTERVAL', 3600))
 
 
 class DevelopmentConfig(Config):
@@ -0,0 +1,314 @@
+"""
+OpenAI 兼容的本地模拟大模型服务
+
+用于在不消耗服务商额度的情况下压测 AI 生成、AI 评审和 AI 助手：
+- POST /v1/chat/completions：支持普通与流式（SSE）响应
+- GET  /v1/models：模型列表
+- GET/PUT /mock/config：查看 / 在线修改模拟参数
+- GET  /mock/stats：请求数、错误数、并发数统计
+
+根据最后一条用户消息返回对应的固定内容：
+- 生成测试用例提示词 -> 测试用例 JSON 数组（数量与提示词中的“生成 N 条”一致）
+- 评审提示词 -> 评审结果 JSON 数组（testcase_id 取自提示词中的“- ID: xx”）
+- 其他 -> 普通聊天文本
+返回的用例标题和评审意见带有 [mock] 标记，压测脚本据此判断结果是否来自模型
+（解析失败时服务会降级为模板生成，不含该标记）。
+
+用法:
+    python mock_llm_server.py --port 8001 --latency 300 --token-rate 80 --error-rate 0.05
+    
+    在大模型配置中新增一条 provider=custom、api_base=http://127.0.0.1:8001/v1 的配置即可使用
+"""
+import os
+import re
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+
+from flask import Flask, Response, jsonify, request
+
+# 设置控制台编码为UTF-8
+if sys.platform == 'win32':
+    sys.stdout.reconfigure(encoding='utf-8')
+
+MOCK_MARKER = '[mock]'
+
+# 默认模拟参数，可通过命令行、环境变量或 PUT /mock/config 修改
+CONFIG = {
+    'model': os.getenv('MOCK_LLM_MODEL', 'mock-gpt'),
+    'latency_ms': float(os.getenv('MOCK_LLM_LATENCY_MS', 200)),          # 首字节前的固定延迟
+    'jitter_ms': float(os.getenv('MOCK_LLM_JITTER_MS', 50)),             # 首字节延迟的随机抖动
+    'token_rate': float(os.getenv('MOCK_LLM_TOKEN_RATE', 100)),          # 每秒生成 token 数，<=0 表示不限速
+    'error_rate': float(os.getenv('MOCK_LLM_ERROR_RATE', 0)),            # 返回错误状态码的比例
+    'error_status': int(os.getenv('MOCK_LLM_ERROR_STATUS', 500)),        # 错误状态码（429 时附带 Retry-After）
+    'malformed_rate': float(os.getenv('MOCK_LLM_MALFORMED_RATE', 0)),    # 用例/评审返回非法 JSON 的比例
+    'chunk_chars': int(os.getenv('MOCK_LLM_CHUNK_CHARS', 4)),            # 流式响应每个分片的字符数
+    'testcases': None,  # 自定义用例模板（JSON 数组），为空时使用内置模板
+    'reviews': None     # 自定义评审模板（JSON 对象），为空时使用内置模板
+}
+
+DEFAULT_TESTCASE = {
+    'title': '验证功能正常流程',
+    'precondition': '系统正常运行，用户已登录',
+    'steps': '1. 进入功能页面\n2. 输入合法数据\n3. 点击提交',
+    'expected_result': '提交成功，页面提示操作成功',
+    'case_type': 'functional',
+    'priority': 'high'
+}
+
+DEFAULT_REVIEW = {
+    'status': 'need_revision',
+    'overall_rating': 4,
+    'comments': '用例结构完整，步骤清晰',
+    'improvement_suggestions': '建议补充边界值与异常输入场景',
+    'clarity_score': 4,
+    'completeness_score': 4,
+    'feasibility_score': 5,
+    'coverage_score': 3
+}
+
+CHAT_REPLY = (
+    '这是模拟大模型的回复。测试用例设计时建议先梳理需求中的输入、输出与约束条件，'
+    '再分别覆盖正常流程、边界值和异常场景，并保证每条用例的预期结果可验证。'
+)
+
+stats = {
+    'requests': 0,
+    'stream_requests': 0,
+    'errors': 0,
+    'malformed': 0,
+    'in_flight': 0,
+    'max_in_flight': 0,
+    'completion_tokens': 0
+}
+stats_lock = threading.Lock()
+
+app = Flask(__name__)
+app.config['JSON_AS_ASCII'] = False
+
+
+def estimate_tokens(text):
+    """按 2 字符/token 粗略估算，与后端限流器保持一致"""
+    return max(1, len(text) // 2)
+
+
+def build_testcases(prompt):
+    """根据生成提示词构造测试用例 JSON"""
+    match = re.search(r'生成\s*(\d+)\s*条测试用例', prompt)
+    count = int(match.group(1)) if match else 5
+    templates = CONFIG['testcases'] or [DEFAULT_TESTCASE]
+    
+    testcases = []
+    for i in range(count):
+        testcase = dict(templates[i % len(templates)])
+        testcase['title'] = f"{MOCK_MARKER} {testcase.get('title', '测试用例')} #{i + 1}"
+        testcases.append(testcase)
+    return json.dumps(testcases, ensure_ascii=False, indent=2)
+
+
+def build_reviews(prompt):
+    """根据评审提示词构造评审结果 JSON"""
+    ids = re.findall(r'- ID:\s*(\d+)', prompt)
+    titles = re.findall(r'- 标题:\s*(.*)', prompt)
+    template = CONFIG['reviews'] or DEFAULT_REVIEW
+    
+    reviews = []
+    for i, testcase_id in enumerate(ids):
+        review = dict(template)
+        review['testcase_id'] = int(testcase_id)
+        review['testcase_title'] = titles[i].strip() if i < len(titles) else ''
+        review['comments'] = f"{MOCK_MARKER} {review.get('comments', '')}"
+        reviews.append(review)
+    return json.dumps(reviews, ensure_ascii=False, indent=2)
+
+
+def build_content(messages):
+    """根据最后一条用户消息选择返回内容，返回 (内容, 是否结构化)"""
+    prompt = next((m.get('content') or '' for m in reversed(messages) if m.get('role') == 'user'), '')
+    if '- ID:' in prompt and '评审' in prompt:
+        return build_reviews(prompt), True
+    if re.search(r'生成\s*\d+\s*条测试用例', prompt):
+        return build_testcases(prompt), True
+    return f'{MOCK_MARKER} {CHAT_REPLY}', False
+
+
+def first_byte_delay():
+    return max(0.0, CONFIG['latency_ms'] + random.uniform(-1, 1) * CONFIG['jitter_ms']) / 1000.0
+
+
+def generation_delay(tokens):
+    rate = CONFIG['token_rate']
+    return tokens / rate if rate > 0 else 0.0
+
+
+def error_response():
+    """按 error_rate 注入上游错误"""
+    status = CONFIG['error_status']
+    response = jsonify({'error': {'message': f'mock upstream error {status}', 'type': 'mock_error'}})
+    response.status_code = status
+    if status == 429:
+        response.headers['Retry-After'] = '1'
+    return response
+
+
+def track(key, delta=1):
+    with stats_lock:
+        stats[key] += delta
+        if key == 'in_flight':
+            stats['max_in_flight'] = max(stats['max_in_flight'], stats['in_flight'])
+
+
+@app.route('/v1/models', methods=['GET'])
+def list_models():
+    """模型列表"""
+    return jsonify({
+        'object': 'list',
+        'data': [{'id': CONFIG['model'], 'object': 'model', 'owned_by': 'mock'}]
+    })
+
+
+@app.route('/v1/chat/completions', methods=['POST'])
+@app.route('/chat/completions', methods=['POST'])
+def chat_completions():
+    """聊天补全（兼容 OpenAI 协议）"""
+    body = request.get_json(silent=True) or {}
+    messages = body.get('messages') or []
+    stream = bool(body.get('stream'))
+    model = body.get('model') or CONFIG['model']
+    
+    track('requests')
+    if stream:
+        track('stream_requests')
+    
+    if random.random() < CONFIG['error_rate']:
+        time.sleep(first_byte_delay())
+        track('errors')
+        return error_response()
+    
+    content, structured = build_content(messages)
+    if structured and random.random() < CONFIG['malformed_rate']:
+        track('malformed')
+        content = content[:len(content) // 2]
+    
+    prompt_tokens = estimate_tokens(''.join(m.get('content') or '' for m in messages))
+    completion_tokens = estimate_tokens(content)
+    track('completion_tokens', completion_tokens)
+    completion_id = f'chatcmpl-mock-{int(time.time() * 1000)}-{random.randint(1000, 9999)}'
+    
+    if not stream:
+        track('in_flight')
+        try:
+            time.sleep(first_byte_delay() + generation_delay(completion_tokens))
+        finally:
+            track('in_flight', -1)
+        return jsonify({
+            'id': completion_id,
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': model,
+            'choices': [{
+                'index': 0,
+                'message': {'role': 'assistant', 'content': content},
+                'finish_reason': 'stop'
+            }],
+            'usage': {
+                'prompt_tokens': prompt_tokens,
+                'completion_tokens': completion_tokens,
+                'total_tokens': prompt_tokens + completion_tokens
+            }
+        })
+    
+    def generate():
+        track('in_flight')
+        try:
+            time.sleep(first_byte_delay())
+            size = max(1, CONFIG['chunk_chars'])
+            for start in range(0, len(content), size):
+                piece = content[start:start + size]
+                chunk = {
+                    'id': completion_id,
+                    'object': 'chat.completion.chunk',
+                    'created': int(time.time()),
+                    'model': model,
+                    'choices': [{'index': 0, 'delta': {'content': piece}, 'finish_reason': None}]
+                }
+                yield f'data: {json.dumps(chunk, ensure_ascii=False)}\n\n'
+                time.sleep(generation_delay(estimate_tokens(piece)))
+            yield 'data: [DONE]\n\n'
+        finally:
+            track('in_flight', -1)
+    
+    return Response(generate(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
+
+
+@app.route('/mock/config', methods=['GET', 'PUT'])
+def mock_config():
+    """查看或修改模拟参数，PUT 只更新请求体中出现的字段"""
+    if request.method == 'PUT':
+        data = request.get_json(silent=True) or {}
+        for key, value in data.items():
+            if key not in CONFIG:
+                return jsonify({'code': 400, 'message': f'未知参数: {key}'}), 400
+            CONFIG[key] = value
+    return jsonify({'code': 0, 'message': 'success', 'data': CONFIG})
+
+
+@app.route('/mock/stats', methods=['GET', 'DELETE'])
+def mock_stats():
+    """请求统计，DELETE 清零"""
+    with stats_lock:
+        if request.method == 'DELETE':
+            for key in stats:
+                stats[key] = 0
+        return jsonify({'code': 0, 'message': 'success', 'data': dict(stats)})
+
+
+def load_json_file(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='OpenAI 兼容的本地模拟大模型服务')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=int(os.getenv('MOCK_LLM_PORT', 8001)))
+    parser.add_argument('--model', default=CONFIG['model'], help='模型名称')
+    parser.add_argument('--latency', type=float, default=CONFIG['latency_ms'], help='首字节延迟（毫秒）')
+    parser.add_argument('--jitter', type=float, default=CONFIG['jitter_ms'], help='首字节延迟抖动（毫秒）')
+    parser.add_argument('--token-rate', type=float, default=CONFIG['token_rate'], help='每秒生成 token 数，<=0 不限速')
+    parser.add_argument('--error-rate', type=float, default=CONFIG['error_rate'], help='错误响应比例 0-1')
+    parser.add_argument('--error-status', type=int, default=CONFIG['error_status'], help='错误响应状态码')
+    parser.add_argument('--malformed-rate', type=float, default=CONFIG['malformed_rate'], help='用例/评审返回非法 JSON 的比例 0-1')
+    parser.add_argument('--testcases-file', help='自定义测试用例模板（JSON 数组）')
+    parser.add_argument('--reviews-file', help='自定义评审结果模板（JSON 对象）')
+    args = parser.parse_args()
+    
+    CONFIG.update({
+        'model': args.model,
+        'latency_ms': args.latency,
+        'jitter_ms': args.jitter,
+        'token_rate': args.token_rate,
+        'error_rate': args.error_rate,
+        'error_status': args.error_status,
+        'malformed_rate': args.malformed_rate
+    })
+    if args.testcases_file:
+        CONFIG['testcases'] = load_json_file(args.testcases_file)
+    if args.reviews_file:
+        CONFIG['reviews'] = load_json_file(args.reviews_file)
+    
+    print("=" * 60)
+    print("模拟大模型服务")
+    print("=" * 60)
+    print(f"  API Base: http://{args.host}:{args.port}/v1")
+    for key in ('model', 'latency_ms', 'jitter_ms', 'token_rate', 'error_rate', 'error_status', 'malformed_rate'):
+        print(f"  {key}: {CONFIG[key]}")
+    
+    app.run(host=args.host, port=args.port, threaded=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -2,6 +2,7 @@
 Flask 应用入口
 """
 import os
+import click
 from app import create_app, db
 from app.models import Requirement, TestCase, User
 
@@ -26,6 +27,47 @@ def init_db():
     """初始化数据库"""
     db.create_all()
     print('数据库表创建成功！')
+    # 新建的表已带索引，这里只补齐已有表的变更并登记迁移版本
+    from app.migrations import run_migrations
+    run_migrations()
+
+
+@app.cli.command('migrate-db')
+@click.option('--status', is_flag=True, help='只查看迁移状态')
+@click.option('--dry-run', is_flag=True, help='只打印将执行的 DDL')
+def migrate_db(status, dry_run):
+    """执行数据库迁移（app/migrations）"""
+    from app.migrations import migration_status, run_migrations
+    if status:
+        for item in migration_status():
+            print(f"[{item['version']}] {item['name']}: {item['applied_at'] or '未执行'}")
+        return
+    
+    executed = run_migrations(dry_run=dry_run)
+    if not dry_run:
+        print(f'执行了 {len(executed)} 个迁移' if executed else '数据库已是最新版本')
+
+
+@app.cli.command('reconcile-stats')
+@click.option('--full', is_flag=True, help='全量重建时间序列汇总（默认只重算最近两天）')
+def reconcile_stats(full):
+    """按实际数据重算统计计数器和时间序列汇总"""
+    from datetime import datetime, timedelta
+    from app.services.stat_counters import reconcile
+    from app.services.timeseries import rebuild_all_rollups
+    for scope, total in reconcile().items():
+        print(f'{scope}: {total}')
+    rebuild_all_rollups(since=None if full else datetime.utcnow() - timedelta(days=1))
+    print('时间序列汇总已重算')
+
+
+@app.cli.command('resume-jobs')
+def resume_jobs():
+    """恢复未完成的后台任务，在当前进程中执行完毕后退出"""
+    from app.services.job_service import job_manager
+    count = job_manager.resume_pending()
+    print(f'已恢复 {count} 个后台任务，等待执行完毕...' if count else '没有需要恢复的后台任务')
+    job_manager.wait()
 
 
 @app.cli.command('drop-db')
@@ -37,4 +79,8 @@ def drop_db():
 
 
 if __name__ == '__main__':
+    # 启动时恢复未完成的后台任务（调试模式的自动重载下只在实际提供服务的子进程中恢复）
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        from app.services.job_service import job_manager
+        job_manager.start()
     app.run(host='0.0.0.0', port=5000, debug=True)
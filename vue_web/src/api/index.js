@@ -66,6 +66,46 @@ api.interceptors.response.use(
   }
 )
 
+/**
+ * 以 Server-Sent Events 方式发送 POST 请求，逐条回调事件数据
+ * axios 无法在浏览器中读取流式响应，这里使用 fetch
+ * @param {string} path 接口路径（相对 baseURL）
+ * @param {object} data 请求体
+ * @param {function} onEvent 每个事件的回调，参数为解析后的 JSON 对象
+ */
+export async function postStream(path, data, onEvent) {
+  const token = localStorage.getItem('accessToken')
+  const response = await fetch(`${api.defaults.baseURL}${path}`, {
+    method: 'POST',
+    headers: {
+      'Content-Type': 'application/json',
+      Accept: 'text/event-stream',
+      ...(token ? { Authorization: `Bearer ${token}` } : {})
+    },
+    body: JSON.stringify(data)
+  })
+  if (!response.ok || !response.body) {
+    throw new Error(`请求失败: ${response.status}`)
+  }
+
+  const reader = response.body.getReader()
+  const decoder = new TextDecoder('utf-8')
+  let buffer = ''
+  while (true) {
+    const { done, value } = await reader.read()
+    if (done) break
+    buffer += decoder.decode(value, { stream: true })
+    const frames = buffer.split('\n\n')
+    buffer = frames.pop()
+    for (const frame of frames) {
+      const line = frame.trim()
+      if (line.startsWith('data:')) {
+        onEvent(JSON.parse(line.slice(5).trim()))
+      }
+    }
+  }
+}
+
 // 认证相关 API
 export const authApi = {
   login: (data) => api.post('/auth/login', data),
@@ -101,6 +141,8 @@ export const testcaseApi = {
   update: (id, data) => api.put(`/testcases/${id}`, data),
   delete: (id) => api.delete(`/testcases/${id}`),
   getStats: () => api.get('/testcases/stats'),
+  getDuplicates: (params) => api.get('/testcases/duplicates', { params }),
+  getTimeseries: (params) => api.get('/testcases/timeseries', { params }),
   // 导出测试用例
   export: (params) => api.get('/testcases/export', { 
     params, 
@@ -125,7 +167,11 @@ export const testcaseApi = {
 // AI 相关 API
 export const aiApi = {
   generate: (data) => api.post('/ai/generate', data),
-  preview: (data) => api.post('/ai/preview', data)
+  preview: (data) => api.post('/ai/preview', data),
+  generateBatch: (data) => api.post('/ai/generate-batch', data),
+  // 流式生成，onEvent 依次收到 testcase / done / error 事件
+  generateStream: (data, onEvent) => postStream('/ai/generate-stream', data, onEvent),
+  commit: (data) => api.post('/ai/commit', data)
 }
 
 // 提示词相关 API
@@ -187,7 +233,9 @@ export const llmConfigApi = {
   setDefault: (id) => api.put(`/llm-configs/${id}/default`),
   getProviders: () => api.get('/llm-configs/providers'),
   fetchModels: (data) => api.post('/llm-configs/models', data),
-  testConfig: (data) => api.post('/llm-configs/test', data)
+  testConfig: (data) => api.post('/llm-configs/test', data),
+  getUsage: (id, params) => api.get(`/llm-configs/${id}/usage`, { params }),
+  getDailyUsage: (id, params) => api.get(`/llm-configs/${id}/usage/daily`, { params })
 }
 
 // 权限管理相关 API
@@ -235,6 +283,7 @@ export const logApi = {
   getList: (params) => api.get('/logs', { params }),
   getDetail: (id) => api.get(`/logs/${id}`),
   getStatistics: () => api.get('/logs/statistics'),
+  getTimeseries: (params) => api.get('/logs/timeseries', { params }),
   export: (params) => api.get('/logs/export', { params })
 }
 
@@ -259,8 +308,9 @@ export const aiAssistantApi = {
   deleteSession: (id) => api.delete(`/ai-assistant/sessions/${id}`),
   
   // 消息管理
-  getMessages: (sessionId) => api.get(`/ai-assistant/sessions/${sessionId}/messages`),
+  getMessages: (sessionId, params) => api.get(`/ai-assistant/sessions/${sessionId}/messages`, { params }),
   sendMessage: (sessionId, data) => api.post(`/ai-assistant/sessions/${sessionId}/messages`, data),
+  sendMessageStream: (sessionId, data, onEvent) => postStream(`/ai-assistant/sessions/${sessionId}/messages/stream`, data, onEvent),
   deleteMessage: (sessionId, messageId) => api.delete(`/ai-assistant/sessions/${sessionId}/messages/${messageId}`),
   
   // 配置选项
@@ -301,4 +351,11 @@ export const reviewApi = {
   getStats: () => api.get('/reviews/stats')
 }
 
+// 后台任务相关 API
+export const jobApi = {
+  getList: (params) => api.get('/jobs', { params }),
+  getDetail: (id) => api.get(`/jobs/${id}`),
+  getResult: (id) => api.get(`/jobs/${id}/result`)
+}
+
 export default api
@@ -115,13 +115,24 @@ export const useTestcaseStore = defineStore('testcase', () => {
   const previewTestcases = async (data) => {
     try {
       const res = await aiApi.preview(data)
-      return res.data
+      return { testcases: res.data, previewToken: res.preview_token }
     } catch (error) {
       console.error('AI预览测试用例失败:', error)
       throw error
     }
   }
 
+  // 保存预览的测试用例（不再重新调用 AI）
+  const commitPreview = async (previewToken, indices) => {
+    try {
+      const res = await aiApi.commit({ preview_token: previewToken, indices })
+      return res.data
+    } catch (error) {
+      console.error('保存预览测试用例失败:', error)
+      throw error
+    }
+  }
+
   return {
     testcases,
     total,
@@ -136,6 +147,7 @@ export const useTestcaseStore = defineStore('testcase', () => {
     deleteTestcase,
     fetchStats,
     generateTestcases,
-    previewTestcases
+    previewTestcases,
+    commitPreview
   }
 })